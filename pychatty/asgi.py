@@ -4,4 +4,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pychatty.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after setup, it needs the app registry
+from work.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # /ws/... websockets are served by work.realtime, everything else by Django
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,15 +51,46 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'work.middleware.RequestProfilingMiddleware',
+    'work.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'work.middleware.AdmissionControlMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request profiling, see work.middleware.RequestProfilingMiddleware
+# Off unless REQUEST_PROFILING is True; stats at api/stats/ or `manage.py request_stats`
+
+REQUEST_PROFILING = False
+REQUEST_PROFILING_DIR = BASE_DIR / 'profiles'
+REQUEST_PROFILING_SLOW_MS = None
+REQUEST_PROFILING_KEEP = 50
+
+# Admission control for api/*, see work.admission
+# Each client (user, or IP when anonymous) gets a bucket of ADMISSION_BURST
+# tokens refilled at ADMISSION_RATE per second; a request costs its route's
+# ADMISSION_ROUTE_COSTS entry (1 if unlisted). Over budget, or with more than
+# ADMISSION_MAX_INFLIGHT API requests running in the process, it gets 429.
+# Use work.admission.CacheBucketBackend to share buckets between workers.
+# Off by default: behind a reverse proxy every anonymous client has the
+# proxy's REMOTE_ADDR, so set ADMISSION_CLIENT_IP_HEADER to the header it
+# sets (e.g. 'HTTP_X_REAL_IP') before turning this on there. For
+# 'HTTP_X_FORWARDED_FOR' set ADMISSION_TRUSTED_PROXIES to the number of
+# proxies in front of the app; the client is that many entries from the right.
+ADMISSION_CONTROL = False
+ADMISSION_BACKEND = 'work.admission.LocalBucketBackend'
+ADMISSION_CLIENT_IP_HEADER = 'REMOTE_ADDR'
+ADMISSION_TRUSTED_PROXIES = 1
+ADMISSION_RATE = 20
+ADMISSION_BURST = 60
+ADMISSION_MAX_INFLIGHT = 64
+ADMISSION_ROUTE_COSTS = {}
+
 ROOT_URLCONF = 'pychatty.urls'
 
 TEMPLATES = [
@@ -72,6 +104,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'work.context_processors.user_role',
+                'work.context_processors.fragment_cache',
             ],
         },
     },
@@ -86,10 +120,139 @@ WSGI_APPLICATION = 'pychatty.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('PYCHATTY_DB_PATH', BASE_DIR / 'db.sqlite3'),
+    }
+}
+
+# PYCHATTY_DB_PROFILE=production: WAL so readers don't block on the writer,
+# relaxed fsync (safe under WAL), bigger page cache and mmap, a busy timeout
+# instead of instant "database is locked", persistent connections, and
+# BEGIN IMMEDIATE so write transactions take the lock up front rather than
+# failing on lock upgrade. Compare with `manage.py bench_sqlite`.
+SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA cache_size=-65536;'
+        'PRAGMA busy_timeout=5000;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 5,
+}
+
+DB_PROFILE = os.environ.get('PYCHATTY_DB_PROFILE', 'default')
+
+if DB_PROFILE == 'production':
+    DATABASES['default']['OPTIONS'] = SQLITE_PRODUCTION_OPTIONS
+    DATABASES['default']['CONN_MAX_AGE'] = 600
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    # explicit cached loader: templates are compiled once per process and never
+    # re-checked (APP_DIRS has to go, Django refuses it next to 'loaders')
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Read replicas: PYCHATTY_REPLICA_PATHS=/srv/replica1.sqlite3,/srv/replica2.sqlite3
+# become aliases replica1, replica2, ... used by work.routers.PrimaryReplicaRouter.
+# Locally `manage.py sync_replica` copies the primary into them.
+DATABASE_REPLICAS = []
+
+for i, path in enumerate(filter(None, os.environ.get('PYCHATTY_REPLICA_PATHS', '').split(',')), 1):
+    DATABASES[f'replica{i}'] = {
+        **DATABASES['default'],
+        'NAME': path,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{i}')
+
+# Contact shards: PYCHATTY_SHARD_PATHS=/srv/shard1.sqlite3,/srv/shard2.sqlite3
+# become aliases shard1, shard2, ... after 'default' in CONTACT_SHARDS, and each
+# user's contacts live on one of them (work.sharding). Keep the list append-only,
+# a shard's position fixes its contact id range. After adding one run
+# `manage.py migrate --database shardN` and `manage.py rebalance_shards`.
+# Sharded contacts are read from the shards, not from the replicas.
+CONTACT_SHARDS = ['default']
+
+for i, path in enumerate(filter(None, os.environ.get('PYCHATTY_SHARD_PATHS', '').split(',')), 1):
+    DATABASES[f'shard{i}'] = {
+        **DATABASES['default'],
+        'NAME': path,
+    }
+    CONTACT_SHARDS.append(f'shard{i}')
+
+DATABASE_ROUTERS = ['work.sharding.ShardRouter', 'work.routers.PrimaryReplicaRouter']
+
+# how long a client that just wrote keeps reading from the primary
+REPLICA_PIN_SECONDS = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Contact reads are cached through work.cache, point CONTACT_CACHE_ALIAS at
+# a shared backend (redis, memcached) when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pychatty',
     }
 }
 
+CONTACT_CACHE_ALIAS = 'default'
+CONTACT_CACHE_TTL = 300
+
+# {% cache %} fragments (menu, contact and user tables), see work.fragments
+FRAGMENT_CACHE_TTL = 300
+
+# User roles (work.roles). A role change drops the cached entry, but with
+# LocMemCache only in the process that made it: other workers keep the old
+# role for up to USER_ROLE_CACHE_TTL seconds unless the alias is shared.
+USER_ROLE_CACHE_ALIAS = 'default'
+USER_ROLE_CACHE_TTL = 10
+
+
+# Realtime messaging (work.realtime / work.broker)
+# InMemoryBroker fans out within one process; LocalClusterBroker stands in
+# for a multi-node broker when testing several workers in one process.
+
+MESSAGE_BROKER = 'work.broker.InMemoryBroker'
+MESSAGE_QUEUE_SIZE = 256
+
+# /api/im/contact-events (work.events): each user's latest events are kept in
+# an in-memory ring, for up to CONTACT_EVENT_RING_USERS recently read users.
+# Rings are checked against a per-user version in CACHES['default']; with
+# LocMemCache only threads of one process see each other's writes, so several
+# worker processes need a shared backend there or they serve stale rings.
+CONTACT_EVENT_RING_SIZE = 50
+CONTACT_EVENT_RING_USERS = 10000
+
+# api/import/ needs a signed-in user and refuses files past these limits;
+# the import_contacts command has none
+CONTACT_IMPORT_MAX_BYTES = 10 * 1024 * 1024
+CONTACT_IMPORT_MAX_ROWS = 50000
+
+
+# Chat file storage (work.files) and image thumbnails (work.thumbnails)
+# Thumbnails need Pillow; without it /api/im/detail?thumbnail answers 501.
+# Set FILE_SENDFILE_HEADER to 'X-Accel-Redirect' (nginx) or 'X-Sendfile'
+# (Apache) to let the front-end server send files from FILE_SENDFILE_PREFIX.
+
+FILE_STORAGE_DIR = BASE_DIR / 'media' / 'files'
+FILE_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+FILE_SENDFILE_HEADER = None
+FILE_SENDFILE_PREFIX = '/protected/files/'
+
+THUMBNAIL_DIR = BASE_DIR / 'media' / 'thumbnails'
+THUMBNAIL_SIZE = 320
+THUMBNAIL_CACHE_BYTES = 256 * 1024 * 1024
+THUMBNAIL_WORKERS = 2
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 
-from work import views
+from work import async_views, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -26,10 +26,32 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/list/', views.listAll, name='list-all'),
     path('api/list-page/<int:page>/', views.listPaged, name='list-paged'),
+    path('api/list-cursor/', views.listCursor, name='list-cursor'),
     path('api/get/<int:byId>/', views.get, name='get'),
     path('api/get-detail/', views.getDetail, name='get-detail'),
     path('api/new/', views.create, name='create'),
     path('api/update/<int:byId>/', views.update, name='update'),
     path('api/delete/<int:byId>/', views.delete, name='delete'),
+    path('api/bulk/new/', views.bulkCreate, name='bulk-create'),
+    path('api/bulk/update/', views.bulkUpdate, name='bulk-update'),
+    path('api/bulk/delete/', views.bulkDelete, name='bulk-delete'),
+    path('api/import/', views.importContacts, name='import'),
+    path('api/sync/', views.sync, name='sync'),
     path('api/search/<str:segment>/', views.search, name='search'),
+    path('api/stats/', views.stats, name='stats'),
+    path('api/im/history/', views.imHistory, name='im-history'),
+    path('api/im/upload/', views.imUpload, name='im-upload'),
+    path('api/im/contact-events/', views.imContactEvents, name='im-contact-events'),
+    path('api/im/file/<uuid:fileReference>/', views.imFile, name='im-file'),
+    path('api/im/detail/<str:msgSelector>/', views.imDetail, name='im-detail'),
+    
+    # Native async variants of the JSON API, for ASGI deployments
+    path('api/async/list/', async_views.listAll, name='async-list-all'),
+    path('api/async/list-page/<int:page>/', async_views.listPaged, name='async-list-paged'),
+    path('api/async/get/<int:byId>/', async_views.get, name='async-get'),
+    path('api/async/get-detail/', async_views.getDetail, name='async-get-detail'),
+    path('api/async/new/', async_views.create, name='async-create'),
+    path('api/async/update/<int:byId>/', async_views.update, name='async-update'),
+    path('api/async/delete/<int:byId>/', async_views.delete, name='async-delete'),
+    path('api/async/search/<str:segment>/', async_views.search, name='async-search'),
 ]
@@ -0,0 +1,212 @@
+"""
+Admission control for api/*: a token bucket per client and a cap on
+in-flight API requests per process, both answering 429 + Retry-After at
+once rather than letting requests queue behind the worker pool.
+
+Each route takes ADMISSION_ROUTE_COSTS[url name] tokens (1 if unlisted),
+so a full-table listAll drains a bucket ten times faster than a get.
+Buckets live in the backend named by ADMISSION_BACKEND:
+LocalBucketBackend keeps them in process memory (and is the stand-in for
+tests, with an injectable clock); CacheBucketBackend keeps them in a
+Django cache so every worker shares them.
+
+Anonymous clients are keyed by ADMISSION_CLIENT_IP_HEADER, REMOTE_ADDR by
+default. Behind a reverse proxy that is the proxy's address for everyone,
+so point it at the header the proxy sets (e.g. HTTP_X_REAL_IP). For a list
+header like X-Forwarded-For the client can write any entries it likes
+before the ones our proxies append, so the key is the entry
+ADMISSION_TRUSTED_PROXIES hops from the right, never the leftmost.
+
+ADMISSION_RATE = 0 gives each client a budget that never refills; its
+rejections carry Retry-After: MAX_RETRY_AFTER.
+"""
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from time import monotonic, time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+ADMISSION_RATE = getattr(settings, 'ADMISSION_RATE', 20)
+ADMISSION_BURST = getattr(settings, 'ADMISSION_BURST', 60)
+ADMISSION_MAX_INFLIGHT = getattr(settings, 'ADMISSION_MAX_INFLIGHT', 64)
+ADMISSION_CACHE_ALIAS = getattr(settings, 'ADMISSION_CACHE_ALIAS', 'default')
+ADMISSION_CLIENT_IP_HEADER = getattr(settings, 'ADMISSION_CLIENT_IP_HEADER', 'REMOTE_ADDR')
+ADMISSION_TRUSTED_PROXIES = getattr(settings, 'ADMISSION_TRUSTED_PROXIES', 1)
+
+MAX_RETRY_AFTER = 24 * 3600
+
+if ADMISSION_RATE < 0:
+    raise ImproperlyConfigured('ADMISSION_RATE must be zero or positive')
+if ADMISSION_TRUSTED_PROXIES < 1:
+    raise ImproperlyConfigured('ADMISSION_TRUSTED_PROXIES must be at least 1')
+
+DEFAULT_ROUTE_COSTS = {
+    'list-all': 10,
+    'async-list-all': 10,
+    'search': 5,
+    'async-search': 5,
+    'import': 20,
+    'sync': 5,
+    'list-paged': 2,
+    'async-list-paged': 2,
+    'list-cursor': 2,
+    'bulk-create': 5,
+    'bulk-update': 5,
+    'bulk-delete': 5,
+}
+ROUTE_COSTS = {**DEFAULT_ROUTE_COSTS, **getattr(settings, 'ADMISSION_ROUTE_COSTS', {})}
+
+REJECT_RATE = 'rate'
+REJECT_OVERLOAD = 'overload'
+
+
+def route_cost(url_name):
+    return ROUTE_COSTS.get(url_name, 1)
+
+
+class BaseBucketBackend:
+    def take(self, key, cost, rate, burst):
+        """(admitted, seconds until cost tokens are available)"""
+        raise NotImplementedError
+
+
+def _refill(tokens, last, now, rate, burst):
+    return min(burst, tokens + (now - last) * rate)
+
+
+def _retry_after(tokens, cost, rate):
+    return (cost - tokens) / rate if rate else math.inf
+
+
+class LocalBucketBackend(BaseBucketBackend):
+    """Per-process buckets; the least recently seen clients are dropped past max_keys"""
+
+    def __init__(self, clock=monotonic, max_keys=100000):
+        self.clock = clock
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+
+    def take(self, key, cost, rate, burst):
+        with self.lock:
+            now = self.clock()
+            state = self.buckets.get(key)
+            tokens = burst if state is None else _refill(state[0], state[1], now, rate, burst)
+            admitted = tokens >= cost
+            if admitted:
+                tokens -= cost
+            self.buckets[key] = (tokens, now)
+            self.buckets.move_to_end(key)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return admitted, 0.0 if admitted else _retry_after(tokens, cost, rate)
+
+
+class CacheBucketBackend(BaseBucketBackend):
+    """
+    Buckets in a shared Django cache. The read-modify-write isn't atomic, so
+    two workers racing on one client can both spend the same tokens; good
+    enough for shedding load, not for billing.
+    """
+
+    def __init__(self, alias=ADMISSION_CACHE_ALIAS, clock=time):
+        self.alias = alias
+        self.clock = clock
+
+    def take(self, key, cost, rate, burst):
+        cache = caches[self.alias]
+        cache_key = f'admission:{key}'
+        now = self.clock()
+        state = cache.get(cache_key)
+        tokens = burst if state is None else _refill(state[0], state[1], now, rate, burst)
+        admitted = tokens >= cost
+        if admitted:
+            tokens -= cost
+        # an idle bucket is full again after burst / rate seconds
+        cache.set(cache_key, (tokens, now), int(burst / rate) + 1 if rate else None)
+        return admitted, 0.0 if admitted else _retry_after(tokens, cost, rate)
+
+
+class AdmissionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(lambda: {'admitted': 0, REJECT_RATE: 0, REJECT_OVERLOAD: 0})
+
+    def count(self, url_name, outcome):
+        with self.lock:
+            self.routes[url_name][outcome] += 1
+
+    def snapshot(self):
+        with self.lock:
+            routes = {name: dict(counts) for name, counts in self.routes.items()}
+        totals = {'admitted': 0, REJECT_RATE: 0, REJECT_OVERLOAD: 0}
+        for counts in routes.values():
+            for outcome, n in counts.items():
+                totals[outcome] += n
+        return {'totals': totals, 'routes': routes, 'in_flight': inflight.current}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+
+class InFlight:
+    """API requests currently running in this process"""
+
+    def __init__(self, limit=ADMISSION_MAX_INFLIGHT):
+        self.limit = limit
+        self.current = 0
+        self.lock = threading.Lock()
+
+    def enter(self):
+        with self.lock:
+            if self.limit and self.current >= self.limit:
+                return False
+            self.current += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.current -= 1
+
+
+stats = AdmissionStats()
+inflight = InFlight()
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(getattr(settings, 'ADMISSION_BACKEND', 'work.admission.LocalBucketBackend'))()
+    return _backend
+
+
+def client_key(request, user):
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    address = request.META.get(ADMISSION_CLIENT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+    # each trusted proxy appends the peer it saw, so anything left of the
+    # outermost one came from the client and may be forged
+    hops = [hop.strip() for hop in address.split(',')]
+    return f'ip:{hops[-min(ADMISSION_TRUSTED_PROXIES, len(hops))]}'
+
+
+def admit(key, url_name):
+    """None when the request may run, otherwise the Retry-After in whole seconds"""
+    if not inflight.enter():
+        stats.count(url_name, REJECT_OVERLOAD)
+        return 1
+    cost = min(route_cost(url_name), ADMISSION_BURST)
+    admitted, wait = get_backend().take(key, cost, ADMISSION_RATE, ADMISSION_BURST)
+    if admitted:
+        stats.count(url_name, 'admitted')
+        return None
+    inflight.leave()
+    stats.count(url_name, REJECT_RATE)
+    # with ADMISSION_RATE = 0 the wait is infinite
+    return max(1, math.ceil(min(wait, MAX_RETRY_AFTER)))
@@ -0,0 +1,157 @@
+"""
+Native async versions of the api/* JSON views, mounted under api/async/.
+Under ASGI they run on the event loop instead of being pushed through
+DRF's sync @api_view in a thread-sensitive executor. Responses are
+rendered with DRF's JSONRenderer so the bytes match the sync views.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from . import cache as contact_cache
+from .models import Contact
+from .search import SEARCH_RESULT_LIMIT, search_capped
+from .fastpath import COLUMNS, contact_data, format_rows
+from .serializers import ContactSerializer
+from .views import clean_detail_ids
+
+# lists longer than this are serialized in a worker thread so a big
+# payload doesn't stall every other request on the loop
+INLINE_SERIALIZE_MAX = 50
+
+_renderer = JSONRenderer()
+
+
+def _json(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(_renderer.render(data), status=status_code, content_type='application/json')
+
+
+async def _serialize(contacts):
+    if len(contacts) <= INLINE_SERIALIZE_MAX:
+        return contact_data(contacts)
+    return await sync_to_async(contact_data, thread_sensitive=False)(contacts)
+
+
+def _body(request):
+    return json.loads(request.body.decode('utf-8'))
+
+
+@require_http_methods(['GET'])
+async def listAll(request):
+    rows = [row async for row in Contact.objects.values_list(*COLUMNS)]
+    if not rows:
+        return _json({"message": "Not Found"}, status.HTTP_404_NOT_FOUND)
+    if len(rows) <= INLINE_SERIALIZE_MAX:
+        return _json({"result": format_rows(rows)})
+    return _json({"result": await sync_to_async(format_rows, thread_sensitive=False)(rows)})
+
+
+@require_http_methods(['GET'])
+async def listPaged(request, page: int):
+    page_size = 10
+    paginator, contacts_page = await contact_cache.alist_page(Contact.objects.all(), None, page, page_size)
+    return _json({
+        'count': paginator.count,
+        'page_size': page_size,
+        'current_page': contacts_page.number,
+        'total_pages': paginator.num_pages,
+        'next_page': contacts_page.next_page_number() if contacts_page.has_next() else None,
+        'previous_page': contacts_page.previous_page_number() if contacts_page.has_previous() else None,
+        'results': contacts_page.object_list
+    })
+
+
+@require_http_methods(['GET'])
+async def get(request, byId: int):
+    data = await contact_cache.aget_contact_data(byId)
+    if data is None:
+        return _json({"message": "Not Found"}, status.HTTP_404_NOT_FOUND)
+    return _json(data)
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+async def getDetail(request):
+    try:
+        jsoned = _body(request)
+        if isinstance(jsoned, dict) and "ids" in jsoned:
+            ids = jsoned["ids"]
+        else:
+            ids = None
+            required = int(jsoned["id"])
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError):
+        return _json({"message": "Invalid input"}, status.HTTP_400_BAD_REQUEST)
+
+    if ids is None:
+        data = await contact_cache.aget_contact_data(required)
+        if data is None:
+            return _json({"id": required, "message": "Not Found"}, status.HTTP_404_NOT_FOUND)
+        return _json(data)
+
+    try:
+        ids = clean_detail_ids(ids)
+    except ValueError as e:
+        return _json({"message": str(e)}, status.HTTP_400_BAD_REQUEST)
+    found = await contact_cache.aget_many_contact_data(ids)
+    return _json({"results": [found.get(i) or {"id": i, "message": "Not Found"} for i in ids]})
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+async def create(request):
+    try:
+        data = _body(request)
+    except json.JSONDecodeError:
+        return _json({"message": "Invalid JSON"}, status.HTTP_400_BAD_REQUEST)
+    user = await request.auser()
+    serializer = ContactSerializer(data=data)
+    if not serializer.is_valid():
+        return _json({"message": "Validation error", "errors": serializer.errors}, status.HTTP_400_BAD_REQUEST)
+    contact = Contact(user=user if user.is_authenticated else None, **serializer.validated_data)
+    await contact.asave()
+    return _json({"message": "done"}, status.HTTP_201_CREATED)
+
+
+@csrf_exempt
+@require_http_methods(['PATCH'])
+async def update(request, byId: int):
+    try:
+        data = _body(request)
+    except json.JSONDecodeError:
+        return _json({"message": "Invalid JSON"}, status.HTTP_400_BAD_REQUEST)
+    try:
+        contact = await Contact.objects.aget(id=byId)
+    except Contact.DoesNotExist:
+        return _json({"id": byId, "message": "Not Found"}, status.HTTP_404_NOT_FOUND)
+    serializer = ContactSerializer(contact, data=data, partial=True)
+    if not serializer.is_valid():
+        return _json({"message": "Validation error", "errors": serializer.errors}, status.HTTP_400_BAD_REQUEST)
+    for field, value in serializer.validated_data.items():
+        setattr(contact, field, value)
+    await contact.asave()
+    return _json({"id": byId, "message": "Updated"})
+
+
+@csrf_exempt
+@require_http_methods(['DELETE'])
+async def delete(request, byId: int):
+    try:
+        contact = await Contact.objects.aget(id=byId)
+    except Contact.DoesNotExist:
+        return _json({"message": "Not Found"}, status.HTTP_404_NOT_FOUND)
+    await contact.adelete()
+    return _json({"message": "done"})
+
+
+@require_http_methods(['GET'])
+async def search(request, segment: str):
+    # the FTS5 lookup is raw SQL, so it goes through the ORM's DB thread
+    contacts, truncated = await sync_to_async(search_capped)(Contact.objects.all(), segment)
+    if not contacts:
+        return _json({"message": "Not Found"}, status.HTTP_404_NOT_FOUND)
+    return _json({"results": await _serialize(contacts), "limit": SEARCH_RESULT_LIMIT, "truncated": truncated})
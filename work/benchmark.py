@@ -0,0 +1,130 @@
+import json
+import platform
+import subprocess
+from time import perf_counter, strftime
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .models import Contact
+from .profiling import percentile
+
+
+class Route:
+    def __init__(self, name, method, path, body=None, login=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.login = login
+    
+    def request(self, client, i):
+        path = self.path(i) if callable(self.path) else self.path
+        if self.body is None:
+            return getattr(client, self.method)(path)
+        body = json.dumps(self.body(i))
+        return getattr(client, self.method)(path, data=body, content_type='application/json')
+
+
+def default_routes(ids):
+    def pick(i):
+        return ids[i * 7919 % len(ids)]
+    
+    return [
+        Route('contact_list', 'get', lambda i: f'/contacts/?page={i % 5 + 1}', login=True),
+        Route('search_results', 'get', '/search/results/?keyword=contact&search_type=name', login=True),
+        Route('list-all', 'get', '/api/list/'),
+        Route('list-paged', 'get', lambda i: f'/api/list-page/{i % 5 + 1}/'),
+        Route('list-cursor', 'get', '/api/list-cursor/'),
+        Route('search', 'get', '/api/search/contact/'),
+        Route('get', 'get', lambda i: f'/api/get/{pick(i)}/'),
+        Route('create', 'put', '/api/new/',
+              body=lambda i: {'name': f'bench {i}', 'phone': '+15550000000', 'email': f'bench{i}@load.test'}),
+        Route('update', 'patch', lambda i: f'/api/update/{pick(i)}/', body=lambda i: {'name': f'updated {i}'}),
+    ]
+
+
+def run_route(route, client, requests, warmup):
+    for i in range(warmup):
+        route.request(client, i)
+    
+    timings, queries, errors = [], [], 0
+    started = perf_counter()
+    for i in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            begin = perf_counter()
+            response = route.request(client, warmup + i)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            timings.append((perf_counter() - begin) * 1000)
+        queries.append(len(captured))
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = perf_counter() - started
+    
+    ordered = sorted(timings)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'rps': requests / elapsed if elapsed else None,
+        'p50_ms': percentile(ordered, 50),
+        'p95_ms': percentile(ordered, 95),
+        'p99_ms': percentile(ordered, 99),
+        'queries_mean': sum(queries) / len(queries) if queries else 0,
+        'queries_max': max(queries) if queries else 0,
+    }
+
+
+def run(user, password, routes, requests=100, warmup=5, only=None):
+    anonymous = Client()
+    authenticated = Client()
+    authenticated.login(username=user.username, password=password)
+    
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver'] + list(settings.ALLOWED_HOSTS), ADMISSION_CONTROL=False):
+        for route in routes:
+            if only and route.name not in only:
+                continue
+            client = authenticated if route.login else anonymous
+            results[route.name] = run_route(route, client, requests, warmup)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def metadata(**params):
+    return {
+        'revision': git_revision(),
+        'timestamp': strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'contacts': Contact.objects.count(),
+        'params': params,
+    }
+
+
+def compare(current, previous):
+    """Per-route relative change of the latency percentiles and throughput"""
+    deltas = {}
+    for name, now in current['routes'].items():
+        before = previous.get('routes', {}).get(name)
+        if not before:
+            continue
+        deltas[name] = {
+            key: (now[key] - before[key]) / before[key] * 100
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'rps')
+            if now.get(key) is not None and before.get(key)
+        }
+    return deltas
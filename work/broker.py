@@ -0,0 +1,116 @@
+"""
+Pub/sub fan-out for the websocket routes. Publishers never wait on
+subscribers: every connection owns a bounded queue, and one that falls
+behind is flagged as overflowed and disconnected by its pump (the client
+reconnects and catches up through the history API). Pick the broker with
+MESSAGE_BROKER; both brokers here live in-process.
+"""
+import asyncio
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+QUEUE_SIZE = getattr(settings, 'MESSAGE_QUEUE_SIZE', 256)
+
+
+class Subscriber:
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def offer(self, data):
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+
+
+class BaseBroker:
+    def subscribe(self, topic, subscriber):
+        raise NotImplementedError
+
+    def unsubscribe(self, topic, subscriber):
+        raise NotImplementedError
+
+    async def publish(self, topic, data):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class InMemoryBroker(BaseBroker):
+    """Single process fan-out, the default"""
+
+    def __init__(self):
+        self.topics = defaultdict(set)
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, topic, subscriber):
+        self.topics[topic].add(subscriber)
+
+    def unsubscribe(self, topic, subscriber):
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.topics[topic]
+
+    def deliver(self, topic, data):
+        for subscriber in tuple(self.topics.get(topic, ())):
+            if subscriber.offer(data):
+                self.delivered += 1
+            else:
+                # its pump closes the socket, stop feeding it in the meantime
+                self.dropped += 1
+                self.unsubscribe(topic, subscriber)
+
+    async def publish(self, topic, data):
+        self.deliver(topic, data)
+
+    def stats(self):
+        return {
+            'topics': len(self.topics),
+            'subscribers': sum(len(s) for s in self.topics.values()),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+
+class LocalClusterBroker(InMemoryBroker):
+    """
+    Stand-in for a multi-node broker (redis pub/sub and the like): every
+    instance joins a named cluster, and a publish on any node is delivered
+    by all of them, one loop turn later as if it had crossed the network.
+    """
+
+    clusters = defaultdict(list)
+
+    def __init__(self, cluster='default'):
+        super().__init__()
+        self.cluster = cluster
+        self.clusters[cluster].append(self)
+
+    async def publish(self, topic, data):
+        await asyncio.sleep(0)
+        for node in self.clusters[self.cluster]:
+            node.deliver(topic, data)
+
+    def leave(self):
+        self.clusters[self.cluster].remove(self)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'MESSAGE_BROKER', 'work.broker.InMemoryBroker'))()
+    return _broker
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+from .models import Contact
+from .signals import contacts_bulk_saved, contacts_bulk_deleted
+from .validators import REQUIRED, validate_rows
+
+BULK_MAX_ITEMS = getattr(settings, 'CONTACT_BULK_MAX_ITEMS', 1000)
+BULK_BATCH_SIZE = 500
+
+INVALID_ID = 'A valid integer is required.'
+DUPLICATE_ID = 'Duplicate id.'
+
+
+class BulkError(Exception):
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors
+
+
+def _check_rows(rows):
+    if not isinstance(rows, list) or not rows:
+        raise BulkError('Expected a non-empty JSON array')
+    if len(rows) > BULK_MAX_ITEMS:
+        raise BulkError(f'Too many items, max {BULK_MAX_ITEMS}')
+
+
+def _is_id(value):
+    # JSON ints only: int() would turn 2.7 into 2 and True into 1
+    return type(value) is int
+
+
+def bulk_create_contacts(rows, owner=None):
+    """Validate every row, then insert them all in one transaction"""
+    _check_rows(rows)
+    cleaned, errors = validate_rows(rows)
+    if any(errors):
+        raise BulkError('Validation error', errors)
+    
+    contacts = [Contact(user=owner, **item) for item in cleaned]
+    with transaction.atomic(using=sharding.shard_for_user(owner.pk if owner else None)):
+        Contact.objects.bulk_create(contacts, batch_size=BULK_BATCH_SIZE)
+        contacts_bulk_saved.send(sender=Contact, instances=contacts)
+    return contacts
+
+
+def bulk_update_contacts(rows):
+    """Rows are partial updates carrying their 'id'; all or nothing (per shard when sharded)"""
+    _check_rows(rows)
+    cleaned, errors = validate_rows(rows, partial=True)
+    ids, seen = [], set()
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            ids.append(None)
+            continue
+        contact_id = row.get('id')
+        if 'id' not in row:
+            errors[i]['id'] = [REQUIRED]
+        elif not _is_id(contact_id):
+            errors[i]['id'] = [INVALID_ID]
+        elif contact_id in seen:
+            # one row per contact, two would race in bulk_update and the index
+            errors[i]['id'] = [DUPLICATE_ID]
+        else:
+            seen.add(contact_id)
+        ids.append(contact_id if 'id' not in errors[i] else None)
+    
+    existing = Contact.objects.in_bulk([contact_id for contact_id in ids if contact_id is not None])
+    for i, contact_id in enumerate(ids):
+        if contact_id is not None and contact_id not in existing:
+            errors[i] = {'id': ['Not Found']}
+    if any(errors):
+        raise BulkError('Validation error', errors)
+    
+    now = timezone.now()
+    touched = {'updated_at'}
+    contacts = []
+    for contact_id, item in zip(ids, cleaned):
+        contact = existing[contact_id]
+        for field, value in item.items():
+            setattr(contact, field, value)
+            touched.add(field)
+        contact.updated_at = now
+        contacts.append(contact)
+    
+    with transaction.atomic():
+        Contact.objects.bulk_update(contacts, sorted(touched), batch_size=BULK_BATCH_SIZE)
+        contacts_bulk_saved.send(sender=Contact, instances=contacts)
+    return contacts
+
+
+def bulk_delete_contacts(ids):
+    """One DELETE ... WHERE id IN (...); returns (deleted ids, missing ids)"""
+    _check_rows(ids)
+    errors = [{} if _is_id(i) else {'id': [INVALID_ID]} for i in ids]
+    if any(errors):
+        raise BulkError('Expected an array of integer ids', errors)
+    
+    found = []
+    for alias in sharding.shards():
+        found += _delete_on(alias, ids)
+    found_set = set(found)
+    return found, [i for i in ids if i not in found_set]
+
+
+def _delete_on(alias, ids):
+    with transaction.atomic(using=alias):
+        rows = list(Contact.objects.using(alias).filter(id__in=ids).values_list('id', 'user_id'))
+        found = [row[0] for row in rows]
+        if found:
+            # nothing references Contact, so skip the collector and its per-row signals
+            Contact.objects.using(alias).filter(id__in=found)._raw_delete(alias)
+            contacts_bulk_deleted.send(sender=Contact, ids=found, user_ids={row[1] for row in rows}, using=alias)
+    return found
@@ -0,0 +1,251 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import Paginator, Page, EmptyPage, PageNotAnInteger
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .fastpath import contact_data
+from .models import Contact
+from .routers import PRIMARY
+from .signals import contacts_bulk_saved, contacts_bulk_deleted
+
+CONTACT_CACHE_ALIAS = getattr(settings, 'CONTACT_CACHE_ALIAS', 'default')
+CONTACT_CACHE_TTL = getattr(settings, 'CONTACT_CACHE_TTL', 300)
+
+ALL_SCOPE = 'all'
+
+# Misses are filled from the primary (or the shards, see work.sharding): a
+# cached entry outlives replica lag, so filling it from a replica could pin
+# a stale row until the TTL.
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CONTACT_CACHE_ALIAS]
+
+
+def _count(hit, n=1):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += n
+
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
+
+
+def contact_key(contact_id):
+    return f'contacts:obj:{contact_id}'
+
+
+def version_key(scope):
+    return f'contacts:ver:{scope}'
+
+
+# ---- single contacts ----
+
+def get_contact_data(contact_id):
+    """Serialized ContactSerializer payload for one contact, or None"""
+    cache = _cache()
+    data = cache.get(contact_key(contact_id))
+    if data is not None:
+        _count(True)
+        return data
+    _count(False)
+    try:
+        contact = Contact.objects.on_primary().get(id=contact_id)
+    except Contact.DoesNotExist:
+        return None
+    data = contact_data([contact])[0]
+    cache.set(contact_key(contact_id), data, CONTACT_CACHE_TTL)
+    return data
+
+
+def get_many_contact_data(ids):
+    """{id: payload} for the ids that exist; misses are loaded with one in_bulk()"""
+    cache = _cache()
+    keys = {contact_key(i): i for i in ids}
+    cached = cache.get_many(list(keys))
+    found = {keys[key]: data for key, data in cached.items()}
+    missing = [i for i in set(ids) if i not in found]
+    _count(True, len(found))
+    if missing:
+        _count(False, len(missing))
+        fresh = {}
+        for contact in Contact.objects.on_primary().in_bulk(missing).values():
+            data = contact_data([contact])[0]
+            found[contact.id] = data
+            fresh[contact_key(contact.id)] = data
+        cache.set_many(fresh, CONTACT_CACHE_TTL)
+    return found
+
+
+async def aget_contact_data(contact_id):
+    cache = _cache()
+    data = await cache.aget(contact_key(contact_id))
+    if data is not None:
+        _count(True)
+        return data
+    _count(False)
+    try:
+        contact = await Contact.objects.on_primary().aget(id=contact_id)
+    except Contact.DoesNotExist:
+        return None
+    data = contact_data([contact])[0]
+    await cache.aset(contact_key(contact_id), data, CONTACT_CACHE_TTL)
+    return data
+
+
+async def aget_many_contact_data(ids):
+    cache = _cache()
+    keys = {contact_key(i): i for i in ids}
+    cached = await cache.aget_many(list(keys))
+    found = {keys[key]: data for key, data in cached.items()}
+    missing = [i for i in set(ids) if i not in found]
+    _count(True, len(found))
+    if missing:
+        _count(False, len(missing))
+        fresh = {}
+        for contact in (await Contact.objects.on_primary().ain_bulk(missing)).values():
+            data = contact_data([contact])[0]
+            found[contact.id] = data
+            fresh[contact_key(contact.id)] = data
+        await cache.aset_many(fresh, CONTACT_CACHE_TTL)
+    return found
+
+
+# ---- per-user list pages ----
+
+def list_version(scope):
+    cache = _cache()
+    version = cache.get(version_key(scope))
+    if version is None:
+        cache.add(version_key(scope), 1, None)
+        version = cache.get(version_key(scope), 1)
+    return version
+
+
+def bump_version(scope):
+    """Moves every list page of scope to a fresh key in O(1)"""
+    cache = _cache()
+    try:
+        cache.incr(version_key(scope))
+    except ValueError:
+        cache.set(version_key(scope), 2, None)
+
+
+def list_page(queryset, owner_id, number, per_page=10):
+    """
+    Paginator/Page pair for a contact list whose count and rows come from
+    the cache. Keys carry the owner's list version, so any write by that
+    owner retires all of their cached pages at once.
+    """
+    scope = owner_id if owner_id is not None else ALL_SCOPE
+    key = f'contacts:list:{scope}:{list_version(scope)}:{per_page}:{number}'
+    cache = _cache()
+    payload = cache.get(key)
+    paginator = Paginator(queryset.on_primary(), per_page)
+    if payload is None:
+        _count(False)
+        try:
+            page = paginator.page(number)
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        payload = {
+            'count': paginator.count,
+            'number': page.number,
+            'rows': contact_data(page.object_list),
+        }
+        cache.set(key, payload, CONTACT_CACHE_TTL)
+    else:
+        _count(True)
+        paginator.count = payload['count']
+    return paginator, Page(payload['rows'], payload['number'], paginator)
+
+
+async def alist_version(scope):
+    cache = _cache()
+    version = await cache.aget(version_key(scope))
+    if version is None:
+        await cache.aadd(version_key(scope), 1, None)
+        version = await cache.aget(version_key(scope), 1)
+    return version
+
+
+async def alist_page(queryset, owner_id, number, per_page=10):
+    """list_page() for async views, same keys so both paths share entries"""
+    scope = owner_id if owner_id is not None else ALL_SCOPE
+    key = f'contacts:list:{scope}:{await alist_version(scope)}:{per_page}:{number}'
+    cache = _cache()
+    payload = await cache.aget(key)
+    queryset = queryset.on_primary()
+    paginator = Paginator(queryset, per_page)
+    if payload is None:
+        _count(False)
+        paginator.count = await queryset.acount()
+        try:
+            page_number = paginator.validate_number(number)
+        except PageNotAnInteger:
+            page_number = 1
+        except EmptyPage:
+            page_number = paginator.num_pages
+        bottom = (page_number - 1) * per_page
+        rows = [contact async for contact in queryset[bottom:bottom + per_page]]
+        payload = {
+            'count': paginator.count,
+            'number': page_number,
+            'rows': contact_data(rows),
+        }
+        await cache.aset(key, payload, CONTACT_CACHE_TTL)
+    else:
+        _count(True)
+        paginator.count = payload['count']
+    return paginator, Page(payload['rows'], payload['number'], paginator)
+
+
+# ---- invalidation ----
+
+def invalidate(contact_ids, owner_ids, using=PRIMARY):
+    """Drop cached rows and bump list versions once the write on using commits"""
+    transaction.on_commit(lambda: _invalidate(contact_ids, owner_ids), using=using)
+
+
+def _invalidate(contact_ids, owner_ids):
+    _cache().delete_many([contact_key(i) for i in contact_ids])
+    for owner_id in set(owner_ids):
+        if owner_id is not None:
+            bump_version(owner_id)
+    bump_version(ALL_SCOPE)
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def invalidate_contact(sender, instance, using=PRIMARY, **kwargs):
+    invalidate([instance.id], [instance.user_id], using)
+
+
+@receiver(contacts_bulk_saved, sender=Contact)
+def invalidate_contacts_saved(sender, instances, **kwargs):
+    # a bulk save may span shards, each waits for its own transaction
+    groups = {}
+    for c in instances:
+        groups.setdefault(c._state.db or PRIMARY, []).append(c)
+    for alias, contacts in groups.items():
+        invalidate([c.id for c in contacts], [c.user_id for c in contacts], alias)
+
+
+@receiver(contacts_bulk_deleted, sender=Contact)
+def invalidate_contacts_deleted(sender, ids, user_ids, using=PRIMARY, **kwargs):
+    invalidate(ids, user_ids, using)
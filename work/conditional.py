@@ -0,0 +1,50 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+
+from . import cache as contact_cache
+from .models import Contact, ContactTombstone
+
+
+def _list_state(request):
+    """
+    (count, last change) of the contact table, computed once per request.
+    The last change is the newer of max(updated_at) and the newest
+    tombstone, so deleting an older row still moves Last-Modified.
+    """
+    state = getattr(request, '_contact_list_state', None)
+    if state is None:
+        result = Contact.objects.aggregate(count=Count('id'), last=Max('updated_at'))
+        deleted = ContactTombstone.objects.aggregate(last=Max('deleted_at'))['last']
+        changes = [when for when in (result['last'], deleted) if when is not None]
+        state = (result['count'], max(changes) if changes else None)
+        request._contact_list_state = state
+    return state
+
+
+def _etag(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def list_etag(request, *args, **kwargs):
+    count, last = _list_state(request)
+    return _etag('list', count, last.isoformat() if last else '-', request.get_full_path())
+
+
+def list_last_modified(request, *args, **kwargs):
+    return _list_state(request)[1]
+
+
+def contact_etag(request, byId, *args, **kwargs):
+    data = contact_cache.get_contact_data(byId)
+    if data is None:
+        return None
+    return _etag('contact', byId, data['updated_at'])
+
+
+def contact_last_modified(request, byId, *args, **kwargs):
+    data = contact_cache.get_contact_data(byId)
+    if data is None:
+        return None
+    return parse_datetime(data['updated_at'])
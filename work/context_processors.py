@@ -0,0 +1,10 @@
+from .fragments import FRAGMENT_CACHE_TTL
+from .roles import get_role
+
+
+def user_role(request):
+    return {'user_role': get_role(request.user) if hasattr(request, 'user') else None}
+
+
+def fragment_cache(request):
+    return {'fragment_ttl': FRAGMENT_CACHE_TTL}
@@ -0,0 +1,45 @@
+"""
+Concurrent read/write load against a scratch SQLite file, one process per
+worker, used by `manage.py bench_sqlite` to compare database profiles.
+Workers configure Django through the PYCHATTY_DB_* environment variables,
+so each process opens its own connections exactly like a server worker.
+"""
+import os
+import random
+import time
+
+
+def configure(db_path, profile):
+    os.environ['DJANGO_SETTINGS_MODULE'] = os.environ.get('DJANGO_SETTINGS_MODULE', 'pychatty.settings')
+    os.environ['PYCHATTY_DB_PATH'] = str(db_path)
+    os.environ['PYCHATTY_DB_PROFILE'] = profile
+
+
+def worker(db_path, profile, seconds, write_ratio, seed, results):
+    configure(db_path, profile)
+    import django
+    django.setup()
+    from django.db import OperationalError, transaction, close_old_connections
+    from work.models import Contact
+    
+    ids = list(Contact.objects.values_list('id', 'user_id'))
+    rng = random.Random(seed)
+    reads = writes = errors = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        contact_id, user_id = rng.choice(ids)
+        try:
+            if rng.random() < write_ratio:
+                with transaction.atomic():
+                    contact = Contact.objects.get(id=contact_id)
+                    contact.additional = f'touched {rng.random()}'
+                    contact.save()
+                writes += 1
+            else:
+                list(Contact.objects.filter(user_id=user_id).order_by('created_at', 'id')[:20])
+                reads += 1
+        except OperationalError:
+            errors += 1
+        # what the request_finished handler does between requests
+        close_old_connections()
+    results.put({'reads': reads, 'writes': writes, 'errors': errors})
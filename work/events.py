@@ -0,0 +1,214 @@
+"""
+Contact events for /api/im/contact-events: changes to a user's contacts
+and to their role, stored in work_contactevent and read back through a
+per-user ring of the latest EVENT_RING_SIZE records.
+
+A ring is rebuilt on a miss with one descending seek on (user, id), so a
+read never scans the table. Each user also has an event version in the
+default cache, bumped once the event is committed: the writing worker
+appends to its own ring and moves it to the new version, and every other
+worker sharing that cache sees the version change and rebuilds on its
+next read. With the default LocMemCache that is only the threads of one
+process; separate processes need a shared cache backend. Committed
+events are also announced on the user's /ws/msg/ann sockets.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import realtime, sharding
+from .models import Contact, ContactEvent
+from .routers import PRIMARY
+from .signals import contacts_bulk_saved, contacts_bulk_deleted
+
+EVENT_RING_SIZE = getattr(settings, 'CONTACT_EVENT_RING_SIZE', 50)
+EVENT_RING_USERS = getattr(settings, 'CONTACT_EVENT_RING_USERS', 10000)
+
+FIELDS = ('id', 'type', 'contact_id', 'actor_id', 'summary', 'created_at')
+
+
+class EventRecord:
+    __slots__ = ('id', 'type', 'contact_id', 'actor_id', 'summary', 'time')
+
+    def __init__(self, id, type, contact_id, actor_id, summary, created_at):
+        self.id = id
+        self.type = type
+        self.contact_id = contact_id
+        self.actor_id = actor_id
+        self.summary = summary
+        # milliseconds, like sendTime
+        self.time = int(created_at.timestamp() * 1000)
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'contactId': self.contact_id,
+            'actorId': self.actor_id,
+            'summary': self.summary,
+            'time': self.time,
+        }
+
+
+class EventRing:
+    __slots__ = ('version', 'records')
+
+    def __init__(self, version, records):
+        self.version = version
+        self.records = deque(records, maxlen=EVENT_RING_SIZE)
+
+
+def version_key(user_id):
+    return f'contact-events:ver:{user_id}'
+
+
+def current_version(user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # a clock start rather than 1, so a version evicted from the cache
+        # can't come back equal to one a stale ring still holds
+        cache.add(version_key(user_id), time.time_ns(), None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+def bump_version(user_id):
+    try:
+        return cache.incr(version_key(user_id))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(version_key(user_id), version, None)
+        return version
+
+
+class RingCache:
+    """EventRings by user id, the least recently read dropped past maxusers"""
+
+    def __init__(self, maxusers=EVENT_RING_USERS):
+        self.maxusers = maxusers
+        self.lock = threading.Lock()
+        self.rings = OrderedDict()
+        self.hits = self.misses = 0
+
+    def latest(self, user_id):
+        """The user's latest events, newest first"""
+        version = current_version(user_id)
+        with self.lock:
+            ring = self.rings.get(user_id)
+            if ring is not None and ring.version == version:
+                self.rings.move_to_end(user_id)
+                self.hits += 1
+                return list(reversed(ring.records))
+            self.misses += 1
+        rows = (
+            ContactEvent.objects.using(PRIMARY)
+            .filter(user_id=user_id)
+            .order_by('-id')
+            .values_list(*FIELDS)[:EVENT_RING_SIZE]
+        )
+        records = [EventRecord(*row) for row in rows]
+        with self.lock:
+            self.rings[user_id] = EventRing(version, reversed(records))
+            self.rings.move_to_end(user_id)
+            while len(self.rings) > self.maxusers:
+                self.rings.popitem(last=False)
+        return records
+
+    def append(self, user_id, record, version):
+        """Adds a record written here; the ring has to be exactly one version behind"""
+        with self.lock:
+            ring = self.rings.get(user_id)
+            if ring is None:
+                return
+            if ring.version != version - 1 or (ring.records and ring.records[-1].id >= record.id):
+                # someone else wrote in between, or a rebuild already read this
+                # record; rebuild on the next read
+                del self.rings[user_id]
+                return
+            ring.records.append(record)
+            ring.version = version
+
+    def stats(self):
+        with self.lock:
+            return {'users': len(self.rings), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.rings.clear()
+            self.hits = self.misses = 0
+
+
+rings = RingCache()
+
+
+def record(user_id, event_type, contact_id=None, actor_id=None, summary='', using=PRIMARY):
+    event = ContactEvent.objects.using(using).create(
+        user_id=user_id, type=event_type, contact_id=contact_id, actor_id=actor_id, summary=summary[:200],
+    )
+    event_record = EventRecord(*(getattr(event, field) for field in FIELDS))
+    # only a committed event moves the version, so a rolled back one is never
+    # served and a rebuild before the commit isn't cached under the new version
+    def committed():
+        rings.append(user_id, event_record, bump_version(user_id))
+        realtime.announce(user_id, 'ContactAnnouncement', event_record.as_dict())
+    transaction.on_commit(committed, using=using)
+    return event
+
+
+def latest(user_id):
+    return rings.latest(user_id)
+
+
+def _record_on_commit(using, user_id, event_type, contact_id=None, summary=''):
+    # events of a rolled back write never reach the feed
+    def write():
+        try:
+            with transaction.atomic(using=PRIMARY):
+                record(user_id, event_type, contact_id, summary=summary)
+        except IntegrityError:
+            # the owner was deleted, taking the contact with them
+            pass
+    transaction.on_commit(write, using=using)
+
+
+@receiver(post_save, sender=Contact)
+def contact_saved(sender, instance, created, using, raw=False, **kwargs):
+    if raw or instance.user_id is None:
+        return
+    _record_on_commit(using, instance.user_id, 'contact_added' if created else 'contact_updated',
+                      instance.id, instance.name)
+
+
+@receiver(post_delete, sender=Contact)
+def contact_deleted(sender, instance, using, **kwargs):
+    if instance.user_id is None:
+        return
+    _record_on_commit(using, instance.user_id, 'contact_removed', instance.id, instance.name)
+
+
+@receiver(contacts_bulk_saved, sender=Contact)
+def contacts_saved(sender, instances, moved=False, **kwargs):
+    if moved or not instances:
+        return
+    # the transaction to wait for is on the contacts' shard, or the primary
+    counts = Counter(
+        (contact._state.db if sharding.enabled() else PRIMARY, contact.user_id)
+        for contact in instances if contact.user_id is not None
+    )
+    for (using, user_id), count in counts.items():
+        _record_on_commit(using, user_id, 'contacts_saved', summary=f'{count} contacts saved')
+
+
+@receiver(contacts_bulk_deleted, sender=Contact)
+def contacts_deleted(sender, ids, user_ids, using=PRIMARY, **kwargs):
+    owners = [user_id for user_id in user_ids if user_id is not None]
+    # the per-owner split isn't carried by the signal, only a single owner gets a count
+    summary = f'{len(ids)} contacts removed' if len(set(user_ids)) == 1 else 'Contacts removed'
+    for user_id in owners:
+        _record_on_commit(using, user_id, 'contacts_removed', summary=summary)
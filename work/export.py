@@ -0,0 +1,38 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from .fastpath import iter_contact_values
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_MAX_CHUNK_SIZE = 5000
+
+
+def iter_json(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Same body as api/list, written out one batch at a time"""
+    renderer = JSONRenderer()
+    yield b'{"result":['
+    first = True
+    for batch in iter_contact_values(queryset, chunk_size):
+        rendered = renderer.render(batch)
+        if not first:
+            yield b','
+        yield rendered[1:-1]
+        first = False
+    yield b']}'
+
+
+def iter_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    renderer = JSONRenderer()
+    for batch in iter_contact_values(queryset, chunk_size):
+        yield b''.join(renderer.render(row) + b'\n' for row in batch)
+
+
+STREAM_FORMATS = {
+    'json': (iter_json, 'application/json'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
+
+
+def stream_contacts(queryset, fmt='json', chunk_size=EXPORT_CHUNK_SIZE):
+    generate, content_type = STREAM_FORMATS[fmt]
+    return StreamingHttpResponse(generate(queryset.order_by('id'), chunk_size), content_type=content_type)
@@ -0,0 +1,78 @@
+"""
+Read-only fast path for ContactSerializer output.
+
+Rows come straight from .values_list() over ContactSerializer.Meta.fields
+and are turned into dicts with one formatter per column, skipping DRF's
+per-row field tree. The dicts are equal to ContactSerializer(...).data and
+render to the same JSON bytes; bench_serializer checks both claims.
+"""
+from datetime import timezone as dt_timezone
+
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .models import Contact
+from .serializers import ContactSerializer
+
+FIELDS = tuple(ContactSerializer.Meta.fields)
+# 'user' is read as its user_id column, which is what PrimaryKeyRelatedField emits
+COLUMNS = tuple(Contact._meta.get_field(name).attname for name in FIELDS)
+
+_drf_datetime = serializers.DateTimeField()
+
+
+def _format_datetime(value):
+    # DRF's ISO 8601 output for an aware UTC value, without its per-value
+    # timezone bookkeeping; anything else goes through DRF itself
+    if value is not None and value.tzinfo is dt_timezone.utc:
+        text = value.isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+    return _drf_datetime.to_representation(value)
+
+
+_datetime_fields = None
+
+
+def _datetime_field_names():
+    global _datetime_fields
+    if _datetime_fields is None:
+        fields = ContactSerializer().fields
+        _datetime_fields = [name for name in FIELDS if isinstance(fields[name], serializers.DateTimeField)]
+    return _datetime_fields
+
+
+def format_rows(rows):
+    """values_list(*COLUMNS) tuples to ContactSerializer-shaped dicts"""
+    # checked per call: the active timezone can change between requests
+    utc = api_settings.DATETIME_FORMAT.lower() == ISO_8601 and timezone.get_current_timezone_name() == 'UTC'
+    formatter = _format_datetime if utc else _drf_datetime.to_representation
+    formatted = [(name, formatter) for name in _datetime_field_names()]
+    result = []
+    for row in rows:
+        item = dict(zip(FIELDS, row))
+        for name, formatter in formatted:
+            item[name] = formatter(item[name])
+        result.append(item)
+    return result
+
+
+def contact_values(queryset):
+    return format_rows(queryset.values_list(*COLUMNS))
+
+
+def iter_contact_values(queryset, chunk_size):
+    """Batches of formatted rows, reading the table with a server-side iterator"""
+    batch = []
+    for row in queryset.values_list(*COLUMNS).iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield format_rows(batch)
+            batch = []
+    if batch:
+        yield format_rows(batch)
+
+
+def contact_data(contacts):
+    """The same dicts built from already loaded Contact instances"""
+    return format_rows([tuple(getattr(contact, column) for column in COLUMNS) for contact in contacts])
@@ -0,0 +1,196 @@
+"""
+Content-addressed file storage for /api/im/file and /api/im/upload.
+
+Bytes are written once under FILE_STORAGE_DIR/<sha[:2]>/<sha>; StoredFile
+rows hand out the references. Downloads are streamed (sendfile where the
+server supports it, or X-Accel-Redirect/X-Sendfile when FILE_SENDFILE_HEADER
+is set) and honour single byte-range requests.
+
+The stored content type is worked out here from the first bytes (and the
+file name), never taken from the upload's header. Only the raster image
+types in INLINE_TYPES are served inline; everything else, HTML and SVG
+included, goes out as an attachment with nosniff, so an upload can't run
+script on this origin.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+from .models import StoredFile
+
+FILE_STORAGE_DIR = getattr(settings, 'FILE_STORAGE_DIR', settings.BASE_DIR / 'media' / 'files')
+FILE_SENDFILE_HEADER = getattr(settings, 'FILE_SENDFILE_HEADER', None)
+FILE_SENDFILE_PREFIX = getattr(settings, 'FILE_SENDFILE_PREFIX', '/protected/files/')
+FILE_UPLOAD_MAX_BYTES = getattr(settings, 'FILE_UPLOAD_MAX_BYTES', 50 * 1024 * 1024)
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+INLINE_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+SNIFF_BYTES = 16
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+def detect_content_type(head, name):
+    """
+    The type to store for a file starting with head: an inline image type
+    only when the bytes really are one, otherwise a guess from the name
+    that is never an inline type.
+    """
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    guessed, _encoding = mimetypes.guess_type(name or '')
+    if guessed is None or guessed in INLINE_TYPES:
+        return 'application/octet-stream'
+    return guessed[:100]
+
+
+def relative_path(sha256):
+    return os.path.join(sha256[:2], sha256)
+
+
+def path_for(stored):
+    return os.path.join(FILE_STORAGE_DIR, relative_path(stored.sha256))
+
+
+def save_upload(upload, owner=None):
+    """
+    Streams an UploadedFile to disk while hashing it and returns its
+    StoredFile. Identical content is kept once, whatever the file name.
+    """
+    if upload.size is not None and upload.size > FILE_UPLOAD_MAX_BYTES:
+        raise FileTooLarge(upload.size)
+    os.makedirs(FILE_STORAGE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    fd, tmp_path = tempfile.mkstemp(dir=FILE_STORAGE_DIR, prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in upload.chunks():
+                size += len(chunk)
+                if size > FILE_UPLOAD_MAX_BYTES:
+                    raise FileTooLarge(size)
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        final_path = os.path.join(FILE_STORAGE_DIR, relative_path(sha256))
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    name = os.path.basename(upload.name or 'file')[:255]
+    return StoredFile.objects.create(
+        name=name,
+        content_type=detect_content_type(head, name),
+        size=size,
+        sha256=sha256,
+        uploaded_by=owner,
+    )
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single 'bytes=a-b' range, None when the
+    header is absent or not one we serve whole-file for (multi-range,
+    other units), and ValueError when it can't be satisfied.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def iter_range(f, start, end, block_size=STREAM_BLOCK_SIZE):
+    """Blocks of the open file f from start to end inclusive; closes f when done"""
+    with f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def file_response(request, stored, as_attachment=False):
+    """Streams a StoredFile; 206 for a satisfiable Range, 416 otherwise, 404 when its bytes are gone"""
+    path = path_for(stored)
+    content_type = stored.content_type or 'application/octet-stream'
+    # rows from before detect_content_type carry whatever the uploader claimed
+    inline = content_type in INLINE_TYPES and not as_attachment
+    disposition = content_disposition_header(not inline, stored.name)
+
+    if FILE_SENDFILE_HEADER:
+        # the front-end server reads the file and handles Range itself
+        response = HttpResponse(content_type=content_type)
+        response[FILE_SENDFILE_HEADER] = FILE_SENDFILE_PREFIX + relative_path(stored.sha256).replace(os.sep, '/')
+        response['Content-Disposition'] = disposition
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+    try:
+        byte_range = parse_range(request.headers.get('Range'), stored.size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stored.size}'
+        return response
+
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        # the row outlived its bytes (storage wiped or restored without them)
+        return JsonResponse({"message": "Not Found"}, status=404)
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(iter_range(f, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{stored.size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
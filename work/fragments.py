@@ -0,0 +1,73 @@
+"""
+Keys for the {% cache %} fragments in contact_list.html, user_list.html
+and menu.html. A table's key carries a version, so a write retires every
+cached page of it at once instead of waiting for the TTL:
+
+- contact tables reuse the contact list versions from work.cache, bumped
+  by the Contact save/delete and bulk signals;
+- the user table has its own version, bumped here on User and UserProfile
+  saves and deletes.
+
+The menu is keyed by (user, role) directly in the template.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import cache as contact_cache
+from .models import UserProfile
+
+FRAGMENT_CACHE_TTL = getattr(settings, 'FRAGMENT_CACHE_TTL', 300)
+
+USERS_VERSION_KEY = 'fragments:ver:users'
+
+
+def contact_table_key(owner_id, page):
+    """owner_id None is the admin view of every contact; page is a number or a cursor"""
+    scope = owner_id if owner_id is not None else contact_cache.ALL_SCOPE
+    return f'{scope}:{contact_cache.list_version(scope)}:{page}'
+
+
+def users_version():
+    version = cache.get(USERS_VERSION_KEY)
+    if version is None:
+        cache.add(USERS_VERSION_KEY, 1, None)
+        version = cache.get(USERS_VERSION_KEY, 1)
+    return version
+
+
+def user_table_key(viewer_id, page):
+    """The viewing admin is part of the key: their own row shows 'Current User' instead of Demote"""
+    return f'{users_version()}:{viewer_id}:{page}'
+
+
+def bump_users_version():
+    try:
+        cache.incr(USERS_VERSION_KEY)
+    except ValueError:
+        cache.set(USERS_VERSION_KEY, 2, None)
+
+
+def fragment_key(name, *vary_on):
+    """The key {% cache ttl name vary_on... %} uses, for benchmarks and manual purges"""
+    return make_template_fragment_key(name, vary_on)
+
+
+# bumped once the write commits, so a render in between can't cache the old rows under the new version
+@receiver(post_save, sender=User)
+def invalidate_user_table_on_user_save(sender, instance, using, update_fields=None, **kwargs):
+    # logins only touch last_login, which the table doesn't show
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    transaction.on_commit(bump_users_version, using=using)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=User)
+def invalidate_user_table(sender, instance, using, **kwargs):
+    transaction.on_commit(bump_users_version, using=using)
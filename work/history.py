@@ -0,0 +1,159 @@
+"""
+Backward-scrolling chat history for /api/im/history.
+
+Pages are keyset cursors over (send_time, id), newest first, served from
+message_chat_time_idx without OFFSET, so page 1000 costs the same as page 1.
+Recently served pages of hot chats are kept in a small in-process LRU.
+"""
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone as dt_timezone
+from time import monotonic
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Message
+from .pagination import CursorPaginator, page_size_from
+from .serializers import MessageSerializer
+
+HISTORY_PAGE_SIZE = getattr(settings, 'MESSAGE_HISTORY_PAGE_SIZE', 30)
+HISTORY_MAX_PAGE_SIZE = getattr(settings, 'MESSAGE_HISTORY_MAX_PAGE_SIZE', 200)
+HISTORY_CACHE_PAGES = getattr(settings, 'MESSAGE_HISTORY_CACHE_PAGES', 256)
+# the newest page changes with every message and other workers' writes
+# don't reach this process' LRU, so it is only reused for a moment
+HISTORY_HEAD_TTL = getattr(settings, 'MESSAGE_HISTORY_HEAD_TTL', 2)
+
+ORDERING = ('-send_time', '-id')
+
+
+class InvalidHistoryRequest(Exception):
+    pass
+
+
+class PageLRU:
+    """Rendered history pages by request key, evicting the least recently used"""
+
+    def __init__(self, maxsize=HISTORY_CACHE_PAGES):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()
+        self.by_chat = defaultdict(set)
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.pages.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < monotonic()):
+                self.misses += 1
+                return None
+            self.pages.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, payload, ttl=None):
+        with self.lock:
+            self.pages[key] = (monotonic() + ttl if ttl is not None else None, payload)
+            self.pages.move_to_end(key)
+            self.by_chat[key[0]].add(key)
+            while len(self.pages) > self.maxsize:
+                old, _ = self.pages.popitem(last=False)
+                self._forget(old)
+
+    def discard_chat(self, chat):
+        with self.lock:
+            for key in self.by_chat.pop(chat, ()):
+                self.pages.pop(key, None)
+
+    def _forget(self, key):
+        keys = self.by_chat.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.by_chat[key[0]]
+
+    def stats(self):
+        with self.lock:
+            return {'pages': len(self.pages), 'chats': len(self.by_chat), 'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        with self.lock:
+            self.pages.clear()
+            self.by_chat.clear()
+            self.hits = self.misses = 0
+
+
+pages = PageLRU()
+
+
+def parse_time(value):
+    """Millisecond timestamp (as used by sendTime) to an aware datetime"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromtimestamp(int(value) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise InvalidHistoryRequest('Invalid time window')
+
+
+def compact_rows(data):
+    """
+    Drops what the client can infer: empty status/mentioned/original, the
+    TXT type, and the sender whenever it repeats the previous (newer) row.
+    """
+    rows = []
+    previous_sender = object()
+    for item in data:
+        row = {'id': item['id'], 'sendTime': item['sendTime'], 'content': item['content']}
+        if item['sender'] != previous_sender:
+            row['sender'] = previous_sender = item['sender']
+        if item['type'] != 'TXT':
+            row['type'] = item['type']
+        for field in ('status', 'mentioned', 'original'):
+            if item[field]:
+                row[field] = item[field]
+        rows.append(row)
+    return rows
+
+
+def history_page(chat_type, chat_id, cursor=None, since=None, until=None, page_size=None, compact=True):
+    """
+    One page of a chat, newest first. `since`/`until` bound the window in
+    sendTime milliseconds; `next` continues towards older messages and is
+    None at the start of the window. Raises InvalidCursor for a bad cursor.
+    """
+    since_at, until_at = parse_time(since), parse_time(until)
+    page_size = page_size_from(page_size, HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE)
+    chat = (chat_type, chat_id)
+    key = (chat, cursor, since, until, page_size, bool(compact))
+    payload = pages.get(key)
+    if payload is not None:
+        return payload
+
+    messages = Message.objects.filter(chat_type=chat_type, chat_id=chat_id)
+    if since_at is not None:
+        messages = messages.filter(send_time__gte=since_at)
+    if until_at is not None:
+        messages = messages.filter(send_time__lt=until_at)
+    page = CursorPaginator(messages, ordering=ORDERING, page_size=page_size).page(cursor)
+
+    data = MessageSerializer(page.object_list, many=True).data
+    payload = {
+        'chatType': chat_type,
+        'chatId': chat_id,
+        'pageSize': page_size,
+        'compact': bool(compact),
+        'next': page.next_cursor,
+        'results': compact_rows(data) if compact else data,
+    }
+    # pages reached through a cursor, or closed by `until`, only change on edits
+    head = cursor is None and (until_at is None or until_at > datetime.now(dt_timezone.utc))
+    pages.set(key, payload, HISTORY_HEAD_TTL if head else None)
+    return payload
+
+
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_chat_pages(sender, instance, **kwargs):
+    pages.discard_chat((instance.chat_type, instance.chat_id))
@@ -0,0 +1,49 @@
+"""
+Image work run inside the thumbnail process pool. Kept free of Django
+imports so spawned workers start quickly; Pillow is optional and only
+imported here.
+"""
+import os
+import tempfile
+
+
+def pillow_available():
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class NotAnImage(Exception):
+    """The source isn't an image Pillow can read, or is a decompression bomb"""
+
+
+def render_thumbnail(source, target, max_size, quality):
+    """
+    Writes a JPEG no larger than max_size x max_size; atomic, so readers
+    never see half a file. Raises NotAnImage for bad input and lets I/O
+    errors through as they are.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    
+    try:
+        image = Image.open(source)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        # re-raised as our own type: Pillow's exceptions don't always pickle back from the pool
+        raise NotAnImage(str(e)) from None
+    with image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.thumb-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                image.save(out, 'JPEG', quality=quality, optimize=True)
+            os.replace(tmp_path, target)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return os.path.getsize(target)
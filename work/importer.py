@@ -0,0 +1,190 @@
+"""
+Streaming contact import from CSV or vCard, shared by the import_contacts
+command and the api/import/ endpoint.
+
+Input is read line by line and handled a chunk at a time: each chunk is
+validated with validate_rows() and its valid rows are inserted with
+bulk_create() in their own transaction, so memory stays bounded by the
+chunk size however large the file is. Invalid rows are skipped and
+reported with their line (CSV) or card (vCard) number.
+"""
+import csv
+import io
+from time import perf_counter
+
+from django.conf import settings
+from django.db import transaction
+
+from . import sharding
+from .models import Contact
+from .signals import contacts_bulk_saved
+from .validators import validate_rows
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'CONTACT_IMPORT_CHUNK_SIZE', 1000)
+IMPORT_BATCH_SIZE = 500
+# errors past this many are counted but not kept
+IMPORT_MAX_ERRORS = getattr(settings, 'CONTACT_IMPORT_MAX_ERRORS', 1000)
+# api/import/ only, the command takes any size
+IMPORT_MAX_BYTES = getattr(settings, 'CONTACT_IMPORT_MAX_BYTES', 10 * 1024 * 1024)
+IMPORT_MAX_ROWS = getattr(settings, 'CONTACT_IMPORT_MAX_ROWS', 50000)
+
+CSV_COLUMNS = {
+    'name': 'name', 'full name': 'name', 'fn': 'name',
+    'phone': 'phone', 'telephone': 'phone', 'tel': 'phone', 'mobile': 'phone',
+    'email': 'email', 'e-mail': 'email', 'mail': 'email',
+    'additional': 'additional', 'notes': 'additional', 'note': 'additional',
+}
+VCARD_PROPERTIES = {'FN': 'name', 'TEL': 'phone', 'EMAIL': 'email', 'NOTE': 'additional'}
+FORMATS = ('csv', 'vcard')
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+class ImportResult:
+    __slots__ = ('imported', 'failed', 'errors', 'elapsed')
+
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows(self):
+        return self.imported + self.failed
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def detect_format(filename):
+    return 'vcard' if str(filename).lower().endswith(('.vcf', '.vcard')) else 'csv'
+
+
+def iter_csv(lines):
+    """(line number, row) pairs; headers are matched case-insensitively, unknown columns ignored"""
+    reader = csv.reader(lines)
+    try:
+        header = next(reader)
+        columns = [CSV_COLUMNS.get(name.strip().lower()) for name in header]
+        if 'name' not in columns:
+            raise ImportFormatError('CSV header needs a name column')
+        for values in reader:
+            if not any(values):
+                continue
+            yield reader.line_num, {field: value for field, value in zip(columns, values) if field is not None}
+    except StopIteration:
+        return
+    except csv.Error as e:
+        raise ImportFormatError(f'line {reader.line_num}: {e}')
+
+
+def _vcard_unescape(value):
+    return value.replace('\\n', '\n').replace('\\N', '\n').replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
+
+
+def _unfold(lines):
+    """Joins RFC 6350 folded lines (continuations start with a space or tab)"""
+    pending = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and pending is not None:
+            pending += line[1:]
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending is not None:
+        yield pending
+
+
+def iter_vcard(lines):
+    """(card number, row) pairs; the first TEL and EMAIL of a card are used"""
+    card = None
+    number = 0
+    for line in _unfold(lines):
+        upper = line.upper()
+        if upper == 'BEGIN:VCARD':
+            card = {}
+            number += 1
+        elif upper == 'END:VCARD':
+            if card is not None:
+                yield number, card
+            card = None
+        elif card is not None and ':' in line:
+            key, value = line.split(':', 1)
+            # 'item1.TEL;TYPE=cell' -> 'TEL'
+            name = key.split(';', 1)[0].rsplit('.', 1)[-1].upper()
+            if name == 'N' and 'name' not in card:
+                parts = [part for part in _vcard_unescape(value).split(';')[:2] if part]
+                card['name'] = ' '.join(reversed(parts))
+                continue
+            field = VCARD_PROPERTIES.get(name)
+            if field is not None and (field not in card or name == 'FN'):
+                card[field] = _vcard_unescape(value)
+
+
+PARSERS = {'csv': iter_csv, 'vcard': iter_vcard}
+
+
+def _flush(chunk, owner, result):
+    numbers = [number for number, _row in chunk]
+    cleaned, errors = validate_rows([row for _number, row in chunk])
+    contacts = []
+    for number, item, item_errors in zip(numbers, cleaned, errors):
+        if item_errors:
+            result.failed += 1
+            if len(result.errors) < IMPORT_MAX_ERRORS:
+                result.errors.append({'row': number, 'errors': item_errors})
+        else:
+            contacts.append(Contact(user=owner, **item))
+    if contacts:
+        with transaction.atomic(using=sharding.shard_for_user(owner.pk if owner else None)):
+            Contact.objects.bulk_create(contacts, batch_size=IMPORT_BATCH_SIZE)
+            contacts_bulk_saved.send(sender=Contact, instances=contacts)
+        result.imported += len(contacts)
+
+
+def import_contacts(lines, fmt='csv', owner=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Imports contacts from an iterable of text lines (an open text file).
+    progress, if given, is called with the ImportResult after each chunk.
+    Chunks already inserted stay inserted if a later one fails.
+    """
+    if fmt not in PARSERS:
+        raise ImportFormatError(f'Unknown format {fmt!r}, expected one of {", ".join(FORMATS)}')
+    result = ImportResult()
+    begin = perf_counter()
+    chunk = []
+    for entry in PARSERS[fmt](lines):
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            _flush(chunk, owner, result)
+            chunk = []
+            result.elapsed = perf_counter() - begin
+            if progress:
+                progress(result)
+    if chunk:
+        _flush(chunk, owner, result)
+    result.elapsed = perf_counter() - begin
+    if progress:
+        progress(result)
+    return result
+
+
+def count_rows(lines, fmt='csv'):
+    """Rows (or cards) an import of lines would read, without touching the database"""
+    if fmt not in PARSERS:
+        raise ImportFormatError(f'Unknown format {fmt!r}, expected one of {", ".join(FORMATS)}')
+    return sum(1 for _entry in PARSERS[fmt](lines))
+
+
+def text_stream(binary):
+    """Decodes an uploaded file lazily; utf-8-sig drops the BOM spreadsheet exports add"""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', errors='replace', newline='')
@@ -0,0 +1,57 @@
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import sharding
+from .models import Contact, UserProfile
+from .signals import contacts_bulk_saved
+
+SEED_BATCH_SIZE = 1000
+
+
+def seed(users, contacts_per_user, prefix='load', password='load123', batch_size=SEED_BATCH_SIZE, progress=None):
+    """
+    Creates users prefix0..prefixN-1, each owning contacts_per_user contacts,
+    with bulk inserts only. The password is hashed once and shared.
+    Returns the created users.
+    """
+    hashed = make_password(password)
+    with transaction.atomic():
+        start = User.objects.filter(username__startswith=prefix).count()
+        created = User.objects.bulk_create([
+            User(username=f'{prefix}{i}', email=f'{prefix}{i}@load.test', password=hashed)
+            for i in range(start, start + users)
+        ], batch_size=batch_size)
+        # bulk_create skips post_save, so the profiles are created here
+        created = list(User.objects.filter(username__in=[u.username for u in created]))
+        UserProfile.objects.bulk_create([UserProfile(user=u) for u in created], batch_size=batch_size)
+    
+    total = 0
+    for user in created:
+        pending = []
+        for i in range(contacts_per_user):
+            pending.append(Contact(
+                user=user,
+                name=f'{user.username} contact {i}',
+                phone=f'+1555{i:07d}',
+                email=f'c{i}.{user.username}@load.test',
+                additional='seeded',
+            ))
+            if len(pending) >= batch_size:
+                total += _flush(pending, batch_size)
+                pending = []
+                if progress:
+                    progress(total)
+        if pending:
+            total += _flush(pending, batch_size)
+            if progress:
+                progress(total)
+    return created
+
+
+def _flush(contacts, batch_size):
+    # one owner per batch, so one shard
+    with transaction.atomic(using=sharding.shard_for_user(contacts[0].user_id)):
+        Contact.objects.bulk_create(contacts, batch_size=batch_size)
+        contacts_bulk_saved.send(sender=Contact, instances=contacts)
+    return len(contacts)
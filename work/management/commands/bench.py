@@ -0,0 +1,64 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from work import benchmark
+from work.loadgen import seed
+from work.models import Contact
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the HTML and api/* routes against a throwaway seeded test database'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='Seeded users (default: 5)')
+        parser.add_argument('--contacts', type=int, default=200, help='Contacts per user (default: 200)')
+        parser.add_argument('--requests', type=int, default=100, help='Measured requests per route (default: 100)')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per route (default: 5)')
+        parser.add_argument('--routes', type=str, default='', help='Comma separated route names, all by default')
+        parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+        parser.add_argument('--compare', type=str, help='Previous --output file to diff against')
+    
+    def handle(self, *args, **options):
+        for name in ('users', 'requests'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1')
+        if options['contacts'] < 0 or options['warmup'] < 0:
+            raise CommandError('--contacts and --warmup cannot be negative')
+        only = {name.strip() for name in options['routes'].split(',') if name.strip()}
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            users = seed(options['users'], options['contacts'], prefix='bench', password='bench123')
+            ids = list(Contact.objects.values_list('id', flat=True))
+            routes = benchmark.default_routes(ids)
+            result = {
+                'meta': benchmark.metadata(
+                    users=options['users'],
+                    contacts=options['contacts'],
+                    requests=options['requests'],
+                    warmup=options['warmup'],
+                ),
+                'routes': benchmark.run(users[0], 'bench123', routes, options['requests'], options['warmup'], only),
+            }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        
+        self.stdout.write(f'{"route":<16} {"rps":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries":>8} {"errors":>7}')
+        for name, r in result['routes'].items():
+            self.stdout.write(
+                f'{name:<16} {r["rps"]:>9.1f} {r["p50_ms"]:>9.2f} {r["p95_ms"]:>9.2f} {r["p99_ms"]:>9.2f} '
+                f'{r["queries_mean"]:>8.1f} {r["errors"]:>7}'
+            )
+        
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Results written to {options["output"]}'))
+        
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+            self.stdout.write(f'vs {previous["meta"].get("revision")}:')
+            for name, delta in benchmark.compare(result, previous).items():
+                changes = ', '.join(f'{key} {value:+.1f}%' for key, value in delta.items())
+                self.stdout.write(f'  {name:<16} {changes}')
@@ -0,0 +1,83 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from work.loadgen import seed
+from work.models import Contact
+from work.profiling import percentile
+
+ROUTES = {
+    'get': lambda ids, i: f'/api/get/{ids[i * 7919 % len(ids)]}/',
+    'list-paged': lambda ids, i: f'/api/list-page/{i % 5 + 1}/',
+    'search': lambda ids, i: '/api/search/contact/',
+}
+
+
+def summarize(timings, elapsed):
+    ordered = sorted(timings)
+    return len(timings) / elapsed, percentile(ordered, 50), percentile(ordered, 95), percentile(ordered, 99)
+
+
+class Command(BaseCommand):
+    help = 'Concurrent throughput and latency of the sync (WSGI) api/* views against the async (ASGI) ones'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=20, help='In-flight requests (default: 20)')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per route and path (default: 400)')
+        parser.add_argument('--users', type=int, default=2, help='Seeded users (default: 2)')
+        parser.add_argument('--contacts', type=int, default=200, help='Contacts per user (default: 200)')
+    
+    def run_sync(self, path_for, total, concurrency):
+        def one(i):
+            client = Client()
+            begin = perf_counter()
+            client.get(path_for(i))
+            elapsed = perf_counter() - begin
+            connections.close_all()
+            return elapsed * 1000
+        
+        begin = perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = list(pool.map(one, range(total)))
+        return summarize(timings, perf_counter() - begin)
+    
+    def run_async(self, path_for, total, concurrency):
+        async def main():
+            client = AsyncClient()
+            gate = asyncio.Semaphore(concurrency)
+            
+            async def one(i):
+                async with gate:
+                    begin = perf_counter()
+                    await client.get(path_for(i))
+                    return (perf_counter() - begin) * 1000
+            
+            begin = perf_counter()
+            timings = await asyncio.gather(*(one(i) for i in range(total)))
+            return summarize(timings, perf_counter() - begin)
+        
+        return asyncio.run(main())
+    
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            seed(options['users'], options['contacts'], prefix='bench')
+            ids = list(Contact.objects.values_list('id', flat=True))
+            total, concurrency = options['requests'], options['concurrency']
+            
+            self.stdout.write(f'{"route":<12} {"path":<6} {"rps":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+            with override_settings(ALLOWED_HOSTS=['testserver'] + list(settings.ALLOWED_HOSTS), ADMISSION_CONTROL=False):
+                for name, build in ROUTES.items():
+                    runs = (
+                        ('wsgi', self.run_sync(lambda i: build(ids, i), total, concurrency)),
+                        ('asgi', self.run_async(lambda i: build(ids, i).replace('/api/', '/api/async/'), total, concurrency)),
+                    )
+                    for path, (rps, p50, p95, p99) in runs:
+                        self.stdout.write(f'{name:<12} {path:<6} {rps:>9.1f} {p50:>9.2f} {p95:>9.2f} {p99:>9.2f}')
+        finally:
+            teardown_databases(old_config, verbosity=0)
@@ -0,0 +1,62 @@
+import os
+import resource
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from work.importer import IMPORT_CHUNK_SIZE, import_contacts
+
+
+def write_csv(path, rows, invalid_every):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('name,phone,email,additional\n')
+        for i in range(rows):
+            email = 'broken' if invalid_every and i % invalid_every == 0 else f'import{i}@bench.test'
+            f.write(f'Import {i},+1 555 {i % 10000000:07d},{email},bench\n')
+
+
+def write_vcard(path, rows, invalid_every):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for i in range(rows):
+            email = 'broken' if invalid_every and i % invalid_every == 0 else f'import{i}@bench.test'
+            f.write(f'BEGIN:VCARD\r\nVERSION:3.0\r\nFN:Import {i}\r\nTEL;TYPE=cell:+1 555 {i % 10000000:07d}\r\n'
+                    f'EMAIL:{email}\r\nNOTE:bench\r\nEND:VCARD\r\n')
+
+
+class Command(BaseCommand):
+    help = 'Import throughput (rows/s) and peak memory for a generated CSV or vCard file on a throwaway database'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Rows in the generated file (default: 100000)')
+        parser.add_argument('--format', choices=('csv', 'vcard'), default='csv', help='File format (default: csv)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help=f'Rows per transaction (default: {IMPORT_CHUNK_SIZE})')
+        parser.add_argument('--invalid-every', type=int, default=100,
+                            help='Make every Nth row invalid, 0 for none (default: 100)')
+    
+    def handle(self, *args, **options):
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, 'contacts.csv' if options['format'] == 'csv' else 'contacts.vcf')
+        # an on-disk test database, so imported rows don't count towards the process' memory
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            writer = write_csv if options['format'] == 'csv' else write_vcard
+            writer(path, options['rows'], options['invalid_every'])
+            size = os.path.getsize(path)
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            # DEBUG keeps every query's SQL, which would dominate the memory figure
+            with override_settings(DEBUG=False), open(path, encoding='utf-8', newline='') as f:
+                result = import_contacts(f, options['format'], chunk_size=options['chunk_size'])
+            rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.stdout.write(f'file         {size / 1024 / 1024:.1f} MiB, {options["rows"]} rows ({options["format"]})')
+            self.stdout.write(f'imported     {result.imported} ({result.failed} rejected)')
+            self.stdout.write(f'elapsed      {result.elapsed:.2f}s')
+            self.stdout.write(f'throughput   {result.rate:.0f} rows/s')
+            # ru_maxrss is in KiB on Linux
+            self.stdout.write(f'peak rss     {rss_after / 1024:.1f} MiB (+{(rss_after - rss_before) / 1024:.1f} MiB)')
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,53 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+from work.fastpath import contact_data, contact_values
+from work.loadgen import seed
+from work.models import Contact
+from work.serializers import ContactSerializer
+
+
+class Command(BaseCommand):
+    help = 'Rows per second of ContactSerializer against the values_list fast path, with a byte-for-byte check'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Contacts to serialize (default: 5000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path, the best one is reported (default: 5)')
+    
+    def best(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            begin = perf_counter()
+            func()
+            timings.append(perf_counter() - begin)
+        return min(timings)
+    
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            seed(1, options['rows'], prefix='serbench')
+            queryset = Contact.objects.order_by('id')
+            instances = list(queryset)
+            renderer = JSONRenderer()
+            
+            expected = renderer.render(ContactSerializer(queryset, many=True).data)
+            for name, output in (('values', contact_values(queryset)), ('instances', contact_data(instances))):
+                if renderer.render(output) != expected:
+                    raise CommandError(f'fast path ({name}) output differs from ContactSerializer')
+            
+            paths = (
+                ('serializer, query + render', lambda: renderer.render(ContactSerializer(queryset.all(), many=True).data)),
+                ('fast path, query + render', lambda: renderer.render(contact_values(queryset.all()))),
+                ('serializer, loaded rows', lambda: ContactSerializer(instances, many=True).data),
+                ('fast path, loaded rows', lambda: contact_data(instances)),
+            )
+            rows = len(instances)
+            self.stdout.write(f'{"path":<28} {"ms":>9} {"rows/s":>12}')
+            for name, func in paths:
+                elapsed = self.best(func, options['repeat'])
+                self.stdout.write(f'{name:<28} {elapsed * 1000:>9.2f} {rows / elapsed:>12.0f}')
+            self.stdout.write(self.style.SUCCESS(f'{rows} rows, output identical ({len(expected)} bytes)'))
+        finally:
+            teardown_databases(old_config, verbosity=0)
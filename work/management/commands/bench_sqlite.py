@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from work import dbbench
+
+
+class Command(BaseCommand):
+    help = 'Concurrent read/write throughput of the SQLite profiles (default vs production) on a scratch file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=['default', 'production', 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=4, help='Worker processes (default: 4)')
+        parser.add_argument('--seconds', type=float, default=5, help='Run time per profile (default: 5)')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of writes (default: 0.2)')
+        parser.add_argument('--users', type=int, default=4, help='Seeded users (default: 4)')
+        parser.add_argument('--contacts', type=int, default=500, help='Contacts per user (default: 500)')
+    
+    def manage(self, db_path, profile, *args):
+        env = dict(os.environ, PYCHATTY_DB_PATH=str(db_path), PYCHATTY_DB_PROFILE=profile)
+        done = subprocess.run(
+            [sys.executable, 'manage.py', *args],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if done.returncode != 0:
+            raise CommandError(done.stderr.strip())
+    
+    def handle(self, *args, **options):
+        # an empty table or no time would leave the workers nothing to time
+        for name in ('workers', 'users', 'contacts'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        if options['seconds'] <= 0:
+            raise CommandError('--seconds must be positive')
+        if not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--write-ratio must be between 0 and 1')
+        profiles = ['default', 'production'] if options['profile'] == 'both' else [options['profile']]
+        context = multiprocessing.get_context('spawn')
+        
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as tmp:
+                db_path = os.path.join(tmp, 'bench.sqlite3')
+                self.manage(db_path, profile, 'migrate', '--verbosity', '0')
+                self.manage(db_path, profile, 'seed_contacts',
+                            '--users', str(options['users']), '--contacts', str(options['contacts']))
+                
+                results = context.Queue()
+                workers = [
+                    context.Process(target=dbbench.worker, args=(
+                        db_path, profile, options['seconds'], options['write_ratio'], seed, results))
+                    for seed in range(options['workers'])
+                ]
+                for process in workers:
+                    process.start()
+                totals = {'reads': 0, 'writes': 0, 'errors': 0}
+                for _ in workers:
+                    for key, value in results.get().items():
+                        totals[key] += value
+                for process in workers:
+                    process.join()
+            
+            seconds = options['seconds']
+            self.stdout.write(
+                f'{profile:<11} workers {options["workers"]}  '
+                f'reads/s {totals["reads"] / seconds:9.1f}  writes/s {totals["writes"] / seconds:8.1f}  '
+                f'locked errors {totals["errors"]}'
+            )
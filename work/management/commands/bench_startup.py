@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from work.profiling import percentile
+
+# Runs in a fresh interpreter, so nothing is imported or cached yet
+SNIPPET = '''
+import json, os, time
+t0 = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+t1 = time.perf_counter()
+django.setup()
+t2 = time.perf_counter()
+from django.db import connections
+print(json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "setup_ms": (t2 - t1) * 1000,
+    "db_connected": any(c.connection is not None for c in connections.all(initialized_only=True)),
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start (settings import plus django.setup()) in fresh interpreters'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=10, help='Number of interpreters to start (default: 10)')
+        parser.add_argument('--json', action='store_true', help='Print the raw samples as JSON')
+    
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'pychatty.settings'))
+        samples = []
+        for _ in range(options['runs']):
+            done = subprocess.run(
+                [sys.executable, '-c', SNIPPET],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if done.returncode != 0:
+                raise CommandError(done.stderr.strip())
+            samples.append(json.loads(done.stdout.strip().splitlines()[-1]))
+        
+        if options['json']:
+            self.stdout.write(json.dumps(samples, indent=2))
+            return
+        
+        for key in ('import_ms', 'setup_ms'):
+            ordered = sorted(sample[key] for sample in samples)
+            self.stdout.write(
+                f'{key:<10} p50 {percentile(ordered, 50):8.2f}  p95 {percentile(ordered, 95):8.2f}  max {ordered[-1]:8.2f}'
+            )
+        connected = sum(sample['db_connected'] for sample in samples)
+        if connected:
+            self.stdout.write(self.style.WARNING(f'{connected}/{len(samples)} runs opened a database connection during setup'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No database connection opened during setup'))
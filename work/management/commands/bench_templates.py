@@ -0,0 +1,70 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from work import profiling
+from work.fragments import contact_table_key, fragment_key, user_table_key
+from work.loadgen import seed
+from work.models import UserProfile
+from work.roles import get_role
+
+PASSWORD = 'bench123'
+
+
+class Command(BaseCommand):
+    help = 'Render time of contact_list and user_list with the fragment cache cold (every fragment re-rendered) and warm'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per page and mode (default: 200)')
+        parser.add_argument('--users', type=int, default=50, help='Seeded users (default: 50)')
+        parser.add_argument('--contacts', type=int, default=200, help='Contacts per user (default: 200)')
+    
+    def fragment_keys(self, user, page, path):
+        keys = [fragment_key('menu', user.pk, user.username, get_role(user))]
+        if path.startswith('/admin/users/'):
+            keys.append(fragment_key('user_table', user_table_key(user.pk, page)))
+        else:
+            keys.append(fragment_key('contact_table', contact_table_key(None, page)))
+        return keys
+    
+    def measure(self, client, user, path, page, total, cold):
+        wall = template = 0.0
+        for _ in range(total):
+            if cold:
+                cache.delete_many(self.fragment_keys(user, page, path))
+            profile, token = profiling.start()
+            begin = perf_counter()
+            client.get(path)
+            wall += perf_counter() - begin
+            profiling.stop(token)
+            template += profile.template
+        return wall / total * 1000, template / total * 1000
+    
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            users = seed(options['users'], options['contacts'], prefix='tplbench', password=PASSWORD)
+            admin = users[0]
+            UserProfile.objects.filter(user=admin).update(user_type='admin')
+            profiling.install_hooks()
+            
+            with override_settings(ALLOWED_HOSTS=['testserver'] + list(settings.ALLOWED_HOSTS)):
+                client = Client()
+                client.login(username=admin.username, password=PASSWORD)
+                admin = User.objects.get(pk=admin.pk)
+                pages = (
+                    ('contact_list', '/contacts/?page=3', 3),
+                    ('user_list', '/admin/users/?page=2', 2),
+                )
+                self.stdout.write(f'{"page":<14} {"fragments":<10} {"wall ms":>9} {"template ms":>12}')
+                for name, path, page in pages:
+                    client.get(path)
+                    for label, cold in (('cold', True), ('warm', False)):
+                        wall, template = self.measure(client, admin, path, page, options['requests'], cold)
+                        self.stdout.write(f'{name:<14} {label:<10} {wall:>9.2f} {template:>12.2f}')
+        finally:
+            teardown_databases(old_config, verbosity=0)
@@ -0,0 +1,65 @@
+import random
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+from work.serializers import ContactSerializer
+from work.validators import validate_rows
+
+
+def make_rows(count, invalid_ratio, seed=0):
+    """Import-like rows; about invalid_ratio of them carry one bad field"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        row = {
+            'name': f'  Contact {i} ',
+            'phone': f'+1 (555) {i % 1000:03d}-{i % 10000:04d}',
+            'email': f'Contact{i}@Example.test',
+            'additional': 'imported',
+        }
+        if rng.random() < invalid_ratio:
+            field, value = rng.choice([('email', 'not-an-email'), ('phone', 'call me'), ('name', ''), ('name', 'x' * 101)])
+            row[field] = value
+        rows.append(row)
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import validation throughput: ContactSerializer(many=True) against work.validators.validate_rows'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Rows per batch (default: 10000)')
+        parser.add_argument('--invalid', type=float, default=0.1, help='Share of invalid rows (default: 0.1)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path, the best one is reported (default: 3)')
+    
+    def handle(self, *args, **options):
+        rows = make_rows(options['rows'], options['invalid'])
+        
+        serializer = ContactSerializer(data=rows, many=True)
+        serializer.is_valid()
+        errors = serializer.errors
+        if isinstance(errors, dict):
+            # DRF keys ListSerializer errors by row index
+            errors = [errors.get(i, {}) for i in range(len(rows))]
+        serializer_invalid = {i for i, e in enumerate(errors) if e}
+        cleaned, row_errors = validate_rows(rows)
+        invalid = {i for i, e in enumerate(row_errors) if e}
+        if invalid != serializer_invalid:
+            raise CommandError(f'validators disagree with ContactSerializer on {len(invalid ^ serializer_invalid)} rows')
+        
+        def run_serializer():
+            ContactSerializer(data=rows, many=True).is_valid()
+        
+        def run_validators():
+            validate_rows(rows)
+        
+        self.stdout.write(f'{"path":<12} {"ms":>9} {"rows/s":>12}')
+        for name, func in (('serializer', run_serializer), ('validators', run_validators)):
+            timings = []
+            for _ in range(options['repeat']):
+                begin = perf_counter()
+                func()
+                timings.append(perf_counter() - begin)
+            best = min(timings)
+            self.stdout.write(f'{name:<12} {best * 1000:>9.2f} {len(rows) / best:>12.0f}')
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} rows, {len(invalid)} invalid, both paths agree'))
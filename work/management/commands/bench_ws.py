@@ -0,0 +1,100 @@
+import asyncio
+import json
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from work.broker import get_broker
+from work.profiling import percentile
+from work.realtime import websocket_application
+
+
+class SimulatedClient:
+    """One websocket connection driven straight through the ASGI callable"""
+    
+    def __init__(self, path, cookie, latencies):
+        self.incoming = asyncio.Queue()
+        self.latencies = latencies
+        self.accepted = asyncio.Event()
+        self.closed_with = None
+        scope = {'type': 'websocket', 'path': path, 'headers': [(b'cookie', cookie)]}
+        self.incoming.put_nowait({'type': 'websocket.connect'})
+        self.task = asyncio.ensure_future(websocket_application(scope, self.incoming.get, self.on_send))
+    
+    async def on_send(self, event):
+        if event['type'] == 'websocket.accept':
+            self.accepted.set()
+        elif event['type'] == 'websocket.close':
+            self.closed_with = event.get('code')
+            self.accepted.set()
+        elif event['type'] == 'websocket.send':
+            packet = json.loads(event['text'])
+            if 'content' in packet:
+                self.latencies.append((perf_counter() - float(packet['content'])) * 1000)
+    
+    def send(self, payload):
+        self.incoming.put_nowait({'type': 'websocket.receive', 'text': json.dumps(payload)})
+    
+    def disconnect(self):
+        self.incoming.put_nowait({'type': 'websocket.disconnect'})
+
+
+class Command(BaseCommand):
+    help = 'Websocket fan-out load test: many simulated clients on a few group chats, in-process'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=2000, help='Concurrent connections (default: 2000)')
+        parser.add_argument('--chats', type=int, default=20, help='Group chats to spread them over (default: 20)')
+        parser.add_argument('--messages', type=int, default=50, help='Messages sent per chat (default: 50)')
+    
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            User.objects.create_user('wsbench', password='wsbench123')
+            with override_settings(ALLOWED_HOSTS=['testserver'] + list(settings.ALLOWED_HOSTS)):
+                client = Client()
+                client.login(username='wsbench', password='wsbench123')
+            cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'.encode()
+            asyncio.run(self.run(cookie, options))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+    
+    async def run(self, cookie, options):
+        latencies = []
+        chats = [f'/ws/msg/group/bench{i}/' for i in range(options['chats'])]
+        
+        begin = perf_counter()
+        clients = [SimulatedClient(chats[i % len(chats)], cookie, latencies) for i in range(options['clients'])]
+        await asyncio.gather(*(c.accepted.wait() for c in clients))
+        connect_time = perf_counter() - begin
+        refused = sum(1 for c in clients if c.closed_with is not None)
+        
+        senders = clients[:len(chats)]
+        expected = options['messages'] * (options['clients'] - refused)
+        begin = perf_counter()
+        for _ in range(options['messages']):
+            for sender in senders:
+                sender.send({'type': 'TXT', 'content': repr(perf_counter())})
+            await asyncio.sleep(0)
+        while len(latencies) < expected and perf_counter() - begin < 60:
+            await asyncio.sleep(0.01)
+        elapsed = perf_counter() - begin
+        
+        for c in clients:
+            c.disconnect()
+        await asyncio.gather(*(c.task for c in clients), return_exceptions=True)
+        
+        ordered = sorted(latencies)
+        stats = get_broker().stats()
+        self.stdout.write(f'connections  {options["clients"]} ({refused} refused) in {connect_time:.2f}s')
+        self.stdout.write(f'messages     {options["messages"] * len(senders)} stored and published')
+        self.stdout.write(f'deliveries   {len(latencies)}/{expected} in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s)')
+        if ordered:
+            self.stdout.write(
+                f'latency ms   p50 {percentile(ordered, 50):.2f}  p95 {percentile(ordered, 95):.2f}  '
+                f'p99 {percentile(ordered, 99):.2f}'
+            )
+        self.stdout.write(f'broker       {stats}')
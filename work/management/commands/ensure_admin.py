@@ -1,10 +1,10 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
 from work.models import UserProfile
 
 
 class Command(BaseCommand):
-    help = 'Ensure admin user exists with administrator type'
+    help = 'Ensure admin user exists with administrator type (idempotent, run once per deploy)'
     
     def add_arguments(self, parser):
         parser.add_argument(
@@ -52,13 +52,11 @@ class Command(BaseCommand):
                         self.style.SUCCESS('Admin user already exists with administrator type')
                     )
                 
-                # Update password if provided
-                if password != 'admin123':
+                # Update password if a different one was provided
+                if password != 'admin123' and not admin_user.check_password(password):
                     admin_user.set_password(password)
                     admin_user.save()
                     self.stdout.write('Admin user password updated')
         
         except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Error creating admin user: {e}')
-            )
\ No newline at end of file
+            raise CommandError(f'Error creating admin user: {e}')
\ No newline at end of file
@@ -0,0 +1,54 @@
+from argparse import ArgumentTypeError
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from work.importer import FORMATS, IMPORT_CHUNK_SIZE, ImportFormatError, detect_format, import_contacts
+
+
+def positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ArgumentTypeError(f'{value!r} is not an integer')
+    if number < 1:
+        raise ArgumentTypeError(f'{value!r} is not a positive integer')
+    return number
+
+
+class Command(BaseCommand):
+    help = 'Stream contacts from a CSV or vCard file into the database in chunked bulk inserts'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV (header: name, phone, email, additional) or .vcf file')
+        parser.add_argument('--owner', type=str, help='Username the contacts belong to (default: none)')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--chunk-size', type=positive_int, default=IMPORT_CHUNK_SIZE,
+                            help=f'Rows validated and inserted per transaction (default: {IMPORT_CHUNK_SIZE})')
+        parser.add_argument('--show-errors', type=int, default=20, help='Row errors to print (default: 20)')
+    
+    def handle(self, *args, **options):
+        owner = None
+        if options['owner']:
+            owner = User.objects.filter(username=options['owner']).first()
+            if owner is None:
+                raise CommandError(f'No user named {options["owner"]!r}')
+        fmt = options['format'] or detect_format(options['path'])
+        
+        def progress(result):
+            self.stdout.write(f'\r{result.imported} imported, {result.failed} failed, {result.rate:.0f} rows/s', ending='')
+        
+        try:
+            with open(options['path'], encoding='utf-8-sig', errors='replace', newline='') as f:
+                result = import_contacts(f, fmt, owner, options['chunk_size'], progress)
+        except OSError as e:
+            raise CommandError(str(e))
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+        self.stdout.write('')
+        
+        for entry in result.errors[:options['show_errors']]:
+            self.stdout.write(self.style.WARNING(f'row {entry["row"]}: {entry["errors"]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.imported} contacts ({result.failed} rejected) in {result.elapsed:.1f}s, '
+            f'{result.rate:.0f} rows/s'
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from work.sync import prune_tombstones, TOMBSTONE_RETENTION_DAYS
+
+
+class Command(BaseCommand):
+    help = f'Delete contact tombstones older than the sync retention ({TOMBSTONE_RETENTION_DAYS} days)'
+    
+    def handle(self, *args, **options):
+        count = prune_tombstones()
+        self.stdout.write(
+            self.style.SUCCESS(f'Pruned {count} tombstones')
+        )
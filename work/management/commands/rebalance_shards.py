@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from work import sharding
+from work.models import Contact
+
+
+class Command(BaseCommand):
+    help = "Move each user's contacts to the shard CONTACT_SHARDS assigns them, e.g. after adding a shard"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the moves')
+        parser.add_argument('--batch-size', type=int, default=sharding.MOVE_BATCH_SIZE)
+    
+    def handle(self, *args, **options):
+        aliases = sharding.shards()
+        for alias in aliases:
+            sharding.reserve_id_space(alias)
+        
+        moves = sharding.misplaced()
+        self.stdout.write(f'{len(aliases)} shards, {len(moves)} users to move, '
+                          f'{sum(move[3] for move in moves)} contacts')
+        for user_id, source, target, count in moves:
+            if options['dry_run']:
+                self.stdout.write(f'  user {user_id}: {count} contacts {source} -> {target}')
+                continue
+            moved = sharding.move_contacts(user_id, source, target, options['batch_size'])
+            self.stdout.write(f'  user {user_id}: moved {moved} contacts {source} -> {target}')
+        
+        for alias in aliases:
+            self.stdout.write(f'{alias:<12} {Contact.objects.using(alias).count():>10} contacts')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Rebalanced'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from work import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the FTS5 contact search index from the contact table, on every shard'
+    
+    def handle(self, *args, **options):
+        aliases = search.index_aliases()
+        missing = [alias for alias in aliases if not search.create_index(using=alias)]
+        if missing:
+            raise CommandError(f'FTS5 is not available on: {", ".join(missing)}')
+        
+        total = 0
+        for alias in aliases:
+            with transaction.atomic(using=alias):
+                count = search.rebuild_index(using=alias)
+            total += count
+            if len(aliases) > 1:
+                self.stdout.write(f'{alias}: {count} contacts indexed')
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Search index rebuilt: {total} contacts indexed')
+        )
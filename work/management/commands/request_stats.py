@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+from work import profiling
+
+
+class Command(BaseCommand):
+    help = 'Show per-route request percentiles flushed by RequestProfilingMiddleware'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the merged summary as JSON'
+        )
+    
+    def handle(self, *args, **options):
+        summary = profiling.summarize(profiling.merge(profiling.load_flushed()))
+        
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        
+        if not summary:
+            self.stdout.write(self.style.WARNING('No samples, is REQUEST_PROFILING on?'))
+            return
+        
+        self.stdout.write(f'{"route":<20} {"n":>6} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"queries p95":>12} {"db p95":>9}')
+        for name, entry in sorted(summary.items()):
+            wall = entry['wall']
+            self.stdout.write(
+                f'{name:<20} {entry["count"]:>6} {wall["p50"]:>9.2f} {wall["p95"]:>9.2f} {wall["p99"]:>9.2f} '
+                f'{entry["queries"]["p95"]:>12} {entry["db"]["p95"]:>9.2f}'
+            )
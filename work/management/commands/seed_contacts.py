@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from work.loadgen import seed
+
+
+class Command(BaseCommand):
+    help = 'Seed N users with M contacts each using bulk inserts'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Number of users to create (default: 10)')
+        parser.add_argument('--contacts', type=int, default=1000, help='Contacts per user (default: 1000)')
+        parser.add_argument('--prefix', type=str, default='load', help='Username prefix (default: load)')
+        parser.add_argument('--password', type=str, default='load123', help='Password for every seeded user')
+    
+    def handle(self, *args, **options):
+        if options['users'] < 0 or options['contacts'] < 0:
+            raise CommandError('--users and --contacts cannot be negative')
+        users = seed(
+            options['users'],
+            options['contacts'],
+            prefix=options['prefix'],
+            password=options['password'],
+            progress=lambda n: self.stdout.write(f'\r{n} contacts', ending=''),
+        )
+        self.stdout.write('')
+        self.stdout.write(
+            self.style.SUCCESS(f'Seeded {len(users)} users with {options["contacts"]} contacts each')
+        )
@@ -0,0 +1,24 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database into every DATABASE_REPLICAS file (local replica stand-in)'
+    
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured, set PYCHATTY_REPLICA_PATHS')
+        
+        primary = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                replica = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    primary.backup(replica)
+                finally:
+                    replica.close()
+                self.stdout.write(self.style.SUCCESS(f'{alias} synced'))
+        finally:
+            primary.close()
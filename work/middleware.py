@@ -0,0 +1,185 @@
+from contextlib import ExitStack
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from rest_framework.renderers import JSONRenderer
+
+from . import admission, profiling, routers
+
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in (REQUEST_PROFILING = True) per-request timing: wall time, DB
+    queries and time, serializer and template time, aggregated per URL name.
+    With REQUEST_PROFILING_SLOW_MS set requests run under cProfile, one at a
+    time per process, and the ones slower than the threshold are dumped to
+    REQUEST_PROFILING_DIR (the newest REQUEST_PROFILING_KEEP are kept).
+    Keep it first in MIDDLEWARE so the wall time covers the whole stack.
+    Sync only: the query hooks are per connection, and async views run their
+    queries on other threads, so it would not see them anyway.
+    """
+    
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'REQUEST_PROFILING_SLOW_MS', None)
+        profiling.install_hooks()
+    
+    def __call__(self, request):
+        profile, token = profiling.start()
+        profiler = profiling.acquire_profiler() if self.slow_ms is not None else None
+        begin = perf_counter()
+        try:
+            with ExitStack() as stack:
+                if profiler:
+                    stack.callback(profiling.release_profiler)
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(profile.db_wrapper))
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+        finally:
+            profiling.stop(token)
+        wall = perf_counter() - begin
+        
+        match = request.resolver_match
+        name = match.url_name if match and match.url_name else 'unresolved'
+        profiling.record(name, wall, profile)
+        if profiler and wall * 1000 >= self.slow_ms:
+            profiling.dump_profile(profiler, name, wall)
+        
+        response['Server-Timing'] = (
+            f'total;dur={wall * 1000:.1f}, db;dur={profile.db * 1000:.1f};desc="{profile.queries} queries", '
+            f'ser;dur={profile.serializer * 1000:.1f}, tpl;dur={profile.template * 1000:.1f}'
+        )
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes for PrimaryReplicaRouter: a request that wrote gets a
+    cookie pinning the client's reads to the primary for REPLICA_PIN_SECONDS,
+    which covers the redirect after a POST while replicas catch up.
+    Works in both sync and async stacks.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'pin_primary'
+    
+    def __init__(self, get_response):
+        if not routers.replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.begin(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = routers.end(token)
+        return self.finish(response, state)
+    
+    async def __acall__(self, request):
+        token = routers.begin(pinned=self.cookie_name in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = routers.end(token)
+        return self.finish(response, state)
+    
+    def finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(self.cookie_name, '1', max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Rate limits api/* per client (user, or IP when anonymous) with the
+    weighted token buckets in work.admission and caps in-flight API
+    requests per process. Rejections are an immediate 429 with
+    Retry-After. Place it after AuthenticationMiddleware; it is only used
+    with ADMISSION_CONTROL = True.
+    
+    A streaming response keeps its in-flight slot until the server closes
+    it, since its body is only generated after the view has returned.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    prefix = '/api/'
+    
+    def __init__(self, get_response):
+        if not getattr(settings, 'ADMISSION_CONTROL', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def url_name(self, request):
+        if not request.path_info.startswith(self.prefix):
+            return None
+        try:
+            return resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        url_name = self.url_name(request)
+        if url_name is None:
+            return self.get_response(request)
+        retry_after = admission.admit(admission.client_key(request, request.user), url_name)
+        if retry_after is not None:
+            return self.reject(retry_after)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            admission.inflight.leave()
+            raise
+        return self.release(response)
+    
+    async def __acall__(self, request):
+        url_name = self.url_name(request)
+        if url_name is None:
+            return await self.get_response(request)
+        retry_after = admission.admit(admission.client_key(request, await request.auser()), url_name)
+        if retry_after is not None:
+            return self.reject(retry_after)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            admission.inflight.leave()
+            raise
+        return self.release(response)
+    
+    def release(self, response):
+        if response.streaming:
+            # response.close() runs these once the body has been sent or abandoned
+            response._resource_closers.append(admission.inflight.leave)
+        else:
+            admission.inflight.leave()
+        return response
+    
+    def reject(self, retry_after):
+        response = HttpResponse(JSONRenderer().render({"message": "Too Many Requests"}),
+                                status=429, content_type='application/json')
+        response['Retry-After'] = str(retry_after)
+        return response
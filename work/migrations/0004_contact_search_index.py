@@ -0,0 +1,47 @@
+from django.db import migrations, OperationalError
+
+# The DDL as of this migration, kept here rather than imported from
+# work.search so later changes to that module can't alter what it does.
+FTS_TABLE = 'work_contact_fts'
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, email, phone, additional, user_id UNINDEXED, prefix='2 3')"
+)
+DROP_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+REBUILD_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, name, email, phone, additional, user_id) "
+    "SELECT id, name, email, phone, additional, user_id FROM work_contact"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL)
+        except OperationalError:
+            # sqlite built without FTS5, searches fall back to LIKE
+            return
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(REBUILD_SQL)
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0003_contact_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
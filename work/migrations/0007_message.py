@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:39
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0006_contacttombstone'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Message',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('chat_type', models.CharField(choices=[('private', 'Private Chat'), ('group', 'Group Chat')], max_length=10)),
+                ('chat_id', models.CharField(max_length=64)),
+                ('type', models.CharField(choices=[('TXT', 'Text'), ('IMG', 'Image'), ('FILE', 'File')], default='TXT', max_length=4)),
+                ('content', models.TextField()),
+                ('original', models.TextField(blank=True, default='')),
+                ('status', models.CharField(blank=True, default='', max_length=64)),
+                ('mentioned', models.JSONField(blank=True, default=list)),
+                ('send_time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sender', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chat_type', 'chat_id', 'send_time', 'id'], name='message_chat_time_idx')],
+            },
+        ),
+    ]
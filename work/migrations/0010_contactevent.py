@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:04
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('work', '0009_contact_user_db_constraint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('contact_added', 'Contact Added'), ('contact_updated', 'Contact Updated'), ('contact_removed', 'Contact Removed'), ('contacts_saved', 'Contacts Saved in Bulk'), ('contacts_removed', 'Contacts Removed in Bulk'), ('promoted', 'Promoted to Administrator'), ('demoted', 'Demoted to Regular User')], max_length=20)),
+                ('contact_id', models.BigIntegerField(blank=True, null=True)),
+                ('summary', models.CharField(blank=True, default='', max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='contact_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='contact_event_user_id_idx')],
+            },
+        ),
+    ]
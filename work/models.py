@@ -1,8 +1,16 @@
+import uuid
+
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from . import search
+from .routers import PRIMARY
+from .sharding import ShardedQuerySet
+from .signals import contacts_bulk_saved, contacts_bulk_deleted
+
 class UserProfile(models.Model):
     USER_TYPE_CHOICES = [
         ('regular', 'Regular User'),
@@ -25,11 +33,16 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # a login only writes last_login; re-saving the profile then would bump
+    # the user table fragments and could write back a stale user_type
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
     instance.userprofile.save()
 
 class Contact(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # no FOREIGN KEY constraint: with sharding the row and its user can be in different databases
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_constraint=False)
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=20)
     email = models.EmailField()
@@ -37,5 +50,135 @@ class Contact(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='contact_created_id_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='contact_user_created_id_idx'),
+            models.Index(fields=['updated_at'], name='contact_updated_idx'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+class ContactTombstone(models.Model):
+    """Left behind by a deleted Contact so delta sync can report the deletion"""
+    contact_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"{self.contact_id} deleted at {self.deleted_at}"
+
+class Message(models.Model):
+    CHAT_TYPE_CHOICES = [
+        ('private', 'Private Chat'),
+        ('group', 'Group Chat'),
+    ]
+    MESSAGE_TYPE_CHOICES = [
+        ('TXT', 'Text'),
+        ('IMG', 'Image'),
+        ('FILE', 'File'),
+    ]
+    
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    chat_type = models.CharField(max_length=10, choices=CHAT_TYPE_CHOICES)
+    chat_id = models.CharField(max_length=64)
+    sender = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    type = models.CharField(max_length=4, choices=MESSAGE_TYPE_CHOICES, default='TXT')
+    content = models.TextField()
+    original = models.TextField(blank=True, default='')
+    status = models.CharField(max_length=64, blank=True, default='')
+    mentioned = models.JSONField(default=list, blank=True)
+    send_time = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat_type', 'chat_id', 'send_time', 'id'], name='message_chat_time_idx'),
+        ]
+    
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.chat_type}:{self.chat_id} {self.uuid}"
+
+class ChatGroupMember(models.Model):
+    """Membership of a group chat: only members open /ws/msg/group/<chat id> or read its history"""
+    chat_id = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_groups')
+    joined_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chat_id', 'user'], name='chat_group_member_unique'),
+        ]
+    
+    def __str__(self):
+        return f"group:{self.chat_id} {self.user_id}"
+
+class StoredFile(models.Model):
+    """An uploaded file; the bytes live on disk under their sha256, shared by identical uploads"""
+    reference = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64, db_index=True)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.reference})"
+
+class ContactEvent(models.Model):
+    """An entry of a user's /api/im/contact-events feed, read through the rings in work.events"""
+    TYPE_CHOICES = [
+        ('contact_added', 'Contact Added'),
+        ('contact_updated', 'Contact Updated'),
+        ('contact_removed', 'Contact Removed'),
+        ('contacts_saved', 'Contacts Saved in Bulk'),
+        ('contacts_removed', 'Contacts Removed in Bulk'),
+        ('promoted', 'Promoted to Administrator'),
+        ('demoted', 'Demoted to Regular User'),
+    ]
+    
+    # (user, id) below serves the user lookups, so no separate index on user
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name='contact_events')
+    type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # no foreign key: contacts can be deleted or live on another shard
+    contact_id = models.BigIntegerField(null=True, blank=True)
+    summary = models.CharField(max_length=200, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='contact_event_user_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.type} {self.summary}"
+
+@receiver(post_save, sender=Contact)
+def index_contact(sender, instance, using, **kwargs):
+    search.index_contacts([instance], using=using)
+
+@receiver(post_delete, sender=Contact)
+def unindex_contact(sender, instance, using, **kwargs):
+    search.remove_contacts([instance.id], using=using)
+
+@receiver(post_delete, sender=Contact)
+def record_contact_tombstone(sender, instance, using, **kwargs):
+    # next to the contact, on its shard
+    ContactTombstone.objects.using(using).create(contact_id=instance.id)
+
+@receiver(contacts_bulk_saved, sender=Contact)
+def index_contacts_bulk(sender, instances, **kwargs):
+    search.index_contacts(instances)
+
+@receiver(contacts_bulk_deleted, sender=Contact)
+def unindex_contacts_bulk(sender, ids, using=PRIMARY, **kwargs):
+    search.remove_contacts(ids, using=using)
+
+@receiver(contacts_bulk_deleted, sender=Contact)
+def record_contact_tombstones_bulk(sender, ids, using=PRIMARY, **kwargs):
+    ContactTombstone.objects.using(using).bulk_create([ContactTombstone(contact_id=i) for i in ids])
@@ -1,8 +1,147 @@
+import base64
+import hashlib
+import json
+
 from rest_framework import generics
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
 from .models import Contact
 from .serializers import ContactSerializer
 
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+APPROX_COUNT_TTL = 60
+
+
 class ContactList(generics.ListAPIView):
     queryset = Contact.objects.all()
     serializer_class = ContactSerializer
-    
\ No newline at end of file
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        values = payload['v']
+        reverse = payload.get('r', 0)
+    except (ValueError, TypeError, KeyError, AttributeError, UnicodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or not all(_is_key_value(value) for value in values):
+        raise InvalidCursor(cursor)
+    return values, bool(reverse)
+
+
+def _is_key_value(value):
+    """What _boundary puts in a cursor: strings, or numbers SQLite can bind"""
+    if isinstance(value, str):
+        return True
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return not isinstance(value, int) or -2 ** 63 <= value < 2 ** 63
+
+
+def approximate_count(queryset):
+    """COUNT(*) cached for a short while, keyed by the SQL of the queryset"""
+    sql, params = queryset.query.sql_with_params()
+    key = 'approx-count:' + hashlib.md5(f'{sql}{params}'.encode('utf-8')).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, APPROX_COUNT_TTL)
+    return count
+
+
+def page_size_from(value, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over a unique ordering such as (created_at, id).
+    Pages are located with a range predicate on the ordering columns, so
+    there is no OFFSET scan and no COUNT(*) unless asked for. A leading
+    '-' on the ordering names ('-send_time', '-id') pages newest first.
+    """
+
+    def __init__(self, queryset, ordering=('created_at', 'id'), page_size=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = page_size
+        model = queryset.model
+        self.descending = [name.startswith('-') for name in self.ordering]
+        self.fields = [model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+
+    def _boundary(self, obj):
+        return [field.value_to_string(obj) for field in self.fields]
+
+    def _seek(self, values, reverse):
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            lookup = 'lt' if reverse != self.descending[i] else 'gt'
+            step = Q(**{f'{field.attname}__{lookup}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field.attname: prev_value})
+            condition |= step
+        return condition
+
+    def page(self, cursor=None):
+        reverse = False
+        queryset = self.queryset
+        if cursor:
+            raw, reverse = decode_cursor(cursor)
+            if len(raw) != len(self.fields):
+                raise InvalidCursor(cursor)
+            try:
+                values = [field.to_python(value) for field, value in zip(self.fields, raw)]
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                raise InvalidCursor(cursor)
+            queryset = queryset.filter(self._seek(values, reverse))
+
+        order = [('-' if desc != reverse else '') + field.name for field, desc in zip(self.fields, self.descending)]
+        rows = list(queryset.order_by(*order)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if reverse or has_more:
+                next_cursor = encode_cursor(self._boundary(rows[-1]))
+            if (cursor and not reverse) or (reverse and has_more):
+                previous_cursor = encode_cursor(self._boundary(rows[0]), reverse=True)
+        return CursorPage(rows, next_cursor, previous_cursor)
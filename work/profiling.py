@@ -0,0 +1,229 @@
+import cProfile
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter, strftime
+
+from django.conf import settings
+
+METRICS = ('wall', 'db', 'queries', 'serializer', 'template')
+PERCENTILES = (50, 95, 99)
+
+SAMPLES = getattr(settings, 'REQUEST_PROFILING_SAMPLES', 1000)
+FLUSH_EVERY = getattr(settings, 'REQUEST_PROFILING_FLUSH_EVERY', 100)
+PROFILE_DIR = getattr(settings, 'REQUEST_PROFILING_DIR', None)
+PROFILE_KEEP = getattr(settings, 'REQUEST_PROFILING_KEEP', 50)
+
+_current = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    __slots__ = ('queries', 'db', 'serializer', 'template')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.template = 0.0
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += perf_counter() - start
+            self.queries += 1
+
+
+def start():
+    profile = RequestProfile()
+    return profile, _current.set(profile)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+@contextmanager
+def timed(attr):
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    begin = perf_counter()
+    try:
+        yield
+    finally:
+        setattr(profile, attr, getattr(profile, attr) + perf_counter() - begin)
+
+
+_hooks_installed = False
+
+
+def install_hooks():
+    """
+    Times template rendering and serializer output. Both are patched once,
+    and only when profiling is switched on, so the normal path is untouched.
+    """
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    _hooks_installed = True
+
+    from django.template.backends.django import Template
+    from rest_framework import serializers
+
+    render = Template.render
+
+    def timed_render(self, *args, **kwargs):
+        with timed('template'):
+            return render(self, *args, **kwargs)
+
+    Template.render = timed_render
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        data = cls.data
+
+        def timed_data(self, _data=data):
+            with timed('serializer'):
+                return _data.fget(self)
+
+        cls.data = property(timed_data)
+
+
+class ProfileStats:
+    """Recent samples per URL name; percentiles are computed when read"""
+
+    def __init__(self, samples=SAMPLES):
+        self.samples = samples
+        self.lock = threading.Lock()
+        self.routes = defaultdict(lambda: {metric: deque(maxlen=self.samples) for metric in METRICS})
+        self.recorded = 0
+
+    def record(self, name, wall, profile):
+        values = {
+            'wall': wall * 1000,
+            'db': profile.db * 1000,
+            'queries': profile.queries,
+            'serializer': profile.serializer * 1000,
+            'template': profile.template * 1000,
+        }
+        with self.lock:
+            route = self.routes[name]
+            for metric, value in values.items():
+                route[metric].append(value)
+            self.recorded += 1
+            return self.recorded
+
+    def raw(self):
+        with self.lock:
+            return {name: {metric: list(values) for metric, values in route.items()}
+                    for name, route in self.routes.items()}
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+            self.recorded = 0
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(raw):
+    """{url_name: {count, metric: {p50, p95, p99}}} from raw samples"""
+    summary = {}
+    for name, route in raw.items():
+        entry = {'count': len(route['wall'])}
+        for metric in METRICS:
+            ordered = sorted(route[metric])
+            entry[metric] = {f'p{p}': percentile(ordered, p) for p in PERCENTILES}
+        summary[name] = entry
+    return summary
+
+
+def merge(raws):
+    merged = defaultdict(lambda: {metric: [] for metric in METRICS})
+    for raw in raws:
+        for name, route in raw.items():
+            for metric in METRICS:
+                merged[name][metric].extend(route.get(metric, []))
+    return dict(merged)
+
+
+stats = ProfileStats()
+
+
+def record(name, wall, profile):
+    recorded = stats.record(name, wall, profile)
+    if PROFILE_DIR and recorded % FLUSH_EVERY == 0:
+        flush()
+
+
+def snapshot():
+    return summarize(stats.raw())
+
+
+def flush():
+    """Writes this process' raw samples so the request_stats command can merge workers"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'stats-{os.getpid()}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(stats.raw(), f)
+
+
+def load_flushed():
+    if not PROFILE_DIR or not os.path.isdir(PROFILE_DIR):
+        return []
+    raws = []
+    for filename in sorted(os.listdir(PROFILE_DIR)):
+        if filename.startswith('stats-') and filename.endswith('.json'):
+            with open(os.path.join(PROFILE_DIR, filename), encoding='utf-8') as f:
+                raws.append(json.load(f))
+    return raws
+
+
+# From Python 3.12 cProfile sits on sys.monitoring, which takes one profiler
+# per process, so only one request at a time is profiled; the rest are
+# still timed, just not dumped.
+_profiler_lock = threading.Lock()
+
+
+def acquire_profiler():
+    """A cProfile.Profile for this request, or None while another request holds it"""
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    return cProfile.Profile()
+
+
+def release_profiler():
+    _profiler_lock.release()
+
+
+def dump_profile(profiler: cProfile.Profile, name, wall):
+    """Writes the profile, keeping only the newest PROFILE_KEEP .prof files"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f'{name}-{strftime("%Y%m%d-%H%M%S")}-{int(wall * 1000)}ms-{os.getpid()}.prof')
+    profiler.dump_stats(path)
+    prune_profiles()
+    return path
+
+
+def prune_profiles(keep=None):
+    keep = PROFILE_KEEP if keep is None else keep
+    paths = [os.path.join(PROFILE_DIR, filename) for filename in os.listdir(PROFILE_DIR) if filename.endswith('.prof')]
+    if len(paths) <= keep:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:len(paths) - keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # another worker pruned it first
+            pass
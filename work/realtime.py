@@ -0,0 +1,200 @@
+"""
+Raw ASGI websocket endpoints from _desc/routes.md, mounted by pychatty.asgi:
+
+    /ws/msg/private/<low uid>-<high uid>   one-to-one chat
+    /ws/msg/group/<chat id>                group chat, members only
+    /ws/msg/ann                            announcements for the current user
+
+Clients authenticate with the Django session cookie. Since browsers send
+that cookie with cross-site websocket handshakes too, a handshake whose
+Origin is not one of ALLOWED_HOSTS or CSRF_TRUSTED_ORIGINS is refused.
+Incoming MessageInfo
+packets are validated, stored, acknowledged with a status (100 stored,
+0 rejected) and fanned out through the broker to every socket on the chat.
+Announcements come from work.events: each committed contact event is
+pushed to its user's ann sockets as a ContactAnnouncement.
+"""
+import asyncio
+import json
+import re
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.http.request import validate_host
+from django.utils.http import is_same_domain
+from rest_framework.renderers import JSONRenderer
+
+from .broker import Subscriber, get_broker
+from .models import ChatGroupMember, Message
+from .serializers import MessageInfoSerializer, MessageSerializer
+
+PATH_RE = re.compile(r'^/ws/msg/(?:(?P<chat_type>private|group)/(?P<chat_id>[\w-]{1,64})|(?P<ann>ann))/?$')
+PRIVATE_CHAT_RE = re.compile(r'^(\d+)-(\d+)$')
+
+CLOSE_SLOW_CONSUMER = 1013
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+STATUS_STORED = 100
+STATUS_REJECTED = 0
+
+_renderer = JSONRenderer()
+
+
+def chat_topic(chat_type, chat_id):
+    return f'{chat_type}:{chat_id}'
+
+
+def announcement_topic(user_id):
+    return f'ann:{user_id}'
+
+
+def private_chat_id(user_a, user_b):
+    low, high = sorted((int(user_a), int(user_b)))
+    return f'{low}-{high}'
+
+
+def can_join(user_id, chat_type, chat_id):
+    if chat_type == 'private':
+        match = PRIVATE_CHAT_RE.match(chat_id)
+        return bool(match) and str(user_id) in match.groups() and chat_id == private_chat_id(*match.groups())
+    return ChatGroupMember.objects.filter(chat_id=chat_id, user_id=user_id).exists()
+
+
+def allowed_origin(scope):
+    """
+    Same-site check for the handshake: the Origin host has to match
+    ALLOWED_HOSTS (localhost while DEBUG, as for Host headers) or the origin
+    CSRF_TRUSTED_ORIGINS. Clients that send no Origin aren't browsers.
+    """
+    origin = None
+    for name, value in scope.get('headers', []):
+        if name == b'origin':
+            origin = value.decode('latin-1')
+    if origin is None:
+        return True
+    parsed = urlsplit(origin)
+    if not parsed.scheme or not parsed.hostname:
+        return False
+    allowed_hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not allowed_hosts:
+        allowed_hosts = ['.localhost', '127.0.0.1', '[::1]']
+    if validate_host(parsed.netloc, allowed_hosts) or validate_host(parsed.hostname, allowed_hosts):
+        return True
+    for trusted in getattr(settings, 'CSRF_TRUSTED_ORIGINS', []):
+        trusted = urlsplit(trusted)
+        if trusted.scheme == parsed.scheme and is_same_domain(parsed.netloc, trusted.netloc):
+            return True
+    return False
+
+
+@sync_to_async
+def authenticate(scope):
+    cookie = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookie.load(value.decode('latin-1'))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    if morsel is None:
+        return None
+    store = import_module(settings.SESSION_ENGINE).SessionStore(morsel.value)
+    user = get_user(SimpleNamespace(session=store))
+    return user.id if user.is_authenticated else None
+
+
+def encode(data):
+    return _renderer.render(data).decode('utf-8')
+
+
+async def store_and_publish(text, chat_type, chat_id, user_id):
+    """Handles one incoming packet and returns the status reply"""
+    try:
+        payload = json.loads(text)
+    except (TypeError, ValueError):
+        return {'status': STATUS_REJECTED, 'message': 'Invalid JSON'}
+    if not isinstance(payload, dict):
+        return {'status': STATUS_REJECTED, 'message': 'Invalid input'}
+    
+    reply = {'ref': payload['ref']} if 'ref' in payload else {}
+    serializer = MessageInfoSerializer(data=payload)
+    if not serializer.is_valid():
+        return {**reply, 'status': STATUS_REJECTED, 'errors': serializer.errors}
+    
+    message = Message(chat_type=chat_type, chat_id=chat_id, sender_id=user_id, **serializer.validated_data)
+    await message.asave()
+    packet = MessageSerializer(message).data
+    await get_broker().publish(chat_topic(chat_type, chat_id), encode(packet))
+    return {**reply, 'status': STATUS_STORED, 'id': packet['id'], 'sendTime': packet['sendTime']}
+
+
+async def pump(subscriber, send):
+    """Moves queued packets to the socket; gives up on a consumer that overflowed"""
+    while True:
+        data = await subscriber.queue.get()
+        if subscriber.overflowed:
+            await send({'type': 'websocket.close', 'code': CLOSE_SLOW_CONSUMER})
+            return
+        await send({'type': 'websocket.send', 'text': data})
+
+
+async def websocket_application(scope, receive, send):
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    
+    match = PATH_RE.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    if not allowed_origin(scope):
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+    user_id = await authenticate(scope)
+    if user_id is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    
+    chat_type, chat_id = match.group('chat_type'), match.group('chat_id')
+    if match.group('ann'):
+        topic = announcement_topic(user_id)
+    elif await sync_to_async(can_join)(user_id, chat_type, chat_id):
+        topic = chat_topic(chat_type, chat_id)
+    else:
+        await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+        return
+    
+    await send({'type': 'websocket.accept'})
+    broker = get_broker()
+    subscriber = Subscriber()
+    broker.subscribe(topic, subscriber)
+    pumping = asyncio.create_task(pump(subscriber, send))
+    try:
+        while not pumping.done():
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive' or match.group('ann'):
+                continue
+            reply = await store_and_publish(event.get('text') or event.get('bytes'), chat_type, chat_id, user_id)
+            await send({'type': 'websocket.send', 'text': encode(reply)})
+    finally:
+        broker.unsubscribe(topic, subscriber)
+        pumping.cancel()
+
+
+def announce(user_id, kind, payload):
+    """Pushes an announcement to the user's /ws/msg/ann sockets, callable from sync or async code"""
+    data = encode({'announcement': kind, **payload})
+    publish = get_broker().publish
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        async_to_sync(publish)(announcement_topic(user_id), data)
+    else:
+        loop.create_task(publish(announcement_topic(user_id), data))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import UserProfile
+
+# promote/demote drop the entry in USER_ROLE_CACHE_ALIAS; other processes
+# only see that with a shared backend, otherwise after at most the TTL
+ROLE_CACHE_ALIAS = getattr(settings, 'USER_ROLE_CACHE_ALIAS', 'default')
+ROLE_CACHE_TTL = getattr(settings, 'USER_ROLE_CACHE_TTL', 10)
+
+# cached for users without a profile, so they don't miss every time
+NO_ROLE = ''
+
+
+def _cache():
+    return caches[ROLE_CACHE_ALIAS]
+
+
+def role_key(user_id):
+    return f'user-role:{user_id}'
+
+
+def get_role(user):
+    """
+    user_type of the user's profile, or None. Looked up at most once per
+    request (memoized on the user object) and served from the cache after
+    that, so page views don't query work_userprofile.
+    """
+    if not user.is_authenticated:
+        return None
+    role = getattr(user, '_cached_role', None)
+    if role is None:
+        role = _cache().get(role_key(user.id))
+        if role is None:
+            role = UserProfile.objects.filter(user_id=user.id).values_list('user_type', flat=True).first() or NO_ROLE
+            _cache().set(role_key(user.id), role, ROLE_CACHE_TTL)
+        user._cached_role = role
+    return role or None
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_role(sender, instance, using, **kwargs):
+    key = role_key(instance.user_id)
+    _cache().delete(key)
+    # a request reading the old row before the commit may have cached it again
+    transaction.on_commit(lambda: _cache().delete(key), using=using)
@@ -0,0 +1,77 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+
+# only these apps read from replicas; auth and sessions stay on the primary
+REPLICA_APPS = {'work'}
+
+
+class DbState:
+    __slots__ = ('pinned', 'wrote')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_state = ContextVar('db_state', default=None)
+
+
+def begin(pinned=False):
+    return _state.set(DbState(pinned))
+
+
+def end(token):
+    state = _state.get()
+    _state.reset(token)
+    return state
+
+
+def pin_primary():
+    state = _state.get()
+    if state is None:
+        state = DbState()
+        _state.set(state)
+    state.pinned = state.wrote = True
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads of REPLICA_APPS models go to a random DATABASE_REPLICAS alias
+    unless the current request has written (or arrived with the pin cookie
+    set by ReplicaPinMiddleware), or we are inside a transaction on the
+    primary. Writes always go to the primary and pin the request.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICA_APPS:
+            return None
+        aliases = replicas()
+        state = _state.get()
+        if not aliases or (state and state.pinned) or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in REPLICA_APPS:
+            pin_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {PRIMARY, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,196 @@
+import heapq
+import re
+
+from django.apps import apps
+from django.db import connection, connections, router, OperationalError
+from django.db.models import Q
+
+from . import sharding
+from .routers import PRIMARY
+
+FTS_TABLE = 'work_contact_fts'
+SEARCH_RESULT_LIMIT = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "name, email, phone, additional, user_id UNINDEXED, prefix='2 3')"
+)
+DROP_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+REBUILD_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, name, email, phone, additional, user_id) "
+    "SELECT id, name, email, phone, additional, user_id FROM work_contact"
+)
+
+_available = None
+
+
+def index_aliases():
+    """Every database holding contacts, and so its own slice of the index"""
+    return sharding.shards() if sharding.enabled() else [PRIMARY]
+
+
+def _has_index(conn):
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def fts_available():
+    """True when every contact database is SQLite and has the FTS5 table"""
+    global _available
+    if _available is None:
+        _available = all(_has_index(connections[alias]) for alias in index_aliases())
+    return _available
+
+
+def reset_availability():
+    global _available
+    _available = None
+
+
+def _connection(schema_editor, using):
+    if schema_editor:
+        return schema_editor.connection
+    return connections[using] if using else connection
+
+
+def create_index(schema_editor=None, using=None):
+    conn = _connection(schema_editor, using)
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(CREATE_SQL)
+        except OperationalError:
+            # sqlite built without FTS5, searches fall back to LIKE
+            return False
+    reset_availability()
+    return True
+
+
+def drop_index(schema_editor=None, using=None):
+    conn = _connection(schema_editor, using)
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute(DROP_SQL)
+    reset_availability()
+
+
+def rebuild_index(schema_editor=None, using=None):
+    conn = _connection(schema_editor, using)
+    if conn.vendor != 'sqlite':
+        return 0
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(REBUILD_SQL)
+        count = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return count
+
+
+def index_contacts(contacts, using=None):
+    """Each shard indexes its own contacts; using defaults to where each one was saved"""
+    if not fts_available():
+        return
+    groups = {}
+    for c in contacts:
+        alias = using or (c._state.db if sharding.enabled() else PRIMARY)
+        groups.setdefault(alias, []).append((c.id, c.name, c.email, c.phone, c.additional, c.user_id))
+    for alias, rows in groups.items():
+        with connections[alias].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, email, phone, additional, user_id) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                rows,
+            )
+
+
+def remove_contacts(ids, using=PRIMARY):
+    if not fts_available():
+        return
+    ids = [(i,) for i in ids]
+    if ids:
+        with connections[using].cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", ids)
+
+
+def build_match(keyword, fields):
+    """'jo smi' on (name,) -> '{name} : ("jo"* AND "smi"*)'"""
+    tokens = TOKEN_RE.findall(keyword)
+    if not tokens:
+        return None
+    terms = ' AND '.join(f'"{token}"*' for token in tokens)
+    return '{%s} : (%s)' % (' '.join(fields), terms)
+
+
+def search_ids(keyword, fields=('name',), user=None, limit=SEARCH_RESULT_LIMIT):
+    """Contact ids matching keyword, best bm25 rank first (across shards for user=None)"""
+    match = build_match(keyword, fields)
+    if match is None:
+        return []
+    sql = f"SELECT rank, rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    params = [match]
+    if user is not None:
+        sql += " AND user_id = %s"
+        params.append(user.id)
+    sql += " ORDER BY rank LIMIT %s"
+    params.append(limit)
+    if not sharding.enabled():
+        aliases = [router.db_for_read(apps.get_model('work', 'Contact'))]
+    elif user is not None:
+        aliases = [sharding.shard_for_user(user.id)]
+    else:
+        aliases = sharding.shards()
+
+    def fetch(alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    ranked = heapq.merge(*sharding.fan_out(fetch, aliases))
+    return [row[1] for _i, row in zip(range(limit), ranked)]
+
+
+def _substring_search(queryset, keyword, fields, limit, exclude=()):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': keyword})
+    queryset = queryset.filter(condition)
+    if exclude:
+        queryset = queryset.exclude(id__in=exclude)
+    return list(queryset[:limit])
+
+
+def search_contacts(queryset, keyword, fields=('name',), user=None, limit=SEARCH_RESULT_LIMIT):
+    """
+    Ranked prefix search through the FTS5 index, scoped by queryset (and
+    user, which is pushed down into the index query). Without FTS5 this
+    falls back to icontains on the same fields.
+
+    The index only matches word prefixes, so when those don't fill limit
+    the rest comes from icontains ('ohn' still finds John, after the words
+    starting with 'ohn'). Broad keywords fill limit from the index alone.
+    """
+    if not fts_available():
+        return _substring_search(queryset, keyword, fields, limit)
+    ids = search_ids(keyword, fields, user, limit)
+    found = queryset.in_bulk(ids)
+    contacts = [found[i] for i in ids if i in found]
+    if len(contacts) < limit:
+        contacts += _substring_search(queryset, keyword, fields, limit - len(contacts), exclude=ids)
+    return contacts
+
+
+def search_capped(queryset, keyword, fields=('name',), user=None, limit=SEARCH_RESULT_LIMIT):
+    """
+    search_contacts cut at limit, plus whether more contacts matched, so
+    callers can tell the client its results were capped.
+    """
+    contacts = search_contacts(queryset, keyword, fields, user, limit + 1)
+    return contacts[:limit], len(contacts) > limit
@@ -1,7 +1,7 @@
-import re
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Contact, UserProfile
+from .models import Contact, Message, UserProfile
+from . import validators
 
 class UserSerializer(serializers.ModelSerializer):
     user_type = serializers.CharField(source='userprofile.user_type', read_only=True)
@@ -17,14 +17,18 @@ class ContactSerializer(serializers.ModelSerializer):
         model = Contact
         fields = ['id', 'user', 'name', 'phone', 'email', 'additional', 'created_at', 'updated_at']
     
+    def validate_name(self, value):
+        return validators.clean_name(value)
+    
+    def validate_phone(self, value):
+        return validators.clean_phone(value)
+    
     def validate_email(self, value):
-        EMAIL_REGEX = re.compile(r"^[a-zA-Z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*$")
-        if not EMAIL_REGEX.match(value):
-            raise serializers.ValidationError("invalid email")
-        return value.lower()
+        return validators.clean_email(value)
     
     def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
+        request = self.context.get('request')
+        validated_data['user'] = request.user if request and request.user.is_authenticated else None
         return super().create(validated_data)
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -33,4 +37,31 @@ class UserProfileSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = UserProfile
-        fields = ['id', 'username', 'email', 'user_type', 'created_at']
\ No newline at end of file
+        fields = ['id', 'username', 'email', 'user_type', 'created_at']
+
+class MessageInfoSerializer(serializers.ModelSerializer):
+    """Incoming MessageInfo packet from a websocket client"""
+    mentioned = serializers.ListField(child=serializers.IntegerField(), required=False)
+    
+    class Meta:
+        model = Message
+        fields = ['type', 'content', 'original', 'status', 'mentioned']
+
+class MessageSerializer(serializers.ModelSerializer):
+    """Outgoing message packet, camelCase as in _desc/routes.md"""
+    id = serializers.UUIDField(source='uuid', read_only=True)
+    chatId = serializers.CharField(source='chat_id', read_only=True)
+    sender = serializers.PrimaryKeyRelatedField(read_only=True)
+    sendTime = serializers.SerializerMethodField()
+    original = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Message
+        fields = ['id', 'chatId', 'sender', 'type', 'content', 'sendTime', 'status', 'mentioned', 'original']
+    
+    def get_sendTime(self, obj):
+        return int(obj.send_time.timestamp() * 1000)
+    
+    def get_original(self, obj):
+        # only images carry something here (their thumbnail)
+        return (obj.original or None) if obj.type == 'IMG' else None
@@ -0,0 +1,439 @@
+"""
+Per-user sharding of contacts over several database aliases.
+
+CONTACT_SHARDS lists the aliases holding Contact and ContactTombstone
+rows, 'default' first. A user's contacts live on the alias chosen by
+rendezvous hashing of their id, so adding a shard only moves the users
+that now hash to it; `manage.py rebalance_shards` moves them.
+
+- Contact.objects.for_owner(user) reads from that user's shard only;
+- saves go through ShardRouter to the shard of the contact's owner, and
+  rows loaded from a shard are written back to it;
+- querysets not pinned to one alias (admin-wide and public API reads)
+  run on every shard in parallel and are merged on their ORDER BY, so
+  counts, slices, aggregates and cursor pages come out as from one table.
+
+With a single shard, the default, none of this kicks in and contacts
+stay with PrimaryReplicaRouter.
+
+Contact ids stay unique across shards: the nth shard allocates ids from
+n * SHARD_ID_SPACE on (reserved after migrate), which is also why
+CONTACT_SHARDS is append-only.
+"""
+import hashlib
+import heapq
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from operator import attrgetter, itemgetter
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from django.db import NotSupportedError, connections, models, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.query import FlatValuesListIterable, ModelIterable, ValuesIterable
+from django.db.models.signals import post_migrate, pre_delete
+from django.dispatch import receiver
+
+from .routers import PRIMARY
+from .signals import contacts_bulk_saved
+
+SHARD_ID_SPACE = 1 << 40
+MOVE_BATCH_SIZE = 500
+SHARDED_MODELS = {'contact', 'contacttombstone'}
+
+
+def shards():
+    return getattr(settings, 'CONTACT_SHARDS', None) or [PRIMARY]
+
+
+def enabled():
+    return len(shards()) > 1
+
+
+def is_sharded(model_or_instance):
+    opts = model_or_instance._meta
+    return opts.app_label == 'work' and opts.model_name in SHARDED_MODELS
+
+
+def _weight(alias, user_id):
+    digest = hashlib.blake2b(f'{alias}:{user_id}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def shard_for_user(user_id, aliases=None):
+    """The alias with the highest hash weight for user_id; ownerless rows stay on the primary"""
+    aliases = aliases or shards()
+    if user_id is None:
+        return PRIMARY
+    if len(aliases) == 1:
+        return aliases[0]
+    return max(aliases, key=lambda alias: _weight(alias, user_id))
+
+
+def shard_for_instance(instance):
+    if isinstance(instance, User):
+        return shard_for_user(instance.pk)
+    if instance._state.db is not None and not instance._state.adding:
+        return instance._state.db
+    return shard_for_user(getattr(instance, 'user_id', None))
+
+
+# ---- fan-out ----
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=len(shards()), thread_name_prefix='shard')
+    return _pool
+
+
+def _run(func, alias):
+    # worker threads keep their own connections; honour CONN_MAX_AGE like a request would
+    connections[alias].close_if_unusable_or_obsolete()
+    return func(alias)
+
+
+def fan_out(func, aliases=None):
+    """
+    [func(alias) for alias in aliases], run in parallel. Inside a
+    transaction on any of them it runs in this thread instead, so the
+    reads see the transaction's own writes.
+    """
+    aliases = aliases or shards()
+    if len(aliases) == 1 or any(connections[alias].in_atomic_block for alias in aliases):
+        return [func(alias) for alias in aliases]
+    return list(_executor().map(lambda alias: _run(func, alias), aliases))
+
+
+class _Descending:
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _nulls_first(value):
+    # SQLite sorts NULL before everything else
+    return (value is not None, value)
+
+
+def _combine_sum(values):
+    values = [value for value in values if value is not None]
+    return sum(values) if values else None
+
+
+def _combine_with(func):
+    def combine(values):
+        values = [value for value in values if value is not None]
+        return func(values) if values else None
+    return combine
+
+
+MERGEABLE_AGGREGATES = {
+    Count: _combine_sum,
+    Sum: _combine_sum,
+    Max: _combine_with(max),
+    Min: _combine_with(min),
+}
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    A queryset that runs on every shard when it isn't pinned to one, with
+    using(), for_owner() or a related-object hint.
+    """
+
+    def for_owner(self, user):
+        """The owner's contacts, read from their shard only"""
+        if not enabled():
+            return self.filter(user=user)
+        return self.using(shard_for_user(user.pk)).filter(user=user)
+
+    def on_primary(self):
+        """Skips read replicas; shards are primaries already"""
+        return self if enabled() else self.using(PRIMARY)
+
+    def _fan_out_aliases(self):
+        if self._db is not None or 'instance' in self._hints or not enabled():
+            return None
+        return shards()
+
+    def _order_getter(self, name):
+        opts = self.model._meta
+        if name == 'pk':
+            name = opts.pk.name
+        try:
+            attname = opts.get_field(name).attname
+        except FieldDoesNotExist:
+            attname = name
+        if issubclass(self._iterable_class, ModelIterable):
+            return attrgetter(attname)
+        fields = list(self._fields) or [field.attname for field in opts.concrete_fields] + list(self.query.annotation_select)
+        for candidate in (name, attname):
+            if candidate in fields:
+                if issubclass(self._iterable_class, ValuesIterable):
+                    return itemgetter(candidate)
+                if issubclass(self._iterable_class, FlatValuesListIterable):
+                    return lambda row: row
+                return itemgetter(fields.index(candidate))
+        raise NotSupportedError(f'Merging shards ordered by {name!r} needs it among the selected fields')
+
+    def _merge_key(self):
+        """Sort key reproducing the ORDER BY on fetched rows, None when unordered"""
+        query = self.query
+        ordering = query.order_by or (query.default_ordering and self.model._meta.ordering) or ()
+        if query.extra_order_by:
+            raise NotSupportedError('extra(order_by=...) is not supported across shards')
+        if not ordering:
+            return None
+        parts = []
+        for item in ordering:
+            if not isinstance(item, str) or item == '?' or '__' in item:
+                raise NotSupportedError(f'Cannot merge shards ordered by {item!r}')
+            parts.append((self._order_getter(item.lstrip('-')), item.startswith('-')))
+
+        def key(row):
+            return tuple(
+                _Descending(_nulls_first(get(row))) if descending else _nulls_first(get(row))
+                for get, descending in parts
+            )
+        return key
+
+    def _fetch_merged(self, aliases):
+        low, high = self.query.low_mark, self.query.high_mark
+        key = self._merge_key()
+
+        def fetch(alias):
+            clone = self._chain()
+            clone._db = alias
+            clone._prefetch_related_lookups = ()
+            # every shard may hold the whole window, so each returns its first `high` rows
+            clone.query.clear_limits()
+            clone.query.set_limits(0, high)
+            return list(clone)
+
+        results = fan_out(fetch, aliases)
+        rows = heapq.merge(*results, key=key) if key else chain.from_iterable(results)
+        return list(islice(rows, low, high))
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            aliases = self._fan_out_aliases()
+            if aliases is not None:
+                self._result_cache = self._fetch_merged(aliases)
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=None):
+        aliases = self._fan_out_aliases()
+        if aliases is None:
+            return super().iterator(chunk_size)
+        if self.query.is_sliced:
+            return iter(self._fetch_merged(aliases))
+        key = self._merge_key()
+        iterators = [self.using(alias).iterator(chunk_size) for alias in aliases]
+        return heapq.merge(*iterators, key=key) if key else chain.from_iterable(iterators)
+
+    def count(self):
+        aliases = self._fan_out_aliases()
+        if aliases is None or self._result_cache is not None:
+            return super().count()
+        if self.query.is_sliced:
+            return len(self)
+        return sum(fan_out(lambda alias: self.using(alias).count(), aliases))
+
+    def exists(self):
+        aliases = self._fan_out_aliases()
+        if aliases is None or self._result_cache is not None:
+            return super().exists()
+        if self.query.is_sliced:
+            return bool(len(self))
+        return any(fan_out(lambda alias: self.using(alias).exists(), aliases))
+
+    def aggregate(self, *args, **kwargs):
+        aliases = self._fan_out_aliases()
+        if aliases is None:
+            return super().aggregate(*args, **kwargs)
+        for arg in args:
+            kwargs[arg.default_alias] = arg
+        for name, aggregate in kwargs.items():
+            if type(aggregate) not in MERGEABLE_AGGREGATES or getattr(aggregate, 'distinct', False):
+                raise NotSupportedError(f'{name}: only Count, Sum, Max and Min can be merged across shards')
+        results = fan_out(
+            lambda alias: self.using(alias).aggregate(**{name: agg.copy() for name, agg in kwargs.items()}),
+            aliases,
+        )
+        return {
+            name: MERGEABLE_AGGREGATES[type(aggregate)]([result[name] for result in results])
+            for name, aggregate in kwargs.items()
+        }
+
+    # writes run shard by shard in this thread, keeping the caller's transactions and on_commit hooks
+
+    def create(self, **kwargs):
+        if self._fan_out_aliases() is None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if self._fan_out_aliases() is None:
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(shard_for_instance(obj), []).append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if self._fan_out_aliases() is None:
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(shard_for_instance(obj), []).append(obj)
+        return sum(self.using(alias).bulk_update(group, fields, batch_size=batch_size) for alias, group in groups.items())
+
+    def update(self, **kwargs):
+        aliases = self._fan_out_aliases()
+        if aliases is None:
+            return super().update(**kwargs)
+        return sum(self.using(alias).update(**kwargs) for alias in aliases)
+
+    def delete(self):
+        aliases = self._fan_out_aliases()
+        if aliases is None:
+            return super().delete()
+        total, per_model = 0, Counter()
+        for alias in aliases:
+            deleted, counts = self.using(alias).delete()
+            total += deleted
+            per_model.update(counts)
+        return total, dict(per_model)
+
+
+class ShardRouter:
+    """
+    Sharded models (Contact, ContactTombstone) read and write on the shard
+    of the instance at hand: where a row was loaded from, or its owner's
+    shard for a new one. Objects reached from a sharded row, like
+    contact.user, come from the primary. Reads without an instance are left
+    to ShardedQuerySet, which fans them out. Every shard gets the full
+    schema so the same migrations apply everywhere.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not enabled():
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if is_sharded(model):
+            return shard_for_instance(instance)
+        if is_sharded(instance):
+            return PRIMARY
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if enabled() and (is_sharded(obj1) or is_sharded(obj2)):
+            aliases = set(shards())
+            return obj1._state.db in aliases and obj2._state.db in aliases
+        return None
+
+
+# ---- rebalancing ----
+
+def misplaced():
+    """(user id, current alias, target alias, contacts) for each owner stored on the wrong shard"""
+    Contact = apps.get_model('work', 'Contact')
+
+    def owners(alias):
+        rows = Contact.objects.using(alias).values_list('user_id').annotate(n=Count('id')).order_by()
+        return [(user_id, alias, count) for user_id, count in rows]
+
+    moves = []
+    for rows in fan_out(owners):
+        for user_id, alias, count in rows:
+            target = shard_for_user(user_id)
+            if target != alias:
+                moves.append((user_id, alias, target, count))
+    return moves
+
+
+def move_contacts(user_id, source, target, batch_size=MOVE_BATCH_SIZE):
+    """
+    Copies a user's contacts to target, ids included, then deletes them
+    from source, one batch at a time. The two databases don't share a
+    transaction: an interrupted move leaves a batch on both, and running
+    it again finishes the job since the copy skips ids target already has.
+    """
+    from .search import remove_contacts
+    Contact = apps.get_model('work', 'Contact')
+    moved = 0
+    while True:
+        batch = list(Contact.objects.using(source).filter(user_id=user_id).order_by('id')[:batch_size])
+        if not batch:
+            return moved
+        ids = [contact.id for contact in batch]
+        with transaction.atomic(using=target):
+            Contact.objects.using(target).bulk_create(batch, ignore_conflicts=True)
+            # indexes them on target and retires cached pages
+            contacts_bulk_saved.send(sender=Contact, instances=batch, moved=True)
+        with transaction.atomic(using=source):
+            # a move, not a deletion: no tombstones for delta sync
+            Contact.objects.using(source).filter(id__in=ids)._raw_delete(source)
+            remove_contacts(ids, using=source)
+        moved += len(batch)
+
+
+def reserve_id_space(alias):
+    """Moves the contact id sequence of the nth shard up to n * SHARD_ID_SPACE"""
+    aliases = shards()
+    if alias not in aliases or connections[alias].vendor != 'sqlite':
+        return
+    floor = aliases.index(alias) * SHARD_ID_SPACE
+    if not floor:
+        return
+    table = apps.get_model('work', 'Contact')._meta.db_table
+    with connections[alias].cursor() as cursor:
+        cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [floor, table, floor])
+        cursor.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+            [table, floor, table],
+        )
+
+
+@receiver(post_migrate)
+def reserve_id_space_after_migrate(sender, using, **kwargs):
+    if sender.label == 'work':
+        reserve_id_space(using)
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_contacts(sender, instance, using, **kwargs):
+    # the ON DELETE CASCADE emulation only looks at the user's own database
+    if not enabled():
+        return
+    Contact = apps.get_model('work', 'Contact')
+    for alias in shards():
+        if alias != using:
+            Contact.objects.using(alias).filter(user_id=instance.pk).delete()
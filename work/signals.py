@@ -0,0 +1,10 @@
+from django.dispatch import Signal
+
+# bulk writes skip the per-instance post_save/post_delete signals,
+# these carry the affected rows so receivers can catch up in one go
+
+# kwargs: instances, moved (True when rebalance_shards relocated them unchanged)
+contacts_bulk_saved = Signal()
+
+# kwargs: ids, user_ids, using (the database they were deleted from)
+contacts_bulk_deleted = Signal()
@@ -0,0 +1,74 @@
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Contact, ContactTombstone
+from .fastpath import contact_values
+
+TOMBSTONE_RETENTION_DAYS = getattr(settings, 'CONTACT_TOMBSTONE_RETENTION_DAYS', 90)
+# how long a write may take between stamping updated_at and committing
+SYNC_WATERMARK_LAG = timedelta(seconds=getattr(settings, 'CONTACT_SYNC_WATERMARK_LAG', 5))
+
+
+class InvalidWatermark(Exception):
+    pass
+
+
+def parse_watermark(value):
+    if not value:
+        return None
+    try:
+        since = parse_datetime(value)
+    except ValueError:
+        # well-formed but out of range, like month 13
+        raise InvalidWatermark(value)
+    if since is None:
+        raise InvalidWatermark(value)
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return since
+
+
+def retention_horizon():
+    return timezone.now() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+
+def changes_since(since):
+    """
+    Rows upserted and ids deleted since the watermark, plus the next watermark.
+    The window is inclusive at since, so clients must apply upserts idempotently.
+    A missing watermark, or one older than the tombstone retention, gets a full
+    snapshot with 'full': True so the client replaces its local copy.
+
+    The next watermark trails the clock by SYNC_WATERMARK_LAG: a transaction
+    that stamped updated_at before the read but commits after it is picked
+    up on the next call instead of being skipped for good.
+    """
+    watermark = timezone.now() - SYNC_WATERMARK_LAG
+    full = since is None or since < retention_horizon()
+    
+    contacts = Contact.objects.filter(updated_at__lte=watermark).order_by('updated_at', 'id')
+    if full:
+        deleted = []
+    else:
+        contacts = contacts.filter(updated_at__gte=since)
+        deleted = list(
+            ContactTombstone.objects
+            .filter(deleted_at__gte=since, deleted_at__lte=watermark)
+            .values_list('contact_id', flat=True)
+            .distinct()
+        )
+    
+    return {
+        'full': full,
+        # 'Z' rather than '+00:00' so the value survives an unencoded query string
+        'watermark': watermark.isoformat().replace('+00:00', 'Z'),
+        'upserted': contact_values(contacts),
+        'deleted': deleted,
+    }
+
+
+def prune_tombstones(before=None):
+    return ContactTombstone.objects.filter(deleted_at__lt=before or retention_horizon()).delete()[0]
@@ -1,3 +1,1478 @@
-from django.test import TestCase
+"""
+Run with `python manage.py test work`.
 
-# Create your tests here.
+Admission control is exercised through LocalBucketBackend with a fake
+clock, and through the middleware with ADMISSION_CONTROL turned on.
+
+The sharding tests need more than one database: two extra SQLite aliases,
+test_shard1 and test_shard2, are registered here before the test runner
+creates its databases (in memory, like 'default'), and CONTACT_SHARDS is
+overridden to put them next to 'default'.
+"""
+import asyncio
+import json
+import math
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from concurrent.futures import Future
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed, ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.db.models import Count, Max, Min, Sum
+from django.http import HttpResponse
+from django.urls import resolve
+from django.utils import timezone
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from . import admission, benchmark, broker, events, fastpath, files, fragments, history, loadgen, profiling, realtime
+from . import roles, routers, search, sharding, thumbnails, validators, views
+from . import cache as contact_cache
+from .imaging import NotAnImage
+from .middleware import ReplicaPinMiddleware, RequestProfilingMiddleware
+from .models import ChatGroupMember, Contact, ContactEvent, ContactTombstone, Message, StoredFile, UserProfile
+from .pagination import CursorPaginator, encode_cursor
+from .serializers import ContactSerializer
+
+SHARD_ALIASES = ['test_shard1', 'test_shard2']
+TEST_SHARDS = ['default', *SHARD_ALIASES]
+
+
+def _register_shard_aliases():
+    for alias in SHARD_ALIASES:
+        if alias not in settings.DATABASES:
+            settings.DATABASES[alias] = {**settings.DATABASES['default'], 'NAME': f'{alias}.sqlite3', 'TEST': {}}
+    # fills in the connection defaults the new aliases are missing
+    configured = connections.configure_settings(settings.DATABASES)
+    for alias in SHARD_ALIASES:
+        connections.settings[alias] = configured[alias]
+
+
+_register_shard_aliases()
+
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+def make_user(username):
+    return User.objects.create_user(username)
+
+
+def make_contacts(user, n, prefix='c'):
+    return [
+        Contact.objects.create(user=user, name=f'{prefix}{user.username} {i}', phone='+15550000000', email='c@example.com')
+        for i in range(n)
+    ]
+
+
+def users_on_every_shard(prefix):
+    """Creates users until each of TEST_SHARDS is the home of at least one"""
+    users, covered = [], set()
+    while covered != set(TEST_SHARDS):
+        user = make_user(f'{prefix}{len(users)}')
+        users.append(user)
+        covered.add(sharding.shard_for_user(user.pk, TEST_SHARDS))
+    return users
+
+
+@override_settings(CONTACT_SHARDS=TEST_SHARDS)
+class ShardingTests(TestCase):
+    databases = set(TEST_SHARDS)
+
+    @classmethod
+    def setUpTestData(cls):
+        for alias in TEST_SHARDS:
+            sharding.reserve_id_space(alias)
+        cls.users = users_on_every_shard('sh')
+        for user in cls.users:
+            make_contacts(user, 4)
+
+    def all_contacts(self):
+        return [contact for alias in TEST_SHARDS for contact in Contact.objects.using(alias).all()]
+
+    def test_contacts_live_on_owner_shard(self):
+        for user in self.users:
+            alias = sharding.shard_for_user(user.pk)
+            contacts = list(Contact.objects.for_owner(user))
+            self.assertEqual(len(contacts), 4)
+            self.assertEqual({contact._state.db for contact in contacts}, {alias})
+            floor = TEST_SHARDS.index(alias) * sharding.SHARD_ID_SPACE
+            self.assertTrue(all(floor < contact.id < floor + sharding.SHARD_ID_SPACE for contact in contacts))
+
+    def test_merged_order_and_slices(self):
+        expected = sorted(self.all_contacts(), key=lambda contact: contact.id)
+        expected.sort(key=lambda contact: contact.created_at, reverse=True)
+        merged = list(Contact.objects.order_by('-created_at', 'id'))
+        self.assertEqual([c.id for c in merged], [c.id for c in expected])
+        self.assertEqual([c.id for c in Contact.objects.order_by('-created_at', 'id')[3:9]],
+                         [c.id for c in expected[3:9]])
+        by_id = sorted(contact.id for contact in expected)
+        self.assertEqual(list(Contact.objects.order_by('id').values_list('id', flat=True)), by_id)
+        self.assertEqual([row['id'] for row in Contact.objects.order_by('id').values('id').iterator(chunk_size=3)], by_id)
+
+    def test_cursor_pages_cover_every_contact_once(self):
+        paginator = CursorPaginator(Contact.objects.all(), ordering=('created_at', 'id'), page_size=5)
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(contact.id for contact in page.object_list)
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        expected = sorted(self.all_contacts(), key=lambda contact: (contact.created_at, contact.id))
+        self.assertEqual(seen, [contact.id for contact in expected])
+
+    def test_count_exists_and_aggregates(self):
+        contacts = self.all_contacts()
+        self.assertEqual(Contact.objects.count(), len(contacts))
+        self.assertTrue(Contact.objects.exists())
+        self.assertFalse(Contact.objects.filter(name='nobody').exists())
+        self.assertEqual(Contact.objects.order_by('id')[2:5].count(), 3)
+        result = Contact.objects.aggregate(count=Count('id'), total=Sum('id'), low=Min('id'), high=Max('updated_at'))
+        self.assertEqual(result, {
+            'count': len(contacts),
+            'total': sum(contact.id for contact in contacts),
+            'low': min(contact.id for contact in contacts),
+            'high': max(contact.updated_at for contact in contacts),
+        })
+        self.assertEqual(Contact.objects.filter(name='nobody').aggregate(high=Max('id')), {'high': None})
+
+    def test_get_update_and_delete_across_shards(self):
+        far = Contact.objects.order_by('-id').first()
+        self.assertEqual(Contact.objects.get(id=far.id)._state.db, sharding.shard_for_user(far.user_id))
+
+        picked = [Contact.objects.for_owner(user).first().id for user in self.users]
+        self.assertEqual(Contact.objects.filter(id__in=picked).update(additional='touched'), len(picked))
+        self.assertEqual(Contact.objects.filter(additional='touched').count(), len(picked))
+
+        contact = Contact.objects.get(id=picked[0])
+        contact.name = 'Renamed'
+        contact.save()
+        self.assertEqual(Contact.objects.for_owner(self.users[0]).get(id=picked[0]).name, 'Renamed')
+
+        deleted, per_model = Contact.objects.filter(id__in=picked).delete()
+        self.assertEqual(per_model['work.Contact'], len(picked))
+        self.assertFalse(Contact.objects.filter(id__in=picked).exists())
+        self.assertEqual(Contact.objects.count(), 4 * len(self.users) - len(picked))
+
+    def test_tombstones_and_index_stay_on_the_shard(self):
+        user = next(user for user in self.users if sharding.shard_for_user(user.pk) != 'default')
+        alias = sharding.shard_for_user(user.pk)
+        contact = make_contacts(user, 1, prefix='zebra')[0]
+        contact_id = contact.id
+
+        def indexed(on):
+            with connections[on].cursor() as cursor:
+                cursor.execute(f'SELECT rowid FROM {search.FTS_TABLE} WHERE rowid = %s', [contact_id])
+                return cursor.fetchone() is not None
+
+        if search.fts_available():
+            self.assertEqual([on for on in TEST_SHARDS if indexed(on)], [alias])
+            self.assertEqual(search.search_ids('zebra', user=user), [contact_id])
+            self.assertEqual(search.search_ids('zebra'), [contact_id])
+
+        contact.delete()
+        self.assertEqual(
+            [on for on in TEST_SHARDS if ContactTombstone.objects.using(on).filter(contact_id=contact_id).exists()],
+            [alias],
+        )
+        self.assertTrue(ContactTombstone.objects.filter(contact_id=contact_id).exists())
+        if search.fts_available():
+            self.assertFalse(indexed(alias))
+            self.assertEqual(search.search_ids('zebra'), [])
+
+    def test_user_delete_cascades_to_their_shard(self):
+        user = next(user for user in self.users if sharding.shard_for_user(user.pk) != 'default')
+        alias = sharding.shard_for_user(user.pk)
+        ids = [contact.id for contact in Contact.objects.for_owner(user)]
+        user.delete()
+        self.assertFalse(Contact.objects.using(alias).filter(user_id=user.pk).exists())
+        self.assertEqual(
+            sorted(ContactTombstone.objects.using(alias).filter(contact_id__in=ids).values_list('contact_id', flat=True)),
+            sorted(ids),
+        )
+
+    def test_rebalance_moves_misplaced_users_and_can_rerun(self):
+        with override_settings(CONTACT_SHARDS=['default']):
+            # with one shard configured they all land on 'default'
+            late = users_on_every_shard('late')
+            for user in late:
+                make_contacts(user, 3, prefix='late')
+        moving = [user for user in late if sharding.shard_for_user(user.pk) != 'default']
+        self.assertTrue(moving)
+        self.assertEqual(sorted(move[0] for move in sharding.misplaced()), sorted(user.pk for user in moving))
+
+        # an earlier, interrupted run left a copy of one contact on the target
+        first = Contact.objects.using('default').filter(user=moving[0]).order_by('id').first()
+        Contact.objects.using(sharding.shard_for_user(moving[0].pk)).bulk_create([first])
+
+        total = Contact.objects.count() - 1
+        out = StringIO()
+        call_command('rebalance_shards', batch_size=2, stdout=out)
+        self.assertIn(f'{len(moving)} users to move', out.getvalue())
+        self.assertEqual(sharding.misplaced(), [])
+        self.assertEqual(Contact.objects.count(), total)
+        for user in late:
+            contacts = list(Contact.objects.for_owner(user))
+            self.assertEqual(len(contacts), 3)
+            self.assertEqual({contact._state.db for contact in contacts}, {sharding.shard_for_user(user.pk)})
+        # moves leave no tombstones for delta sync
+        self.assertFalse(ContactTombstone.objects.filter(contact_id=first.id).exists())
+
+        out = StringIO()
+        call_command('rebalance_shards', stdout=out)
+        self.assertIn('0 users to move', out.getvalue())
+        self.assertEqual(Contact.objects.count(), total)
+
+
+    def test_rebuild_search_index_covers_every_shard(self):
+        search.reset_availability()
+        self.addCleanup(search.reset_availability)
+        if not search.fts_available():
+            self.skipTest('FTS5 not available')
+        for alias in TEST_SHARDS:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn(f'{len(self.all_contacts())} contacts indexed', out.getvalue())
+        for user in self.users:
+            ids = sorted(contact.id for contact in Contact.objects.for_owner(user))
+            self.assertEqual(sorted(search.search_ids('c', user=user)), ids)
+
+    def test_cache_invalidation_waits_for_the_shard_commit(self):
+        user = next(user for user in self.users if sharding.shard_for_user(user.pk) != 'default')
+        alias = sharding.shard_for_user(user.pk)
+        contact = Contact.objects.for_owner(user).first()
+        contact_cache.get_contact_data(contact.id)
+        with self.captureOnCommitCallbacks(using=alias) as callbacks:
+            contact.name = 'renamed'
+            contact.save()
+        self.assertNotEqual(contact_cache.get_contact_data(contact.id)['name'], 'renamed')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(contact_cache.get_contact_data(contact.id)['name'], 'renamed')
+
+@override_settings(CONTACT_SHARDS=TEST_SHARDS)
+class ShardFanOutTests(TransactionTestCase):
+    """Outside a transaction reads run on the shard thread pool"""
+    databases = set(TEST_SHARDS)
+
+    def test_parallel_reads_match_each_shard(self):
+        for alias in TEST_SHARDS:
+            sharding.reserve_id_space(alias)
+        for user in users_on_every_shard('fan'):
+            make_contacts(user, 3)
+        per_shard = {alias: Contact.objects.using(alias).count() for alias in TEST_SHARDS}
+        self.assertTrue(all(per_shard.values()))
+        self.assertEqual(Contact.objects.count(), sum(per_shard.values()))
+        ids = list(Contact.objects.order_by('-id').values_list('id', flat=True))
+        self.assertEqual(ids, sorted(ids, reverse=True))
+        self.assertEqual(len(set(ids)), sum(per_shard.values()))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class AdmissionTests(SimpleTestCase):
+    def test_bucket_spends_refills_and_caps_at_burst(self):
+        clock = FakeClock()
+        backend = admission.LocalBucketBackend(clock=clock)
+        self.assertEqual(backend.take('a', 6, rate=2, burst=10), (True, 0.0))
+        admitted, wait = backend.take('a', 6, rate=2, burst=10)
+        self.assertFalse(admitted)
+        self.assertEqual(wait, 1.0)
+        clock.now = 1.0
+        self.assertTrue(backend.take('a', 6, rate=2, burst=10)[0])
+        clock.now = 100.0
+        self.assertTrue(backend.take('a', 10, rate=2, burst=10)[0])
+        self.assertFalse(backend.take('a', 1, rate=2, burst=10)[0])
+        # buckets are per key
+        self.assertTrue(backend.take('b', 10, rate=2, burst=10)[0])
+
+    def test_bucket_drops_least_recent_keys(self):
+        backend = admission.LocalBucketBackend(clock=FakeClock(), max_keys=2)
+        for key in ('a', 'b', 'c'):
+            backend.take(key, 1, rate=1, burst=5)
+        self.assertEqual(list(backend.buckets), ['b', 'c'])
+
+    def test_inflight_limit(self):
+        inflight = admission.InFlight(limit=2)
+        self.assertTrue(inflight.enter())
+        self.assertTrue(inflight.enter())
+        self.assertFalse(inflight.enter())
+        inflight.leave()
+        self.assertTrue(inflight.enter())
+
+    def test_client_key(self):
+        request = RequestFactory().get('/api/list/', REMOTE_ADDR='10.0.0.1', HTTP_X_REAL_IP='203.0.113.7')
+        anonymous = mock.Mock(is_authenticated=False)
+        self.assertEqual(admission.client_key(request, mock.Mock(is_authenticated=True, pk=5)), 'user:5')
+        self.assertEqual(admission.client_key(request, anonymous), 'ip:10.0.0.1')
+        with mock.patch.object(admission, 'ADMISSION_CLIENT_IP_HEADER', 'HTTP_X_REAL_IP'):
+            self.assertEqual(admission.client_key(request, anonymous), 'ip:203.0.113.7')
+
+    def test_client_key_ignores_forged_forwarded_hops(self):
+        anonymous = mock.Mock(is_authenticated=False)
+        # the client sent "1.1.1.1, 2.2.2.2"; the edge proxy appended 198.51.100.4, the inner one 10.0.0.9
+        request = RequestFactory().get('/api/list/', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2, 198.51.100.4, 10.0.0.9')
+        with mock.patch.object(admission, 'ADMISSION_CLIENT_IP_HEADER', 'HTTP_X_FORWARDED_FOR'):
+            self.assertEqual(admission.client_key(request, anonymous), 'ip:10.0.0.9')
+            with mock.patch.object(admission, 'ADMISSION_TRUSTED_PROXIES', 2):
+                self.assertEqual(admission.client_key(request, anonymous), 'ip:198.51.100.4')
+            with mock.patch.object(admission, 'ADMISSION_TRUSTED_PROXIES', 9):
+                self.assertEqual(admission.client_key(request, anonymous), 'ip:1.1.1.1')
+
+    def test_zero_rate_caps_retry_after(self):
+        backend = admission.LocalBucketBackend(clock=FakeClock())
+        with mock.patch.object(admission, '_backend', backend), mock.patch.object(admission, 'ADMISSION_RATE', 0), \
+                mock.patch.object(admission, 'inflight', admission.InFlight(limit=0)):
+            self.assertIsNone(admission.admit('k', 'get'))
+            backend.buckets['k'] = (0, 0.0)
+            self.assertEqual(admission.admit('k', 'get'), admission.MAX_RETRY_AFTER)
+
+
+# contacts on 'default' only, whatever PYCHATTY_SHARD_PATHS says
+@override_settings(ADMISSION_CONTROL=True, CONTACT_SHARDS=['default'])
+class AdmissionMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('admitted')
+        make_contacts(cls.user, 3)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_rejects_over_budget_with_retry_after(self):
+        cost = admission.route_cost('list-all')
+        with mock.patch.object(admission, '_backend', admission.LocalBucketBackend(clock=FakeClock())):
+            for _ in range(admission.ADMISSION_BURST // cost):
+                self.assertEqual(self.client.get('/api/list/').status_code, 200)
+            response = self.client.get('/api/list/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'message': 'Too Many Requests'})
+        self.assertEqual(response['Retry-After'], str(max(1, math.ceil(cost / admission.ADMISSION_RATE))))
+        self.assertEqual(admission.inflight.current, 0)
+
+    def test_only_api_routes_are_admitted(self):
+        with mock.patch.object(admission, 'admit', return_value=30) as admit:
+            self.assertEqual(self.client.get('/contacts/').status_code, 200)
+            admit.assert_not_called()
+            self.assertEqual(self.client.get('/api/list/').status_code, 429)
+
+    def test_streaming_response_holds_its_slot_until_closed(self):
+        with mock.patch.object(admission, '_backend', admission.LocalBucketBackend(clock=FakeClock())):
+            response = self.client.get('/api/list/', {'stream': 'ndjson'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(admission.inflight.current, 1)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body.splitlines()), 3)
+        self.assertEqual(admission.inflight.current, 0)
+
+    def test_overload_rejects_beyond_the_inflight_cap(self):
+        with mock.patch.object(admission, 'inflight', admission.InFlight(limit=1)) as inflight:
+            inflight.enter()
+            response = self.client.get('/api/get/1/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+# everything below runs on 'default' only, whatever PYCHATTY_SHARD_PATHS says
+@override_settings(CONTACT_SHARDS=['default'])
+class ApiTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('owner')
+
+    def setUp(self):
+        # cache invalidation waits for a commit that TestCase never makes
+        cache.clear()
+        self.client.force_login(self.user)
+
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+
+
+class FileTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        storage = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage, True)
+        patcher = mock.patch.object(files, 'FILE_STORAGE_DIR', storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, name, data, content_type):
+        response = self.client.post('/api/im/upload/', {'file': SimpleUploadedFile(name, data, content_type)})
+        self.assertEqual(response.status_code, 201)
+        return StoredFile.objects.get(reference=response.json()['reference'])
+
+    def test_content_type_comes_from_the_bytes(self):
+        self.assertEqual(self.upload('a.png', PNG_BYTES, 'text/html').content_type, 'image/png')
+        self.assertEqual(self.upload('x.png', b'<script>1</script>', 'image/png').content_type, 'application/octet-stream')
+        self.assertEqual(self.upload('p.svg', b'<svg onload="x()"/>', 'image/svg+xml').content_type, 'image/svg+xml')
+
+    def test_only_raster_images_are_served_inline(self):
+        image = self.upload('a.png', PNG_BYTES, 'image/png')
+        response = self.client.get(f'/api/im/file/{image.reference}/')
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+        page = self.upload('p.html', b'<script>alert(1)</script>', 'text/html')
+        # a row stored before types were detected still claims to be HTML
+        StoredFile.objects.filter(pk=page.pk).update(content_type='text/html')
+        response = self.client.get(f'/api/im/file/{page.reference}/')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_ranges(self):
+        stored = self.upload('t.txt', b'0123456789', 'text/plain')
+        url = f'/api/im/file/{stored.reference}/'
+        response = self.client.get(url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(self.client.get(url, HTTP_RANGE='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20-').status_code, 416)
+
+    def test_missing_bytes_are_not_found(self):
+        stored = self.upload('t.txt', b'gone', 'text/plain')
+        shutil.rmtree(files.FILE_STORAGE_DIR)
+        url = f'/api/im/file/{stored.reference}/'
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=0-1').status_code, 404)
+
+
+class ThumbnailTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.stored = StoredFile.objects.create(name='a.png', content_type='image/png', size=1, sha256='ab' * 32)
+        chat_id = f'{self.user.pk}-{self.user.pk + 1}'
+        message = Message.objects.create(chat_type='private', chat_id=chat_id, sender=self.user, type='IMG',
+                                         content=str(self.stored.reference))
+        self.url = f'/api/im/detail/{chat_id}+{message.uuid}/?thumbnail'
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        for patcher in (mock.patch.object(thumbnails, 'THUMBNAIL_DIR', cache_dir),
+                        mock.patch.object(thumbnails, 'pillow_available', return_value=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def render_failing_with(self, error):
+        future = Future()
+        future.set_exception(error)
+        pool = mock.Mock()
+        pool.submit.return_value = future
+        return mock.patch.object(thumbnails, '_get_pool', return_value=pool)
+
+    def test_unreadable_image_is_422(self):
+        with self.render_failing_with(NotAnImage('cannot identify image file')):
+            self.assertEqual(self.client.post(self.url).status_code, 422)
+
+    def test_slow_render_is_503(self):
+        with self.render_failing_with(TimeoutError()):
+            self.assertEqual(self.client.post(self.url).status_code, 503)
+
+    def test_infrastructure_errors_are_not_invalid_images(self):
+        with self.render_failing_with(PermissionError('cache dir')):
+            with self.assertRaises(PermissionError):
+                thumbnails.get_thumbnail(self.stored)
+
+
+class BulkTests(ApiTestCase):
+    def send(self, method, path, body):
+        return getattr(self.client, method)(path, json.dumps(body), content_type='application/json')
+
+    def test_create_validates_every_row(self):
+        response = self.send('put', '/api/bulk/new/', [
+            {'name': 'A', 'phone': '+1 555 010 0000', 'email': 'A@Example.com'},
+            {'name': 'B', 'phone': '+15550100001', 'email': 'b@example.com'},
+        ])
+        self.assertEqual(response.status_code, 201)
+        first = Contact.objects.get(id=response.json()['ids'][0])
+        self.assertEqual((first.user, first.phone, first.email), (self.user, '+15550100000', 'a@example.com'))
+
+        response = self.send('put', '/api/bulk/new/', [{'name': 'C', 'phone': 'x', 'email': 'a@b'}, 'row'])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(set(errors[0]), {'phone', 'email'})
+        self.assertIn('non_field_errors', errors[1])
+        self.assertEqual(Contact.objects.count(), 2)
+        self.assertEqual(self.send('put', '/api/bulk/new/', {}).status_code, 400)
+
+    def test_update(self):
+        a, b = make_contacts(self.user, 2)
+        response = self.send('patch', '/api/bulk/update/', [{'id': a.id, 'name': 'A2'}, {'id': b.id, 'additional': 'x'}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Contact.objects.get(id=a.id).name, 'A2')
+        self.assertEqual(Contact.objects.get(id=b.id).additional, 'x')
+
+    def test_update_rejects_duplicate_and_non_integer_ids(self):
+        a, b = make_contacts(self.user, 2)
+        for rows, bad in (
+            ([{'id': a.id, 'name': 'X'}, {'id': a.id, 'name': 'Y'}], 1),
+            ([{'id': a.id + 0.7, 'name': 'X'}], 0),
+            ([{'id': True, 'name': 'X'}], 0),
+            ([{'id': str(a.id), 'name': 'X'}], 0),
+            ([{'id': [a.id], 'name': 'X'}], 0),
+            ([{'name': 'X'}], 0),
+            ([{'id': 10 ** 12, 'name': 'X'}], 0),
+        ):
+            response = self.send('patch', '/api/bulk/update/', rows)
+            self.assertEqual(response.status_code, 400, rows)
+            self.assertIn('id', response.json()['errors'][bad])
+        self.assertEqual(set(Contact.objects.values_list('name', flat=True)), {a.name, b.name})
+
+    def test_delete_only_takes_integer_ids(self):
+        a, b = make_contacts(self.user, 2)
+        for ids in ([a.id, b.id + 0.5], [True], ['1'], [None]):
+            response = self.send('delete', '/api/bulk/delete/', ids)
+            self.assertEqual(response.status_code, 400, ids)
+        self.assertEqual(Contact.objects.count(), 2)
+        response = self.send('delete', '/api/bulk/delete/', [a.id, 10 ** 12])
+        self.assertEqual(response.json(), {'message': 'done', 'deleted': [a.id], 'not_found': [10 ** 12]})
+        self.assertTrue(ContactTombstone.objects.filter(contact_id=a.id).exists())
+
+
+class SyncTests(ApiTestCase):
+    def test_invalid_watermarks_are_400(self):
+        for since in ('yesterday', '2024-13-45T00:00:00', '2024-02-30T25:00:00Z'):
+            self.assertEqual(self.client.get('/api/sync/', {'since': since}).status_code, 400, since)
+
+    def test_full_snapshot_then_deltas_with_tombstones(self):
+        kept, gone = make_contacts(self.user, 2)
+        past = timezone.now() - timedelta(minutes=1)
+        Contact.objects.filter(id__in=[kept.id, gone.id]).update(updated_at=past)
+
+        response = self.client.get('/api/sync/')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body['full'])
+        self.assertEqual({row['id'] for row in body['upserted']}, {kept.id, gone.id})
+
+        since = (past - timedelta(seconds=1)).isoformat()
+        gone_id = gone.id
+        gone.delete()
+        ContactTombstone.objects.filter(contact_id=gone_id).update(deleted_at=past)
+        body = self.client.get('/api/sync/', {'since': since}).json()
+        self.assertFalse(body['full'])
+        self.assertEqual([row['id'] for row in body['upserted']], [kept.id])
+        self.assertEqual(body['deleted'], [gone_id])
+
+    def test_naive_watermark_is_utc(self):
+        response = self.client.get('/api/sync/', {'since': timezone.now().replace(tzinfo=None).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['full'])
+
+    def test_recent_writes_wait_for_the_next_watermark(self):
+        make_contacts(self.user, 1)
+        body = self.client.get('/api/sync/').json()
+        self.assertEqual(body['upserted'], [])
+
+
+class CursorPaginationTests(ApiTestCase):
+    def test_pages_forward_and_back(self):
+        ids = [contact.id for contact in make_contacts(self.user, 7)]
+        seen, cursor, pages = [], None, []
+        while True:
+            body = self.client.get('/api/list-cursor/', {'page_size': 3, 'ordering': 'id', **({'cursor': cursor} if cursor else {})}).json()
+            pages.append(body)
+            seen += [row['id'] for row in body['results']]
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(seen, ids)
+        back = self.client.get('/api/list-cursor/', {'page_size': 3, 'ordering': 'id', 'cursor': pages[-1]['previous_cursor']}).json()
+        self.assertEqual([row['id'] for row in back['results']], ids[3:6])
+        exact = self.client.get('/api/list-cursor/', {'count': 'exact'}).json()
+        self.assertEqual(exact['count'], 7)
+
+    def test_invalid_cursors_are_400(self):
+        make_contacts(self.user, 2)
+        for ordering, cursor in (
+            ('created', 'not-a-cursor'),
+            ('created', encode_cursor([{'a': 1}, 1])),
+            ('created', encode_cursor([[1], 1])),
+            ('created', encode_cursor(['2026-01-01T00:00:00Z'])),
+            ('created', encode_cursor([1, 1])),
+            ('created', encode_cursor([None, 1])),
+            ('id', encode_cursor(['ab'])),
+            ('id', encode_cursor([10 ** 30])),
+            ('id', encode_cursor([True])),
+            ('id', 'eyJ2IjoiMTIifQ'),  # {"v":"12"}
+            ('id', 'WzFd'),  # [1]
+        ):
+            response = self.client.get('/api/list-cursor/', {'ordering': ordering, 'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+        self.assertEqual(self.client.get('/api/list-cursor/', {'ordering': 'name'}).status_code, 400)
+
+
+class GetDetailTests(ApiTestCase):
+    def post(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type='application/json')
+
+    def test_ids_returned_in_request_order(self):
+        first, second = make_contacts(self.user, 2)
+        for url in ('/api/get-detail/', '/api/async/get-detail/'):
+            body = self.post(url, {'ids': [second.id, 999999, first.id]}).json()
+            self.assertEqual([row['id'] for row in body['results']], [second.id, 999999, first.id])
+            self.assertEqual(body['results'][1]['message'], 'Not Found')
+
+    def test_sync_and_async_reject_the_same_input(self):
+        too_many = list(range(1, views.DETAIL_MAX_IDS + 2))
+        for payload in ({'ids': 'abc'}, {'ids': {'1': 1}}, {'ids': [1.5]}, {'ids': [True]}, {'ids': ['1']},
+                        {'ids': too_many}, {'id': 'x'}, {}):
+            for url in ('/api/get-detail/', '/api/async/get-detail/'):
+                self.assertEqual(self.post(url, payload).status_code, 400, (url, payload))
+
+    def test_single_id(self):
+        contact = make_contacts(self.user, 1)[0]
+        for url in ('/api/get-detail/', '/api/async/get-detail/'):
+            self.assertEqual(self.post(url, {'id': contact.id}).json()['name'], contact.name)
+            self.assertEqual(self.post(url, {'id': 999999}).status_code, 404)
+        self.assertEqual(self.client.post('/api/get-detail/', 'not json', content_type='application/json').status_code, 400)
+
+    def test_misses_load_with_one_query(self):
+        ids = [contact.id for contact in make_contacts(self.user, 5)]
+        with self.assertNumQueries(1):
+            self.assertEqual(set(contact_cache.get_many_contact_data(ids + [999999])), set(ids))
+        with self.assertNumQueries(0):
+            self.assertEqual(set(contact_cache.get_many_contact_data(ids)), set(ids))
+
+
+class SearchTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for name in ('John Smith', 'Johanna Berg', 'Bob Ohnesorg', 'Alice'):
+            Contact.objects.create(user=cls.user, name=name, phone='+15550000000', email='c@example.com')
+
+    def setUp(self):
+        super().setUp()
+        search.reset_availability()
+        self.addCleanup(search.reset_availability)
+
+    def names(self, url):
+        response = self.client.get(url)
+        return response.status_code, sorted(row['name'] for row in response.json().get('results', []))
+
+    def test_prefix_matches_any_word(self):
+        for url in ('/api/search/jo/', '/api/async/search/jo/'):
+            self.assertEqual(self.names(url), (200, ['Johanna Berg', 'John Smith']))
+        self.assertEqual(self.names('/api/search/smi/'), (200, ['John Smith']))
+
+    def test_infix_matches_follow_prefix_matches(self):
+        for url in ('/api/search/ohn/', '/api/async/search/ohn/'):
+            response = self.client.get(url).json()
+            names = [row['name'] for row in response['results']]
+            self.assertEqual(names[0], 'Bob Ohnesorg')
+            self.assertEqual(sorted(names[1:]), ['John Smith'])
+        self.assertEqual(self.names('/api/search/mith/'), (200, ['John Smith']))
+        self.assertEqual(self.names('/api/search/lic/'), (200, ['Alice']))
+
+    def test_results_capped_without_duplicates(self):
+        contacts, truncated = search.search_capped(Contact.objects.all(), 'o', limit=2)
+        self.assertEqual(len(contacts), 2)
+        self.assertEqual(len({contact.id for contact in contacts}), 2)
+        self.assertTrue(truncated)
+
+    def test_no_match_is_404(self):
+        self.assertEqual(self.client.get('/api/search/zzz/').status_code, 404)
+        self.assertEqual(self.client.get('/api/async/search/zzz/').status_code, 404)
+
+
+class Socket:
+    """Drives realtime.websocket_application the way an ASGI server would"""
+
+    def __init__(self, path, session=None, origin='http://testserver', outbox=0):
+        headers = []
+        if session:
+            headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={session}'.encode()))
+        if origin:
+            headers.append((b'origin', origin.encode()))
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue(outbox)
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+        scope = {'type': 'websocket', 'path': path, 'headers': headers}
+        self.task = asyncio.create_task(realtime.websocket_application(scope, self.inbox.get, self.outbox.put))
+
+    async def receive(self):
+        return await asyncio.wait_for(self.outbox.get(), 2)
+
+    def send(self, data):
+        self.inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def close(self):
+        self.inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(self.task, 2)
+
+
+class WebsocketTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.bob, cls.carol = (make_user(name) for name in ('alice', 'bob', 'carol'))
+        ChatGroupMember.objects.create(chat_id='g1', user=cls.alice)
+
+    def setUp(self):
+        patcher = mock.patch.object(broker, '_broker', broker.InMemoryBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def session(self, user):
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def private_path(self, *users):
+        return f'/ws/msg/private/{realtime.private_chat_id(*(user.pk for user in users))}/'
+
+    async def test_foreign_origin_is_refused(self):
+        session = await sync_to_async(self.session)(self.alice)
+        path = await sync_to_async(self.private_path)(self.alice, self.bob)
+        refused = Socket(path, session, origin='https://evil.example')
+        self.assertEqual(await refused.receive(), {'type': 'websocket.close', 'code': realtime.CLOSE_FORBIDDEN})
+        for origin in ('http://testserver', None):
+            accepted = Socket(path, session, origin=origin)
+            self.assertEqual(await accepted.receive(), {'type': 'websocket.accept'})
+            await accepted.close()
+
+    async def test_joins_are_limited_to_participants_and_members(self):
+        alice = await sync_to_async(self.session)(self.alice)
+        carol = await sync_to_async(self.session)(self.carol)
+        private = await sync_to_async(self.private_path)(self.alice, self.bob)
+        for path, session, expected in (
+            (private, carol, realtime.CLOSE_FORBIDDEN),
+            ('/ws/msg/group/g1/', carol, realtime.CLOSE_FORBIDDEN),
+            ('/ws/msg/group/g1/', None, realtime.CLOSE_UNAUTHORIZED),
+            ('/ws/msg/nowhere/', alice, realtime.CLOSE_NOT_FOUND),
+        ):
+            socket = Socket(path, session)
+            self.assertEqual(await socket.receive(), {'type': 'websocket.close', 'code': expected}, path)
+        member = Socket('/ws/msg/group/g1/', alice)
+        self.assertEqual(await member.receive(), {'type': 'websocket.accept'})
+        member.send({'type': 'TXT', 'content': 'hi all', 'ref': 'r1'})
+        reply = json.loads((await member.receive())['text'])
+        if 'status' not in reply:
+            reply = json.loads((await member.receive())['text'])
+        self.assertEqual((reply['ref'], reply['status']), ('r1', realtime.STATUS_STORED))
+        await member.close()
+
+    async def test_slow_consumer_is_dropped_and_closed(self):
+        session = await sync_to_async(self.session)(self.alice)
+        # the outbox takes one packet, the rest back up in the subscriber queue
+        socket = Socket('/ws/msg/group/g1/', session, outbox=1)
+        self.assertEqual(await socket.receive(), {'type': 'websocket.accept'})
+        await asyncio.sleep(0)
+        for i in range(broker.QUEUE_SIZE + 10):
+            await broker.get_broker().publish(realtime.chat_topic('group', 'g1'), str(i))
+        self.assertGreaterEqual(broker.get_broker().stats()['dropped'], 1)
+        self.assertEqual(broker.get_broker().stats()['subscribers'], 0)
+        while True:
+            event = await socket.receive()
+            if event['type'] == 'websocket.close':
+                break
+        self.assertEqual(event['code'], realtime.CLOSE_SLOW_CONSUMER)
+        await socket.close()
+
+    async def test_contact_events_are_announced(self):
+        session = await sync_to_async(self.session)(self.alice)
+        socket = Socket('/ws/msg/ann/', session)
+        self.assertEqual(await socket.receive(), {'type': 'websocket.accept'})
+
+        def promote():
+            with self.captureOnCommitCallbacks(execute=True):
+                events.record(self.alice.pk, 'promoted', actor_id=self.bob.pk, summary='Promoted')
+
+        await sync_to_async(promote)()
+        packet = json.loads((await socket.receive())['text'])
+        self.assertEqual(packet['announcement'], 'ContactAnnouncement')
+        self.assertEqual((packet['type'], packet['actorId']), ('promoted', self.bob.pk))
+        await socket.close()
+
+
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        patcher = mock.patch.object(profiling, 'PROFILE_DIR', self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def profiles(self):
+        return sorted(name for name in os.listdir(self.dir) if name.endswith('.prof'))
+
+    def test_one_profiler_at_a_time(self):
+        first = profiling.acquire_profiler()
+        self.assertIsNotNone(first)
+        self.assertIsNone(profiling.acquire_profiler())
+        profiling.release_profiler()
+        self.assertIsNotNone(profiling.acquire_profiler())
+        profiling.release_profiler()
+
+    @override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SLOW_MS=0)
+    def test_slow_requests_dumped_unless_another_is_profiled(self):
+        middleware = RequestProfilingMiddleware(lambda request: HttpResponse('ok'))
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(len(self.profiles()), 1)
+        self.assertIsNotNone(profiling.acquire_profiler())
+        try:
+            response = middleware(RequestFactory().get('/'))
+        finally:
+            profiling.release_profiler()
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_prune_keeps_the_newest(self):
+        for i in range(5):
+            path = os.path.join(self.dir, f'p{i}.prof')
+            open(path, 'w').close()
+            os.utime(path, (i, i))
+        open(os.path.join(self.dir, 'stats-1.json'), 'w').close()
+        profiling.prune_profiles(keep=2)
+        self.assertEqual(self.profiles(), ['p3.prof', 'p4.prof'])
+        self.assertIn('stats-1.json', os.listdir(self.dir))
+
+
+class ImportTests(ApiTestCase):
+    CSV = b'Name,Phone,E-mail\nAda,+15550000001,ada@example.com\nBob,+15550000002,\nCyd,+15550000003,cyd@example.com\n'
+
+    def upload(self, content=CSV, name='contacts.csv', **params):
+        query = '?' + '&'.join(f'{key}={value}' for key, value in params.items()) if params else ''
+        return self.client.post(f'/api/import/{query}', {'file': SimpleUploadedFile(name, content)})
+
+    def test_imports_valid_rows_for_the_signed_in_user(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['imported'], body['failed']), (2, 1))
+        self.assertEqual(body['errors'][0]['row'], 3)
+        self.assertEqual(sorted(Contact.objects.filter(user=self.user).values_list('name', flat=True)), ['Ada', 'Cyd'])
+
+    def test_vcard(self):
+        card = b'BEGIN:VCARD\r\nVERSION:3.0\r\nN:Lovelace;Ada\r\nTEL;TYPE=cell:+15550000001\r\nEMAIL:ada@example.com\r\nEND:VCARD\r\n'
+        self.assertEqual(self.upload(card, 'ada.vcf').json()['imported'], 1)
+        self.assertTrue(Contact.objects.filter(user=self.user, name='Ada Lovelace').exists())
+
+    def test_anonymous_is_refused(self):
+        self.client.logout()
+        self.assertEqual(self.upload().status_code, 401)
+        self.assertFalse(Contact.objects.exists())
+
+    def test_limits(self):
+        with mock.patch.object(views, 'IMPORT_MAX_BYTES', 10):
+            self.assertEqual(self.upload().status_code, 413)
+        with mock.patch.object(views, 'IMPORT_MAX_ROWS', 2):
+            self.assertEqual(self.upload().status_code, 413)
+        self.assertFalse(Contact.objects.exists())
+
+    def test_invalid_input(self):
+        self.assertEqual(self.client.post('/api/import/').status_code, 400)
+        self.assertEqual(self.upload(type='xml').status_code, 400)
+        self.assertEqual(self.upload(b'phone,email\n+15550000001,a@example.com\n').status_code, 400)
+        self.assertFalse(Contact.objects.exists())
+
+    def test_route_has_an_admission_cost(self):
+        self.assertEqual(admission.route_cost(resolve('/api/import/').url_name), admission.DEFAULT_ROUTE_COSTS['import'])
+        self.assertGreater(admission.route_cost('import'), 1)
+
+    def test_command_rejects_bad_chunk_sizes(self):
+        for chunk_size in ('0', '-5', 'ten'):
+            with self.assertRaises(CommandError):
+                call_command('import_contacts', 'contacts.csv', '--chunk-size', chunk_size)
+
+
+class ExportTests(ApiTestCase):
+    def test_streamed_json_matches_the_plain_body(self):
+        make_contacts(self.user, 7)
+        plain = self.client.get('/api/list/').json()
+        for chunk_size in ('2', '500', 'abc', '-1'):
+            response = self.client.get('/api/list/', {'stream': 'json', 'chunk_size': chunk_size})
+            self.assertTrue(response.streaming)
+            self.assertEqual(json.loads(b''.join(response.streaming_content)), plain, chunk_size)
+
+    def test_ndjson_is_one_row_per_line(self):
+        ids = [contact.id for contact in make_contacts(self.user, 3)]
+        response = self.client.get('/api/list/', {'stream': 'ndjson', 'chunk_size': 2})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['id'] for row in rows], ids)
+
+    def test_invalid_stream_format_and_empty_table(self):
+        self.assertEqual(self.client.get('/api/list/', {'stream': 'json'}).status_code, 404)
+        make_contacts(self.user, 1)
+        self.assertEqual(self.client.get('/api/list/', {'stream': 'xml'}).status_code, 400)
+
+
+class ContactCacheTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        contact_cache.reset_stats()
+
+    def test_reads_through_and_refreshes_on_commit(self):
+        contact = make_contacts(self.user, 1)[0]
+        self.assertEqual(contact_cache.get_contact_data(contact.id)['name'], contact.name)
+        with self.assertNumQueries(0):
+            contact_cache.get_contact_data(contact.id)
+        self.assertEqual(contact_cache.stats(), {'hits': 1, 'misses': 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.name = 'renamed'
+            contact.save()
+        self.assertEqual(contact_cache.get_contact_data(contact.id)['name'], 'renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.delete()
+        self.assertIsNone(contact_cache.get_contact_data(contact.id))
+
+    def test_bulk_delete_invalidates(self):
+        contacts = make_contacts(self.user, 2)
+        for contact in contacts:
+            contact_cache.get_contact_data(contact.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete('/api/bulk/delete/', json.dumps([contacts[0].id]),
+                                          content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(contact_cache.get_contact_data(contacts[0].id))
+        self.assertIsNotNone(contact_cache.get_contact_data(contacts[1].id))
+
+    def test_list_pages_are_versioned_per_owner(self):
+        make_contacts(self.user, 12)
+        paginator, page = contact_cache.list_page(Contact.objects.all(), self.user.id, 2)
+        self.assertEqual((paginator.count, page.number, len(page.object_list)), (12, 2, 2))
+        with self.assertNumQueries(0):
+            cached_paginator, cached = contact_cache.list_page(Contact.objects.all(), self.user.id, 2)
+        self.assertEqual(cached_paginator.count, 12)
+        self.assertEqual(cached.object_list, page.object_list)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_contacts(self.user, 1, prefix='late')
+        paginator, page = contact_cache.list_page(Contact.objects.all(), self.user.id, 2)
+        self.assertEqual((paginator.count, len(page.object_list)), (13, 3))
+
+    def test_out_of_range_pages(self):
+        make_contacts(self.user, 3)
+        self.assertEqual(contact_cache.list_page(Contact.objects.all(), None, 'abc')[1].number, 1)
+        self.assertEqual(contact_cache.list_page(Contact.objects.all(), None, 99)[1].number, 1)
+
+
+class ConditionalGetTests(ApiTestCase):
+    def test_contact_etag(self):
+        contact = make_contacts(self.user, 1)[0]
+        url = f'/api/get/{contact.id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.name = 'renamed'
+            contact.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        missing = self.client.get('/api/get/999999/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(missing.status_code, 404)
+        self.assertFalse(missing.has_header('ETag'))
+
+    def test_list_etag_follows_writes_and_deletes(self):
+        first, second = make_contacts(self.user, 2)
+        etag = self.client.get('/api/list/')['ETag']
+        self.assertEqual(self.client.get('/api/list/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # the query string is part of the tag, a streamed body never matches a plain one
+        self.assertNotEqual(self.client.get('/api/list/', {'stream': 'json'})['ETag'], etag)
+
+        first.delete()
+        response = self.client.get('/api/list/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+
+        make_contacts(self.user, 1, prefix='late')
+        self.assertEqual(self.client.get('/api/list/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        page = self.client.get('/api/list-page/1/')
+        self.assertEqual(self.client.get('/api/list-page/1/', HTTP_IF_NONE_MATCH=page['ETag']).status_code, 304)
+
+
+@override_settings(CONTACT_SHARDS=['default'], PASSWORD_HASHERS=FAST_HASHERS)
+class LoadgenTests(TestCase):
+    def test_seed_creates_users_profiles_and_contacts(self):
+        users = loadgen.seed(2, 3, prefix='seed', batch_size=2)
+        self.assertEqual([user.username for user in users], ['seed0', 'seed1'])
+        self.assertTrue(all(hasattr(user, 'userprofile') for user in users))
+        self.assertEqual(Contact.objects.filter(user__in=users).count(), 6)
+        self.assertTrue(self.client.login(username='seed0', password='load123'))
+        # a second run continues the numbering
+        self.assertEqual([user.username for user in loadgen.seed(1, 0, prefix='seed')], ['seed2'])
+
+    def test_run_route_and_compare(self):
+        user = make_user('bencher')
+        ids = [contact.id for contact in make_contacts(user, 3)]
+        route = next(route for route in benchmark.default_routes(ids) if route.name == 'get')
+        result = benchmark.run_route(route, Client(), requests=4, warmup=1)
+        self.assertEqual((result['requests'], result['errors']), (4, 0))
+        self.assertIsNotNone(result['p99_ms'])
+        previous = {'routes': {'get': {**result, 'p50_ms': result['p50_ms'] * 2, 'rps': 0}}}
+        delta = benchmark.compare({'routes': {'get': result}}, previous)['get']
+        self.assertAlmostEqual(delta['p50_ms'], -50.0)
+        self.assertNotIn('rps', delta)
+
+    def test_commands_reject_bad_counts(self):
+        for command, args in (
+            ('bench', ['--requests', '0']),
+            ('bench', ['--users', '0']),
+            ('seed_contacts', ['--users', '-1']),
+            ('seed_contacts', ['--contacts', 'many']),
+        ):
+            with self.assertRaises(CommandError):
+                call_command(command, *args, stdout=StringIO())
+
+
+class RoleTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.filter(user=self.user).update(user_type='admin')
+
+    def fresh(self, user):
+        return User.objects.get(pk=user.pk)
+
+    def test_role_is_memoized_and_cached(self):
+        other = make_user('regular')
+        self.assertIsNone(roles.get_role(mock.Mock(is_authenticated=False)))
+        with self.assertNumQueries(1):
+            self.assertEqual(roles.get_role(other), 'regular')
+            self.assertEqual(roles.get_role(other), 'regular')
+        user = self.fresh(other)
+        with self.assertNumQueries(0):
+            self.assertEqual(roles.get_role(user), 'regular')
+
+    def test_missing_profile_is_cached_as_no_role(self):
+        other = make_user('orphan')
+        UserProfile.objects.filter(user=other).delete()
+        self.assertIsNone(roles.get_role(self.fresh(other)))
+        user = self.fresh(other)
+        with self.assertNumQueries(0):
+            self.assertIsNone(roles.get_role(user))
+
+    def test_promote_and_demote_take_effect_after_commit(self):
+        other = make_user('climber')
+        self.assertFalse(views.is_admin(self.fresh(other)))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/admin/users/{other.pk}/promote/')
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(views.is_admin(self.fresh(other)))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/users/{other.pk}/demote/')
+        self.assertFalse(views.is_admin(self.fresh(other)))
+
+    def test_role_checks_guard_admin_pages(self):
+        self.client.post(f'/admin/users/{self.user.pk}/demote/')
+        self.assertTrue(views.is_admin(self.fresh(self.user)))
+        other = make_user('visitor')
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(f'/admin/users/{self.user.pk}/demote/').status_code, 302)
+        self.assertTrue(views.is_admin(self.fresh(self.user)))
+        self.assertEqual(self.client.get('/api/stats/').status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class EnsureAdminTests(TestCase):
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('ensure_admin', *args, stdout=out)
+        return out.getvalue()
+
+    def test_startup_creates_nothing(self):
+        self.assertFalse(User.objects.filter(username='admin').exists())
+
+    def test_creates_then_leaves_the_admin_alone(self):
+        self.assertIn('created', self.run_command('--password', 'first-pass'))
+        admin = User.objects.get(username='admin')
+        self.assertEqual(admin.userprofile.user_type, 'admin')
+        self.assertTrue(admin.check_password('first-pass'))
+        self.assertIn('already exists', self.run_command('--password', 'first-pass'))
+        self.assertEqual(User.objects.filter(username='admin').count(), 1)
+
+    def test_restores_role_and_updates_password(self):
+        admin = make_user('admin')
+        UserProfile.objects.filter(user=admin).update(user_type='regular')
+        output = self.run_command('--password', 'second-pass')
+        self.assertIn('updated to administrator', output)
+        self.assertIn('password updated', output)
+        admin.refresh_from_db()
+        self.assertTrue(admin.check_password('second-pass'))
+        self.assertEqual(UserProfile.objects.get(user=admin).user_type, 'admin')
+
+
+class SqliteProfileTests(SimpleTestCase):
+    def test_production_options_reach_the_connection(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        config = {
+            **connections['default'].settings_dict,
+            'NAME': os.path.join(tmp, 'prod.sqlite3'),
+            'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS,
+        }
+        connection = connections['default'].__class__(config, 'production-check')
+        self.addCleanup(connection.close)
+        with connection.cursor() as cursor:
+            pragmas = {}
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'temp_store'):
+                cursor.execute(f'PRAGMA {pragma}')
+                pragmas[pragma] = cursor.fetchone()[0]
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'temp_store': 2})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    def test_bench_sqlite_rejects_bad_arguments(self):
+        for args in (['--workers', '0'], ['--seconds', '0'], ['--contacts', '0'], ['--write-ratio', '1.5']):
+            with self.assertRaises(CommandError):
+                call_command('bench_sqlite', *args, stdout=StringIO())
+
+
+@override_settings(DATABASE_REPLICAS=['replica1', 'replica2'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        token = routers.begin()
+        self.addCleanup(routers.end, token)
+
+    def test_reads_go_to_replicas_until_a_write(self):
+        self.assertIn(self.router.db_for_read(Contact), {'replica1', 'replica2'})
+        self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(self.router.db_for_write(Contact), routers.PRIMARY)
+        self.assertEqual(self.router.db_for_read(Contact), routers.PRIMARY)
+
+    def test_pinned_requests_and_no_replicas_read_the_primary(self):
+        token = routers.begin(pinned=True)
+        self.assertEqual(self.router.db_for_read(Contact), routers.PRIMARY)
+        routers.end(token)
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(self.router.db_for_read(Contact), routers.PRIMARY)
+
+    def test_replicas_are_never_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica1', 'work'))
+        self.assertIsNone(self.router.allow_migrate(routers.PRIMARY, 'work'))
+
+    def test_pin_cookie_after_a_write(self):
+        def view(request):
+            if request.method == 'POST':
+                routers.pin_primary()
+            return HttpResponse(self.router.db_for_read(Contact))
+
+        middleware = ReplicaPinMiddleware(view)
+        factory = RequestFactory()
+        wrote = middleware(factory.post('/'))
+        self.assertIn(middleware.cookie_name, wrote.cookies)
+        read = middleware(factory.get('/'))
+        self.assertNotIn(middleware.cookie_name, read.cookies)
+        self.assertNotEqual(read.content.decode(), routers.PRIMARY)
+        factory.cookies[middleware.cookie_name] = '1'
+        self.assertEqual(middleware(factory.get('/')).content.decode(), routers.PRIMARY)
+
+    def test_middleware_is_skipped_without_replicas(self):
+        with override_settings(DATABASE_REPLICAS=[]), self.assertRaises(MiddlewareNotUsed):
+            ReplicaPinMiddleware(HttpResponse)
+
+
+class AsyncApiTests(ApiTestCase):
+    def send(self, method, url, payload):
+        return getattr(self.client, method)(url, json.dumps(payload), content_type='application/json')
+
+    def test_reads_match_the_sync_views(self):
+        self.assertEqual(self.client.get('/api/async/list/').status_code, 404)
+        contact = make_contacts(self.user, 12)[0]
+        for sync_url, async_url in (
+            ('/api/list/', '/api/async/list/'),
+            ('/api/list-page/2/', '/api/async/list-page/2/'),
+            (f'/api/get/{contact.id}/', f'/api/async/get/{contact.id}/'),
+        ):
+            self.assertEqual(self.client.get(async_url).json(), self.client.get(sync_url).json(), async_url)
+        self.assertEqual(self.client.get('/api/async/get/999999/').status_code, 404)
+
+    def test_writes(self):
+        response = self.send('put', '/api/async/new/', {'name': 'Ada', 'phone': '+15550000001', 'email': 'ada@example.com'})
+        self.assertEqual(response.status_code, 201)
+        contact = Contact.objects.get(name='Ada')
+        self.assertEqual(contact.user, self.user)
+
+        self.assertEqual(self.send('patch', f'/api/async/update/{contact.id}/', {'name': 'Ada L'}).status_code, 200)
+        contact.refresh_from_db()
+        self.assertEqual(contact.name, 'Ada L')
+
+        self.assertEqual(self.client.delete(f'/api/async/delete/{contact.id}/').status_code, 200)
+        self.assertFalse(Contact.objects.filter(id=contact.id).exists())
+
+    def test_invalid_writes(self):
+        contact = make_contacts(self.user, 1)[0]
+        self.assertEqual(self.send('put', '/api/async/new/', {'name': 'No contact details'}).status_code, 400)
+        self.assertEqual(self.client.put('/api/async/new/', 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.send('patch', f'/api/async/update/{contact.id}/', {'email': 'not an email'}).status_code, 400)
+        self.assertEqual(self.send('patch', f'/api/async/update/{contact.id}/', ['name']).status_code, 400)
+        self.assertEqual(self.send('patch', '/api/async/update/999999/', {'name': 'x'}).status_code, 404)
+        self.assertEqual(self.client.delete('/api/async/delete/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/async/new/').status_code, 405)
+
+
+class HistoryTests(ApiTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.peer = make_user('peer')
+        cls.chat_id = realtime.private_chat_id(cls.user.pk, cls.peer.pk)
+        start = timezone.now() - timedelta(minutes=10)
+        cls.messages = [
+            Message.objects.create(chat_type='private', chat_id=cls.chat_id, sender=cls.user if i < 3 else cls.peer,
+                                   content=f'm{i}', send_time=start + timedelta(minutes=i))
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        history.pages.clear()
+
+    def post(self, **payload):
+        body = {'chatType': 'private', 'chatId': self.chat_id, **payload}
+        return self.client.post('/api/im/history/', json.dumps(body), content_type='application/json')
+
+    def millis(self, message):
+        return int(message.send_time.timestamp() * 1000)
+
+    def test_pages_backwards_through_the_chat(self):
+        contents, before = [], None
+        while True:
+            body = self.post(pageSize=2, **({'before': before} if before else {})).json()
+            contents += [row['content'] for row in body['results']]
+            before = body['next']
+            if before is None:
+                break
+        self.assertEqual(contents, ['m4', 'm3', 'm2', 'm1', 'm0'])
+
+    def test_time_window(self):
+        body = self.post(since=self.millis(self.messages[1]), until=self.millis(self.messages[3])).json()
+        self.assertEqual([row['content'] for row in body['results']], ['m2', 'm1'])
+
+    def test_compact_rows_drop_repeats(self):
+        rows = self.post().json()['results']
+        self.assertEqual(rows[0]['sender'], self.peer.pk)
+        self.assertNotIn('sender', rows[1])
+        self.assertEqual(rows[2]['sender'], self.user.pk)
+        self.assertTrue(all('type' not in row and 'mentioned' not in row for row in rows))
+        full = self.post(compact=False).json()['results']
+        self.assertEqual([row['sender'] for row in full], [self.peer.pk] * 2 + [self.user.pk] * 3)
+
+    def test_new_messages_retire_cached_pages(self):
+        self.assertEqual(self.post().json()['results'][0]['content'], 'm4')
+        Message.objects.create(chat_type='private', chat_id=self.chat_id, sender=self.peer, content='m5')
+        self.assertEqual(self.post().json()['results'][0]['content'], 'm5')
+
+    def test_invalid_requests(self):
+        url = '/api/im/history/'
+        self.assertEqual(self.client.post(url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, '[]', content_type='application/json').status_code, 400)
+        for payload in ({'chatType': 'channel'}, {'before': ['x']}, {'since': True}, {'until': {'a': 1}},
+                        {'since': 'yesterday'}, {'until': 10 ** 20}, {'before': 'not-a-cursor'}):
+            self.assertEqual(self.post(**payload).status_code, 400, payload)
+        self.assertEqual(self.client.post(url, json.dumps({'chatType': 'private'}), content_type='application/json').status_code, 400)
+
+    def test_only_participants_and_members_read(self):
+        self.assertEqual(self.post(chatId=realtime.private_chat_id(self.peer.pk, 999)).status_code, 403)
+        self.assertEqual(self.post(chatType='group', chatId='g1').status_code, 403)
+        ChatGroupMember.objects.create(chat_id='g1', user=self.user)
+        self.assertEqual(self.post(chatType='group', chatId='g1').status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.post().status_code, 401)
+
+
+class FastPathTests(ApiTestCase):
+    def assertMatchesSerializer(self, contacts):
+        expected = ContactSerializer(contacts, many=True).data
+        fast = fastpath.contact_values(Contact.objects.filter(id__in=[c.id for c in contacts]).order_by('id'))
+        self.assertEqual(fast, expected)
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+        self.assertEqual(fastpath.contact_data(contacts), fast)
+
+    def test_rows_equal_contact_serializer_output(self):
+        contacts = make_contacts(self.user, 2)
+        ownerless = Contact.objects.create(name='Nobody', phone='+15550000009', email='n@example.com')
+        # a whole second has no microseconds, which isoformat() leaves out
+        Contact.objects.filter(id=ownerless.id).update(created_at=timezone.now().replace(microsecond=0))
+        contacts = list(Contact.objects.order_by('id'))
+        self.assertMatchesSerializer(contacts)
+        with timezone.override('Asia/Kolkata'):
+            self.assertMatchesSerializer(contacts)
+
+    def test_batches(self):
+        make_contacts(self.user, 5)
+        batches = list(fastpath.iter_contact_values(Contact.objects.order_by('id'), 2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual([row for batch in batches for row in batch], fastpath.contact_values(Contact.objects.order_by('id')))
+
+
+class ValidatorTests(SimpleTestCase):
+    def test_cleaners(self):
+        self.assertEqual(validators.clean_name('  Ada  '), 'Ada')
+        self.assertEqual(validators.clean_phone('+1 (555) 010-0000'), '+15550100000')
+        self.assertEqual(validators.clean_phone(5550100000), '5550100000')
+        self.assertEqual(validators.clean_email(' Ada@Example.COM '), 'ada@example.com')
+        self.assertEqual(validators.clean_additional('  '), '')
+
+    def test_invalid_values(self):
+        for clean, value, message in (
+            (validators.clean_name, None, validators.NULL),
+            (validators.clean_name, '   ', validators.BLANK),
+            (validators.clean_name, True, validators.NOT_A_STRING),
+            (validators.clean_name, ['Ada'], validators.NOT_A_STRING),
+            (validators.clean_name, 'x' * (validators.NAME_MAX_LENGTH + 1),
+             validators.TOO_LONG.format(max_length=validators.NAME_MAX_LENGTH)),
+            (validators.clean_phone, '12', validators.INVALID_PHONE),
+            (validators.clean_phone, '+1 555 CALL NOW', validators.INVALID_PHONE),
+            (validators.clean_email, 'not-an-email', validators.INVALID_EMAIL),
+            (validators.clean_additional, {'a': 1}, validators.NOT_A_STRING),
+        ):
+            with self.assertRaises(ValidationError) as raised:
+                clean(value)
+            self.assertEqual(raised.exception.messages, [message], (clean.__name__, value))
+
+    def test_rows_match_single_validation(self):
+        rows = [
+            {'name': 'Ada', 'phone': '+15550000001', 'email': 'ada@example.com', 'id': 7},
+            {'name': '', 'phone': 'x'},
+            'not a row',
+            {'additional': None},
+        ]
+        cleaned, errors = validators.validate_rows(rows)
+        for row, row_cleaned, row_errors in zip(rows, cleaned, errors):
+            if isinstance(row, dict):
+                self.assertEqual((row_cleaned, row_errors), validators.validate_contact(row))
+        self.assertEqual(cleaned[0], {'name': 'Ada', 'phone': '+15550000001', 'email': 'ada@example.com'})
+        self.assertEqual(errors[1], {'name': [validators.BLANK], 'phone': [validators.INVALID_PHONE],
+                                     'email': [validators.REQUIRED]})
+        self.assertIn('non_field_errors', errors[2])
+        self.assertEqual(validators.validate_rows([{'name': 'Ada'}], partial=True), ([{'name': 'Ada'}], [{}]))
+
+    def test_serializer_reports_the_same_errors(self):
+        serializer = ContactSerializer(data={'name': ' ', 'phone': '12', 'email': 'nope'})
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors, validators.validate_contact({'name': ' ', 'phone': '12', 'email': 'nope'})[1])
+
+
+class FragmentTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        UserProfile.objects.filter(user=self.user).update(user_type='admin')
+
+    def test_contact_table_follows_writes(self):
+        make_contacts(self.user, 2, prefix='first')
+        key = fragments.contact_table_key(None, 1)
+        self.assertContains(self.client.get('/contacts/'), 'firstowner 0')
+        self.assertIsNotNone(cache.get(fragments.fragment_key('contact_table', key)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_contacts(self.user, 1, prefix='second')
+        self.assertNotEqual(fragments.contact_table_key(None, 1), key)
+        self.assertContains(self.client.get('/contacts/'), 'secondowner 0')
+
+    def test_user_table_follows_role_changes_but_not_logins(self):
+        other = make_user('member')
+        version = fragments.users_version()
+        self.assertContains(self.client.get('/admin/users/'), 'member')
+        with self.captureOnCommitCallbacks(execute=True):
+            Client().force_login(other)
+        self.assertEqual(fragments.users_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/admin/users/{other.pk}/promote/')
+        self.assertGreater(fragments.users_version(), version)
+
+    def test_user_table_waits_for_the_commit(self):
+        version = fragments.users_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_user('pending')
+        self.assertEqual(fragments.users_version(), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(fragments.users_version(), version)
+
+    def test_menu_varies_by_role(self):
+        self.assertContains(self.client.get('/contacts/'), '/admin/users/')
+        other = make_user('plain')
+        self.client.force_login(other)
+        self.assertNotContains(self.client.get('/contacts/'), '/admin/users/')
+
+
+class ContactEventTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        events.rings.clear()
+
+    def feed(self):
+        return [(event['type'], event['contactId']) for event in self.client.get('/api/im/contact-events/').json()['events']]
+
+    def test_committed_writes_show_up_newest_first(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            contact = make_contacts(self.user, 1)[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.name = 'renamed'
+            contact.save()
+        contact_id = contact.id
+        with self.captureOnCommitCallbacks(execute=True):
+            contact.delete()
+        self.assertEqual(self.feed(), [('contact_removed', contact_id), ('contact_updated', contact_id),
+                                       ('contact_added', contact_id)])
+
+    def test_rolled_back_writes_leave_no_event(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            make_contacts(self.user, 1)
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(ContactEvent.objects.exists())
+
+    def test_ring_is_served_from_memory_and_kept_warm(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            events.record(self.user.pk, 'promoted')
+        events.latest(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(events.latest(self.user.pk)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            events.record(self.user.pk, 'demoted')
+        with self.assertNumQueries(0):
+            self.assertEqual([event.type for event in events.latest(self.user.pk)], ['demoted', 'promoted'])
+        # a write by another worker moves the version, the ring is rebuilt
+        events.bump_version(self.user.pk)
+        with self.assertNumQueries(1):
+            events.latest(self.user.pk)
+
+    def test_rings_are_capped(self):
+        with mock.patch.object(events, 'EVENT_RING_SIZE', 3):
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(5):
+                    events.record(self.user.pk, 'contact_added', contact_id=i)
+            self.assertEqual([event.contact_id for event in events.latest(self.user.pk)], [4, 3, 2])
+            with self.captureOnCommitCallbacks(execute=True):
+                events.record(self.user.pk, 'contact_added', contact_id=5)
+            self.assertEqual([event.contact_id for event in events.latest(self.user.pk)], [5, 4, 3])
+
+        ring_cache = events.RingCache(maxusers=1)
+        other = make_user('other')
+        ring_cache.latest(self.user.pk)
+        ring_cache.latest(other.pk)
+        self.assertEqual(list(ring_cache.rings), [other.pk])
+
+    def test_anonymous_is_refused(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/api/im/contact-events/').status_code, 401)
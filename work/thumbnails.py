@@ -0,0 +1,191 @@
+"""
+Thumbnails for image messages, rendered once in a process pool and kept in
+a content-addressed disk cache (THUMBNAIL_DIR/<key[:2]>/<key>.jpg, the key
+being the source sha256 plus the render settings). Hits refresh the file's
+mtime, and the oldest files are evicted once the cache grows past
+THUMBNAIL_CACHE_BYTES.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+from . import files
+from .imaging import NotAnImage, pillow_available, render_thumbnail
+
+THUMBNAIL_DIR = getattr(settings, 'THUMBNAIL_DIR', settings.BASE_DIR / 'media' / 'thumbnails')
+THUMBNAIL_SIZE = getattr(settings, 'THUMBNAIL_SIZE', 320)
+THUMBNAIL_QUALITY = getattr(settings, 'THUMBNAIL_QUALITY', 70)
+THUMBNAIL_CACHE_BYTES = getattr(settings, 'THUMBNAIL_CACHE_BYTES', 256 * 1024 * 1024)
+THUMBNAIL_WORKERS = getattr(settings, 'THUMBNAIL_WORKERS', 2)
+THUMBNAIL_TIMEOUT = getattr(settings, 'THUMBNAIL_TIMEOUT', 30)
+
+# eviction trims to this share of the limit so it doesn't run on every render
+EVICT_TO = 0.9
+
+
+class ThumbnailsUnavailable(Exception):
+    """Pillow is not installed"""
+
+
+class InvalidImage(Exception):
+    pass
+
+
+class ThumbnailTimeout(Exception):
+    """The render didn't finish within THUMBNAIL_TIMEOUT; the pool is busy"""
+
+
+# _lock guards _pending, _stats and _usage; _evict_lock lets one thread at a time evict
+_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_pool = None
+_pending = {}
+_usage = None
+_stats = {'hits': 0, 'rendered': 0, 'evicted': 0}
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn: forking a threaded server process is not safe
+        _pool = ProcessPoolExecutor(THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def cache_key(stored, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    return f'{stored.sha256}-{size}-q{quality}'
+
+
+def cache_path(key):
+    return os.path.join(THUMBNAIL_DIR, key[:2], f'{key}.jpg')
+
+
+def _read(path):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        # evicted by another process between the read and the touch
+        pass
+    return data
+
+
+def _scan():
+    entries = []
+    for root, _dirs, names in os.walk(THUMBNAIL_DIR):
+        for name in names:
+            if not name.endswith('.jpg'):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def _count(name, n=1):
+    with _lock:
+        _stats[name] += n
+
+
+def evict(limit=THUMBNAIL_CACHE_BYTES):
+    """Deletes least recently used thumbnails until the cache fits; returns the bytes in use"""
+    global _usage
+    with _evict_lock:
+        entries = sorted(_scan())
+        usage = sum(size for _mtime, size, _path in entries)
+        evicted = 0
+        if usage > limit:
+            target = limit * EVICT_TO
+            for _mtime, size, path in entries:
+                if usage <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                usage -= size
+                evicted += 1
+        with _lock:
+            _stats['evicted'] += evicted
+            _usage = usage
+    return usage
+
+
+def _account(size):
+    global _usage
+    with _lock:
+        if _usage is None:
+            _usage = sum(size for _mtime, size, _path in _scan())
+        else:
+            _usage += size
+        over = _usage > THUMBNAIL_CACHE_BYTES
+    if over:
+        evict()
+
+
+def get_thumbnail(stored, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """
+    JPEG bytes of the thumbnail for a StoredFile. Concurrent requests for
+    the same image share one render. Raises InvalidImage when the file
+    isn't a readable image and ThumbnailTimeout when the render is too
+    slow; pool and disk errors propagate.
+    """
+    key = cache_key(stored, size, quality)
+    path = cache_path(key)
+    data = _read(path)
+    if data is not None:
+        _count('hits')
+        return data
+    if not pillow_available():
+        raise ThumbnailsUnavailable()
+
+    with _lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _get_pool().submit(render_thumbnail, files.path_for(stored), path, size, quality)
+            _pending[key] = future
+            future.add_done_callback(lambda _f: _pending.pop(key, None))
+            owner = True
+        else:
+            owner = False
+    try:
+        written = future.result(timeout=THUMBNAIL_TIMEOUT)
+    except NotAnImage as e:
+        raise InvalidImage(str(e))
+    except TimeoutError:
+        raise ThumbnailTimeout(key)
+    except BrokenProcessPool:
+        _reset_pool()
+        raise
+    if owner:
+        _count('rendered')
+        _account(written)
+    data = _read(path)
+    if data is None:
+        raise InvalidImage(key)
+    return data
+
+
+def _reset_pool():
+    # a worker died; the next render starts a fresh pool instead of failing forever
+    global _pool
+    with _lock:
+        broken, _pool = _pool, None
+    if broken is not None:
+        broken.shutdown(wait=False)
+
+
+def stats():
+    with _lock:
+        return {**_stats, 'bytes': _usage}
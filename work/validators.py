@@ -0,0 +1,127 @@
+"""
+Contact field validation shared by the HTML forms, ContactSerializer and
+the bulk endpoints. Patterns are compiled once at import; emails go
+through Django's validate_email, as in the serializer's EmailField.
+Errors use DRF's wording so every write path reports the same thing.
+
+    cleaned, errors = validate_contact(request.POST)
+    cleaned_rows, row_errors = validate_rows(rows, partial=True)
+"""
+import re
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+
+from .models import Contact
+
+# separators people type inside numbers: spaces, dots, dashes, brackets
+PHONE_SEPARATORS_RE = re.compile(r'[\s.()\-]')
+PHONE_RE = re.compile(r'^\+?\d{3,15}$')
+
+NAME_MAX_LENGTH = Contact._meta.get_field('name').max_length
+EMAIL_MAX_LENGTH = Contact._meta.get_field('email').max_length
+
+REQUIRED = 'This field is required.'
+NULL = 'This field may not be null.'
+BLANK = 'This field may not be blank.'
+NOT_A_STRING = 'Not a valid string.'
+TOO_LONG = 'Ensure this field has no more than {max_length} characters.'
+INVALID_EMAIL = 'Enter a valid email address.'
+INVALID_PHONE = 'Enter a valid phone number.'
+
+
+def _text(value, max_length=None, allow_blank=False):
+    """DRF CharField semantics: numbers become strings, whitespace is trimmed"""
+    if value is None:
+        raise ValidationError(NULL)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValidationError(NOT_A_STRING)
+    value = str(value).strip()
+    if not value and not allow_blank:
+        raise ValidationError(BLANK)
+    if max_length is not None and len(value) > max_length:
+        raise ValidationError(TOO_LONG.format(max_length=max_length))
+    return value
+
+
+def clean_name(value):
+    return _text(value, NAME_MAX_LENGTH)
+
+
+def clean_phone(value):
+    """'+1 (555) 010-0000' -> '+15550100000'"""
+    value = PHONE_SEPARATORS_RE.sub('', _text(value))
+    if not PHONE_RE.match(value):
+        raise ValidationError(INVALID_PHONE)
+    return value
+
+
+def clean_email(value):
+    """Django's EmailValidator, the one the serializer's EmailField runs"""
+    value = _text(value, EMAIL_MAX_LENGTH)
+    try:
+        validate_email(value)
+    except ValidationError:
+        raise ValidationError(INVALID_EMAIL)
+    return value.lower()
+
+
+def clean_additional(value):
+    return _text(value, allow_blank=True)
+
+
+CLEANERS = {
+    'name': clean_name,
+    'phone': clean_phone,
+    'email': clean_email,
+    'additional': clean_additional,
+}
+REQUIRED_FIELDS = ('name', 'phone', 'email')
+
+
+def validate_contact(data, partial=False):
+    """
+    (cleaned, errors) for one contact. Only writable fields are kept; with
+    partial=True missing fields are not required. errors maps a field to
+    its messages and is empty when the row is valid.
+    """
+    cleaned, errors = {}, {}
+    for field, clean in CLEANERS.items():
+        if field not in data:
+            if not partial and field in REQUIRED_FIELDS:
+                errors[field] = [REQUIRED]
+            continue
+        try:
+            cleaned[field] = clean(data[field])
+        except ValidationError as e:
+            errors[field] = e.messages
+    return cleaned, errors
+
+
+def validate_rows(rows, partial=False):
+    """
+    Validates a batch column by column, so each cleaner runs in one tight
+    loop. Returns (cleaned rows, per-row errors), both aligned with rows;
+    non-dict rows get a non_field_errors entry.
+    """
+    cleaned = [{} for _ in rows]
+    errors = [{} for _ in rows]
+    valid_rows = []
+    for i, row in enumerate(rows):
+        if isinstance(row, dict):
+            valid_rows.append(i)
+        else:
+            errors[i] = {'non_field_errors': [f'Invalid data. Expected a dictionary, but got {type(row).__name__}.']}
+    for field, clean in CLEANERS.items():
+        required = not partial and field in REQUIRED_FIELDS
+        for i in valid_rows:
+            row = rows[i]
+            if field not in row:
+                if required:
+                    errors[i][field] = [REQUIRED]
+                continue
+            try:
+                cleaned[i][field] = clean(row[field])
+            except ValidationError as e:
+                errors[i][field] = e.messages
+    return cleaned, errors
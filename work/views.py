@@ -4,16 +4,55 @@ from rest_framework.renderers import TemplateHTMLRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.http import Http404, JsonResponse
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
-from django.db.models import Q
+from django.conf import settings
+import base64
 import json
+import re
+import uuid
 
-from .models import Contact, UserProfile
-from .serializers import ContactSerializer, UserProfileSerializer
+from . import cache as contact_cache
+from .bulk import BulkError, bulk_create_contacts, bulk_update_contacts, bulk_delete_contacts
+from .conditional import list_etag, list_last_modified, contact_etag, contact_last_modified
+from . import admission, events, files, history, profiling, thumbnails
+from .fragments import contact_table_key, user_table_key
+from .export import STREAM_FORMATS, EXPORT_CHUNK_SIZE, EXPORT_MAX_CHUNK_SIZE, stream_contacts
+from .fastpath import contact_data, contact_values
+from .importer import (
+    FORMATS as IMPORT_FORMATS, IMPORT_MAX_BYTES, IMPORT_MAX_ROWS, ImportFormatError, count_rows, detect_format,
+    import_contacts, text_stream,
+)
+from .models import Contact, Message, StoredFile, UserProfile
+from .pagination import CursorPaginator, InvalidCursor, approximate_count, page_size_from
+from .roles import get_role
+from .realtime import can_join
+from .search import SEARCH_RESULT_LIMIT, search_capped
+from .serializers import ContactSerializer, MessageSerializer, UserProfileSerializer
+from .sync import InvalidWatermark, changes_since, parse_watermark
+from .validators import validate_contact
+
+DETAIL_MAX_IDS = getattr(settings, 'CONTACT_DETAIL_MAX_IDS', 100)
+
+SEARCH_FIELDS = {
+    'name': ('name',),
+    'email': ('email',),
+    'both': ('name', 'email'),
+}
+
+CURSOR_ORDERINGS = {
+    'created': ('created_at', 'id'),
+    'id': ('id',),
+}
+
+# chatId+msgUuid@senderId, the sender part is optional
+MESSAGE_SELECTOR_RE = re.compile(r'^(?P<chat_id>[\w-]{1,64})\+(?P<uuid>[0-9a-fA-F-]{32,36})(?:@(?P<sender>\d+))?$')
 
 def register(request):
     if request.method == 'POST':
@@ -66,7 +105,7 @@ def user_logout(request):
     return redirect('home')
 
 def is_admin(user):
-    return user.is_authenticated and hasattr(user, 'userprofile') and user.userprofile.is_admin()
+    return get_role(user) == 'admin'
 
 admin_required = user_passes_test(is_admin)
 
@@ -78,54 +117,52 @@ def contact_list(request):
     if is_admin(request.user):
         contacts = Contact.objects.all()
     else:
-        contacts = Contact.objects.filter(user=request.user)
+        contacts = Contact.objects.for_owner(request.user)
+    owner_id = None if is_admin(request.user) else request.user.id
     
-    paginator = Paginator(contacts, 10)
-    page_number = request.GET.get('page')
+    if 'cursor' in request.GET:
+        paginator = CursorPaginator(contacts, page_size=10)
+        cursor = request.GET.get('cursor')
+        try:
+            contacts_page = paginator.page(cursor)
+        except InvalidCursor:
+            cursor = ''
+            contacts_page = paginator.page()
+        return render(request, 'contact_list.html', {
+            'contacts': contacts_page,
+            'cursor_mode': True,
+            'page_obj': contacts_page,
+            'approx_count': approximate_count(contacts),
+            'is_admin': is_admin(request.user),
+            'table_key': contact_table_key(owner_id, f'cursor:{cursor}'),
+        })
     
-    try:
-        contacts_page = paginator.page(page_number)
-    except PageNotAnInteger:
-        contacts_page = paginator.page(1)
-
-    except EmptyPage:
-        contacts_page = paginator.page(paginator.num_pages)
+    paginator, contacts_page = contact_cache.list_page(contacts, owner_id, request.GET.get('page'), 10)
     
     return render(request, 'contact_list.html', {
         'contacts': contacts_page,
         'paginator': paginator,
         'page_obj': contacts_page,
-        'is_admin': is_admin(request.user)
+        'is_admin': is_admin(request.user),
+        'table_key': contact_table_key(owner_id, contacts_page.number),
     })
 
 @login_required
 def contact_detail(request, contact_id):
-    if is_admin(request.user):
-        contact = get_object_or_404(Contact, id=contact_id)
-    else:
-        contact = get_object_or_404(Contact, id=contact_id, user=request.user)
+    contact = contact_cache.get_contact_data(contact_id)
+    if contact is None or not (is_admin(request.user) or contact['user'] == request.user.id):
+        raise Http404('No Contact matches the given query.')
     return render(request, 'contact_detail.html', {'contact': contact})
 
 @login_required
 def contact_create(request):
     if request.method == 'POST':
-        name = request.POST.get('name')
-        phone = request.POST.get('phone')
-        email = request.POST.get('email')
-        additional = request.POST.get('additional', '-')
-        
-        if name and phone and email:
-            contact = Contact.objects.create(
-                user=request.user,
-                name=name,
-                phone=phone,
-                email=email,
-                additional=additional
-            )
-            messages.success(request, f'Contact created successfully: {name}')
+        cleaned, errors = validate_contact(request.POST)
+        if not errors:
+            contact = Contact.objects.create(user=request.user, **cleaned)
+            messages.success(request, f'Contact created successfully: {contact.name}')
             return redirect('contact_detail', contact_id=contact.id)
-        else:
-            messages.error(request, 'Please fill in all required fields')
+        _form_errors(request, errors)
     
     return render(request, 'contact_create.html')
 
@@ -134,29 +171,31 @@ def contact_edit(request, contact_id):
     if is_admin(request.user):
         contact = get_object_or_404(Contact, id=contact_id)
     else:
-        contact = get_object_or_404(Contact, id=contact_id, user=request.user)
+        contact = get_object_or_404(Contact.objects.for_owner(request.user), id=contact_id)
     
     if request.method == 'POST':
-        contact.name = request.POST.get('name', contact.name)
-        contact.phone = request.POST.get('phone', contact.phone)
-        contact.email = request.POST.get('email', contact.email)
-        contact.additional = request.POST.get('additional', contact.additional)
-        
-        if contact.name and contact.phone and contact.email:
+        cleaned, errors = validate_contact(request.POST, partial=True)
+        if not errors:
+            for field, value in cleaned.items():
+                setattr(contact, field, value)
             contact.save()
             messages.success(request, f'Contact updated successfully: {contact.name}')
             return redirect('contact_detail', contact_id=contact.id)
-        else:
-            messages.error(request, 'Please fill in all required fields')
+        _form_errors(request, errors)
     
     return render(request, 'contact_edit.html', {'contact': contact})
 
+def _form_errors(request, errors):
+    for field, field_errors in errors.items():
+        for error in field_errors:
+            messages.error(request, f'{field.capitalize()}: {error}')
+
 @login_required
 def contact_delete(request, contact_id):
     if is_admin(request.user):
         contact = get_object_or_404(Contact, id=contact_id)
     else:
-        contact = get_object_or_404(Contact, id=contact_id, user=request.user)
+        contact = get_object_or_404(Contact.objects.for_owner(request.user), id=contact_id)
     
     if request.method == 'POST':
         contact_name = contact.name
@@ -181,22 +220,17 @@ def search_results(request):
     
     if is_admin(request.user):
         base_queryset = Contact.objects.all()
+        owner = None
     else:
-        base_queryset = Contact.objects.filter(user=request.user)
+        base_queryset = Contact.objects.for_owner(request.user)
+        owner = request.user
     
-    if search_type == 'name':
-        contacts = base_queryset.filter(name__icontains=keyword)
-    elif search_type == 'email':
-        contacts = base_queryset.filter(email__icontains=keyword)
-    elif search_type == 'both':
-        contacts = base_queryset.filter(
-            Q(name__icontains=keyword) | Q(email__icontains=keyword)
-        )
-    else:
-        contacts = base_queryset.filter(name__icontains=keyword)
+    fields = SEARCH_FIELDS.get(search_type, ('name',))
+    contacts, truncated = search_capped(base_queryset, keyword, fields, user=owner)
     
     return render(request, 'search_results.html', {
         'contacts': contacts,
+        'truncated': truncated,
         'search_type': search_type,
         'keyword': keyword
     })
@@ -211,31 +245,31 @@ def index(request):
 # @renderer_classes([JSONRenderer])
 
 # @app.get("/list")
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
 def listAll(request):
     contacts = Contact.objects.all()
     if not contacts.exists():
         return Response({"message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
-    serializer = ContactSerializer(contacts, many=True)
-    return Response({"result": serializer.data})
+    # ?stream=json|ndjson walks the table in chunks instead of building one big list
+    stream = request.GET.get('stream')
+    if stream:
+        if stream not in STREAM_FORMATS:
+            return Response({"message": "Invalid stream format"}, status=status.HTTP_400_BAD_REQUEST)
+        return stream_contacts(contacts, stream, page_size_from(
+            request.GET.get('chunk_size'), EXPORT_CHUNK_SIZE, EXPORT_MAX_CHUNK_SIZE))
+    return Response({"result": contact_values(contacts)})
 
 # @app.get("/list-page/{page}")
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
 def listPaged(request, page: int):
     contacts = Contact.objects.all()
     page_size = 10  
-    paginator = Paginator(contacts, page_size)
+    paginator, contacts_page = contact_cache.list_page(contacts, None, page, page_size)
 
-    try:
-        contacts_page = paginator.page(page)
-    except PageNotAnInteger:
-        contacts_page = paginator.page(1)
-    except EmptyPage:
-        contacts_page = paginator.page(paginator.num_pages)
-
-    serializer = ContactSerializer(contacts_page, many=True)
     return Response({
         'count': paginator.count,
         'page_size': page_size,
@@ -243,19 +277,78 @@ def listPaged(request, page: int):
         'total_pages': paginator.num_pages,
         'next_page': contacts_page.next_page_number() if contacts_page.has_next() else None,
         'previous_page': contacts_page.previous_page_number() if contacts_page.has_previous() else None,
-        'results': serializer.data
+        'results': contacts_page.object_list
+    })
+
+# @app.get("/list-cursor?cursor=&page_size=&ordering=&count=")
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def listCursor(request):
+    ordering = CURSOR_ORDERINGS.get(request.GET.get('ordering', 'created'))
+    if ordering is None:
+        return Response({"message": "Invalid ordering"}, status=status.HTTP_400_BAD_REQUEST)
+    contacts = Contact.objects.all()
+    page_size = page_size_from(request.GET.get('page_size'))
+    paginator = CursorPaginator(contacts, ordering=ordering, page_size=page_size)
+
+    try:
+        contacts_page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        return Response({"message": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # the exact total is opt-in, it costs a full COUNT(*) per request
+    count_mode = request.GET.get('count')
+    if count_mode == 'exact':
+        count = contacts.count()
+    elif count_mode == 'approx':
+        count = approximate_count(contacts)
+    else:
+        count = None
+
+    return Response({
+        'count': count,
+        'page_size': page_size,
+        'next_cursor': contacts_page.next_cursor,
+        'previous_cursor': contacts_page.previous_cursor,
+        'results': contact_data(contacts_page.object_list)
     })
 
 # @app.get("/get/{byId}")
+@condition(etag_func=contact_etag, last_modified_func=contact_last_modified)
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
 def get(request, byId: int):
-    try:
-        contact = Contact.objects.get(id=byId)
-    except Contact.DoesNotExist:
+    data = contact_cache.get_contact_data(byId)
+    if data is None:
         return Response({"message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
-    serializer = ContactSerializer(contact)
-    return Response(serializer.data)
+    return Response(data)
+
+def clean_detail_ids(ids):
+    """Validate the {"ids": [...]} form of get-detail; shared with the async view so both reject the same input.
+
+    Raises ValueError with a client-facing message.
+    """
+    if not isinstance(ids, list) or not all(type(i) is int for i in ids):
+        raise ValueError("Invalid input")
+    if len(ids) > DETAIL_MAX_IDS:
+        raise ValueError(f"Too many ids, max {DETAIL_MAX_IDS}")
+    return ids
+
+def _get_details(ids):
+    """{"ids": [...]} form of get-detail: cache hits plus one in_bulk() for the rest, in request order"""
+    try:
+        ids = clean_detail_ids(ids)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    found = contact_cache.get_many_contact_data(ids)
+    results = []
+    for contact_id in ids:
+        data = found.get(contact_id)
+        if data is None:
+            results.append({"id": contact_id, "message": "Not Found"})
+        else:
+            results.append(data)
+    return Response({"results": results})
 
 # @app.post("/get-detail")
 @api_view(['POST'])
@@ -263,15 +356,15 @@ def get(request, byId: int):
 def getDetail(request: WSGIRequest):
     try:
         jsoned = json.loads(request.body.decode('utf-8'))
+        if isinstance(jsoned, dict) and "ids" in jsoned:
+            return _get_details(jsoned["ids"])
         required = int(jsoned["id"])
-    except (json.JSONDecodeError, KeyError, ValueError):
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError):
         return Response({"message": "Invalid input"}, status=status.HTTP_400_BAD_REQUEST)
-    try:
-        contact = Contact.objects.get(id=required)
-    except Contact.DoesNotExist:
+    data = contact_cache.get_contact_data(required)
+    if data is None:
         return Response({"id": required, "message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
-    serializer = ContactSerializer(contact)
-    return Response(serializer.data)
+    return Response(data)
 
 # @app.put("/new")
 @api_view(['PUT'])
@@ -281,7 +374,7 @@ def create(request):
         data = json.loads(request.body.decode('utf-8'))
     except json.JSONDecodeError:
         return Response({"message": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
-    serializer = ContactSerializer(data=data)
+    serializer = ContactSerializer(data=data, context={'request': request})
     if serializer.is_valid():
         serializer.save()
         return Response({"message": "done"}, status=status.HTTP_201_CREATED)
@@ -318,15 +411,232 @@ def delete(request, byId: int):
     except Contact.DoesNotExist:
         return Response({"message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
 
+def _bulk_error(e: BulkError):
+    body = {"message": e.message}
+    if e.errors is not None:
+        body["errors"] = e.errors
+    return Response(body, status=status.HTTP_400_BAD_REQUEST)
+
+# @app.put("/bulk/new")
+@api_view(['PUT'])
+@renderer_classes([JSONRenderer])
+def bulkCreate(request: WSGIRequest):
+    try:
+        rows = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return Response({"message": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    owner = request.user if request.user.is_authenticated else None
+    try:
+        contacts = bulk_create_contacts(rows, owner)
+    except BulkError as e:
+        return _bulk_error(e)
+    return Response({"message": "done", "ids": [c.id for c in contacts]}, status=status.HTTP_201_CREATED)
+
+# @app.patch("/bulk/update")
+@api_view(['PATCH'])
+@renderer_classes([JSONRenderer])
+def bulkUpdate(request: WSGIRequest):
+    try:
+        rows = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return Response({"message": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        contacts = bulk_update_contacts(rows)
+    except BulkError as e:
+        return _bulk_error(e)
+    return Response({"message": "Updated", "ids": [c.id for c in contacts]})
+
+# @app.delete("/bulk/delete")
+@api_view(['DELETE'])
+@renderer_classes([JSONRenderer])
+def bulkDelete(request: WSGIRequest):
+    try:
+        ids = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return Response({"message": "Invalid JSON"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        deleted, missing = bulk_delete_contacts(ids)
+    except BulkError as e:
+        return _bulk_error(e)
+    return Response({"message": "done", "deleted": deleted, "not_found": missing})
+
+# @app.post("/import?type=csv|vcard")
+# not ?format=, DRF reads that one to pick a renderer
+@api_view(['POST'])
+@renderer_classes([JSONRenderer])
+def importContacts(request):
+    if not request.user.is_authenticated:
+        return Response({"message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"message": "Invalid input"}, status=status.HTTP_400_BAD_REQUEST)
+    if upload.size > IMPORT_MAX_BYTES:
+        return Response({"message": f"File too large, max {IMPORT_MAX_BYTES} bytes"},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    fmt = request.GET.get('type') or detect_format(upload.name)
+    if fmt not in IMPORT_FORMATS:
+        return Response({"message": "Invalid format"}, status=status.HTTP_400_BAD_REQUEST)
+    stream = text_stream(upload.file)
+    try:
+        # a parse-only pass first, so an oversized file inserts nothing
+        if count_rows(stream, fmt) > IMPORT_MAX_ROWS:
+            return Response({"message": f"Too many rows, max {IMPORT_MAX_ROWS}"},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        stream.seek(0)
+        result = import_contacts(stream, fmt, request.user)
+    except ImportFormatError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"message": "done", **result.as_dict()})
+
+# @app.get("/sync?since=")
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def sync(request):
+    try:
+        since = parse_watermark(request.GET.get('since'))
+    except InvalidWatermark:
+        return Response({"message": "Invalid watermark"}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(changes_since(since))
+
 # @app.get("/search/{segment}")
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
 def search(request, segment: str):
-    contacts = Contact.objects.filter(name__icontains=segment)
-    if not contacts.exists():
+    contacts, truncated = search_capped(Contact.objects.all(), segment)
+    if not contacts:
         return Response({"message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
-    serializer = ContactSerializer(contacts, many=True)
-    return Response({"results": serializer.data})
+    # at most SEARCH_RESULT_LIMIT best matches; truncated says more matched
+    return Response({"results": contact_data(contacts), "limit": SEARCH_RESULT_LIMIT, "truncated": truncated})
+
+# @app.get("/stats")
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def stats(request):
+    if not is_admin(request.user):
+        return Response({"message": "Forbidden"}, status=status.HTTP_403_FORBIDDEN)
+    return Response({
+        'requests': profiling.snapshot(),
+        'contact_cache': contact_cache.stats(),
+        'history_pages': history.pages.stats(),
+        'thumbnails': thumbnails.stats(),
+        'admission': admission.stats.snapshot(),
+        'contact_events': events.rings.stats(),
+    })
+
+# @app.post("/im/history")
+# compressed when the client sends Accept-Encoding: gzip
+@gzip_page
+@api_view(['POST'])
+@renderer_classes([JSONRenderer])
+def imHistory(request):
+    if not request.user.is_authenticated:
+        return Response({"message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        jsoned = json.loads(request.body.decode('utf-8'))
+        chat_type, chat_id = jsoned["chatType"], str(jsoned["chatId"])
+        if chat_type not in ('private', 'group'):
+            raise ValueError(chat_type)
+        # these end up in the page cache key, so nothing unhashable gets through
+        if not isinstance(jsoned.get("before"), (str, type(None))):
+            raise TypeError("before")
+        for field in ("since", "until"):
+            if isinstance(jsoned.get(field), bool) or not isinstance(jsoned.get(field), (int, str, type(None))):
+                raise TypeError(field)
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError):
+        return Response({"message": "Invalid input"}, status=status.HTTP_400_BAD_REQUEST)
+    if not can_join(request.user.id, chat_type, chat_id):
+        return Response({"message": "Forbidden"}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        payload = history.history_page(
+            chat_type, chat_id,
+            cursor=jsoned.get("before"),
+            since=jsoned.get("since"),
+            until=jsoned.get("until"),
+            page_size=jsoned.get("pageSize"),
+            compact=jsoned.get("compact", True),
+        )
+    except InvalidCursor:
+        return Response({"message": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+    except history.InvalidHistoryRequest as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(payload)
+
+# @app.get("/im/contact-events")
+# only the latest CONTACT_EVENT_RING_SIZE (50) events, newest first
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def imContactEvents(request):
+    if not request.user.is_authenticated:
+        return Response({"message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    return Response({"events": [event.as_dict() for event in events.latest(request.user.id)]})
+
+# @app.post("/im/upload")
+@api_view(['POST'])
+@renderer_classes([JSONRenderer])
+def imUpload(request):
+    if not request.user.is_authenticated:
+        return Response({"message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({"message": "Invalid input"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        stored = files.save_upload(upload, owner=request.user)
+    except files.FileTooLarge:
+        return Response({"message": f"File too large, max {files.FILE_UPLOAD_MAX_BYTES} bytes"},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    return Response({"reference": str(stored.reference), "size": stored.size}, status=status.HTTP_201_CREATED)
+
+# @app.get("/im/file/{fileReference}")
+# a plain view: DRF's content negotiation would turn Accept: image/* into a 406
+@require_GET
+def imFile(request, fileReference):
+    if not request.user.is_authenticated:
+        return JsonResponse({"message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    stored = StoredFile.objects.filter(reference=fileReference).first()
+    if stored is None:
+        return JsonResponse({"message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
+    return files.file_response(request, stored, as_attachment='download' in request.GET)
+
+# @app.post("/im/detail/{msgSelector}?thumbnail")
+@api_view(['POST'])
+@renderer_classes([JSONRenderer])
+def imDetail(request, msgSelector: str):
+    if not request.user.is_authenticated:
+        return Response({"message": "Unauthorized"}, status=status.HTTP_401_UNAUTHORIZED)
+    match = MESSAGE_SELECTOR_RE.match(msgSelector)
+    if match is None:
+        return Response({"message": "Invalid selector"}, status=status.HTTP_400_BAD_REQUEST)
+    message = Message.objects.filter(uuid=match.group('uuid'), chat_id=match.group('chat_id')).first()
+    if message is None or (match.group('sender') and str(message.sender_id) != match.group('sender')):
+        return Response({"message": "Not Found"}, status=status.HTTP_404_NOT_FOUND)
+    if not can_join(request.user.id, message.chat_type, message.chat_id):
+        return Response({"message": "Forbidden"}, status=status.HTTP_403_FORBIDDEN)
+
+    data = dict(MessageSerializer(message).data)
+    wants_thumbnail = 'thumbnail' in request.GET or (isinstance(request.data, dict) and request.data.get('thumbnail'))
+    if wants_thumbnail and message.type == 'IMG':
+        stored = StoredFile.objects.filter(reference=message.content).first() if _is_uuid(message.content) else None
+        if stored is None:
+            return Response({"message": "File Not Found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            thumbnail = thumbnails.get_thumbnail(stored)
+        except thumbnails.ThumbnailsUnavailable:
+            return Response({"message": "Thumbnails are not available on this server"},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        except thumbnails.InvalidImage:
+            return Response({"message": "Not an image"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        except thumbnails.ThumbnailTimeout:
+            return Response({"message": "Thumbnail not ready, try again"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        data['content'] = base64.b64encode(thumbnail).decode('ascii')
+    return Response(data)
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+    except ValueError:
+        return False
+    return True
 
 @login_required
 @admin_required
@@ -346,7 +656,8 @@ def user_list(request):
     return render(request, 'user_list.html', {
         'users': users_page,
         'paginator': paginator,
-        'page_obj': users_page
+        'page_obj': users_page,
+        'table_key': user_table_key(request.user.pk, users_page.number),
     })
 
 @login_required
@@ -356,8 +667,11 @@ def user_promote(request, user_id):
     
     if request.method == 'POST':
         user_profile = user.userprofile
-        user_profile.user_type = 'admin'
-        user_profile.save()
+        if user_profile.user_type != 'admin':
+            user_profile.user_type = 'admin'
+            user_profile.save()
+            events.record(user.id, 'promoted', actor_id=request.user.id,
+                          summary=f'Promoted to administrator by {request.user.username}')
         messages.success(request, f'User {user.username} has been promoted to administrator')
         return redirect('user_list')
     
@@ -374,8 +688,11 @@ def user_demote(request, user_id):
     
     if request.method == 'POST':
         user_profile = user.userprofile
-        user_profile.user_type = 'regular'
-        user_profile.save()
+        if user_profile.user_type != 'regular':
+            user_profile.user_type = 'regular'
+            user_profile.save()
+            events.record(user.id, 'demoted', actor_id=request.user.id,
+                          summary=f'Demoted to regular user by {request.user.username}')
         messages.success(request, f'User {user.username} has been demoted to regular user')
         return redirect('user_list')
     